@@ -0,0 +1,556 @@
+# Copyright 2019 by Xabier Zubizarreta.
+# All rights reserved.
+# This file is released under the "MIT License Agreement".
+# More information on this license can be read under https://opensource.org/licenses/MIT
+
+"""Micro-benchmarks for the hot paths of telefonoa.py.
+
+Run them on the target hardware (e.g. a Pi Zero), for example:
+
+    python3 benchmarks.py mixer
+"""
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import queue
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import dbus
+import dbus.service
+
+import telefonoa
+
+
+def _per_call(func, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations
+
+
+def _mixer_backend():
+    if telefonoa.np is not None:
+        return 'numpy'
+    if telefonoa.audioop is not None:
+        return 'audioop'
+    return 'python'
+
+
+def bench_mixer(args):
+    """Cost of mixing one output period with 1..MAX_SOURCES active sources."""
+    bank = telefonoa.ToneBank()
+    print("Mixer backend: %s, period %d ms" % (_mixer_backend(), args.period_ms))
+    for rate in (8000, 24000, 48000):
+        nbytes = rate * args.period_ms // 1000 * 2
+        sources = [
+            telefonoa.PcmSource(bank.get((450,), (), rate), 1, rate, loop=True),
+            telefonoa.PcmSource(bank.get((1000,), (100, 100), rate), 1, rate, loop=True, gain=0.5),
+            telefonoa.PcmSource(bank.noise(rate), 1, rate, loop=True, gain=0.01),
+            telefonoa.PcmSource(bank.get((350, 440), (), rate), 1, rate, loop=True, gain=0.8),
+        ][:telefonoa.AudioPlayer.MAX_SOURCES]
+        for count in range(1, len(sources) + 1):
+            active = sources[:count]
+            chunks = [source.read(nbytes) for source in active]
+            gains = [source.gain for source in active]
+            seconds = _per_call(lambda: telefonoa.mix_int16(chunks, gains, nbytes), args.iterations)
+            print("  rate=%5d sources=%d: %8.1f us/period (%5.2f%% of the period)" % (
+                rate,
+                count,
+                seconds * 1e6,
+                seconds * 100000.0 / args.period_ms,
+            ))
+
+
+def bench_dsp(args):
+    """Per-stage cost of the call DSP pipelines on one period of speech-like noise."""
+    if telefonoa.np is None:
+        print("  NumPy is not installed, DSP is unavailable")
+        return
+    config = dict(telefonoa.DEFAULT_CONFIG['dsp'], enabled=True)
+    period_frames = 8000 * args.period_ms // 1000
+    uplink, downlink, echo_canceller = telefonoa.build_call_dsp(
+        config,
+        uplink_period=period_frames,
+        downlink_period=period_frames,
+    )
+    generator = telefonoa.np.random.default_rng(0)
+    data = (generator.standard_normal(period_frames) * 3000).astype('<i2').tobytes()
+    for pipeline in (uplink, downlink):
+        for _ in range(args.iterations):
+            if pipeline is uplink:
+                echo_canceller.feed_reference(data)
+            pipeline.process(data)
+        print("  %s" % pipeline.summary())
+
+
+def _play_cpu(device, rate, seconds, period_ms, convert=None):
+    """CPU seconds per second of audio for writing a tone to ``device``."""
+    sco_period = 8000 * period_ms // 1000
+    data = telefonoa.ToneBank().get((450,), (), 8000)[:sco_period * 2]
+    pcm = telefonoa.alsaaudio.PCM(
+        type=telefonoa.alsaaudio.PCM_PLAYBACK,
+        device=device,
+        channels=1,
+        rate=rate,
+        format=telefonoa.alsaaudio.PCM_FORMAT_S16_LE,
+        periodsize=rate * period_ms // 1000,
+    )
+    periods = seconds * 1000 // period_ms
+    started = time.thread_time()
+    for _ in range(periods):
+        pcm.write(convert(data) if convert is not None else data)
+    cpu = time.thread_time() - started
+    pcm.close()
+    return cpu / seconds
+
+
+def bench_resampler(args):
+    """Cost and delay of the polyphase resampler; with --device, against the plug layer."""
+    if telefonoa.np is None:
+        print("  NumPy is not installed, the resampler is unavailable")
+        return
+    for sco_rate in (8000, 16000):
+        for device_rate in (44100, 48000):
+            for in_rate, out_rate in ((sco_rate, device_rate), (device_rate, sco_rate)):
+                resampler = telefonoa.PolyphaseResampler(in_rate, out_rate)
+                data = bytes(in_rate * args.period_ms // 1000 * 2)
+                seconds = _per_call(lambda: resampler.process(data), args.iterations)
+                print("  %5d -> %5d Hz: %7.1f us/period (%5.2f%% of the period), %d taps/phase, delay %.2f ms" % (
+                    in_rate,
+                    out_rate,
+                    seconds * 1e6,
+                    seconds * 100000.0 / args.period_ms,
+                    resampler.taps,
+                    resampler.delay_seconds * 1000,
+                ))
+    if not args.device:
+        print("  (pass --device hw:Device,0 to compare playback against the ALSA plug layer)")
+        return
+    native = args.device_rate
+    plug_device = args.device.replace('hw:', 'plughw:', 1) if args.device.startswith('hw:') else args.device
+    resampler = telefonoa.PolyphaseResampler(8000, native)
+    print("  8 kHz playback CPU, %d s each:" % args.seconds)
+    print("    plug layer (%s @ 8000): %.2f%% cpu" % (plug_device, 100.0 * _play_cpu(plug_device, 8000, args.seconds, args.period_ms)))
+    print("    resampler  (%s @ %d): %.2f%% cpu, +%.2f ms" % (
+        args.device,
+        native,
+        100.0 * _play_cpu(args.device, native, args.seconds, args.period_ms, resampler.process),
+        resampler.delay_seconds * 1000,
+    ))
+
+
+def bench_wideband(args):
+    """Python-side cost of one call period, narrowband (CVSD) against wideband (mSBC)."""
+    if telefonoa.np is None:
+        print("  NumPy is not installed, DSP and resampling are unavailable")
+        return
+    config = dict(telefonoa.DEFAULT_CONFIG['dsp'], enabled=True)
+    generator = telefonoa.np.random.default_rng(0)
+    for codec, rate in (('CVSD', 8000), ('mSBC', 16000)):
+        period_frames = rate * args.period_ms // 1000
+        uplink, downlink, echo_canceller = telefonoa.build_call_dsp(
+            config,
+            uplink_rate=rate,
+            uplink_period=period_frames,
+            downlink_rate=rate,
+            downlink_period=period_frames,
+        )
+        jitter = telefonoa.JitterBuffer(2, period_frames)
+        to_device = telefonoa.PolyphaseResampler(rate, args.device_rate)
+        from_device = telefonoa.PolyphaseResampler(args.device_rate, rate)
+        sco = (generator.standard_normal(period_frames) * 3000).astype('<i2').tobytes()
+        mic = (generator.standard_normal(args.device_rate * args.period_ms // 1000) * 3000).astype('<i2').tobytes()
+
+        def period():
+            jitter.push(sco)
+            speaker = downlink.process(jitter.pop() or sco)
+            echo_canceller.feed_reference(speaker)
+            to_device.process(speaker)
+            uplink.process(from_device.process(mic))
+
+        seconds = _per_call(period, args.iterations)
+        print("  %s %5d Hz: %7.1f us/period (%5.2f%% of the period), device %d Hz" % (
+            codec,
+            rate,
+            seconds * 1e6,
+            seconds * 100000.0 / args.period_ms,
+            args.device_rate,
+        ))
+        for pipeline in (uplink, downlink):
+            print("    %s" % pipeline.summary())
+
+
+def bench_latency(args):
+    """Bridge latency per direction through an ALSA loopback card (modprobe snd-aloop)."""
+    config, _ = telefonoa.load_telephone_config(Path(__file__).resolve().parent / 'phonebook.yaml')
+    budget_ms = args.latency_budget_ms
+    if budget_ms is None:
+        budget_ms = float(config['call'].get('latency_budget_ms', 0))
+    budget = telefonoa.latency_budget_options(budget_ms)
+    device_rate = int(config['audio'].get('device_rate', 0))
+    meter = telefonoa.LoopbackLatencyMeter(args.loopback)
+    print("  latency budget %s, card %s" % ("%.0f ms" % budget_ms if budget else "off (ALSA defaults)", args.loopback))
+    bridges = (
+        ('uplink', telefonoa.UplinkBridge(device_rate=device_rate, **budget), 0, 1),
+        ('downlink', telefonoa.DownlinkBridge(device_rate=device_rate, **budget), 2, 3),
+    )
+    for name, bridge, input_substream, output_substream in bridges:
+        try:
+            results = meter.measure(bridge, input_substream, output_substream, markers=args.markers)
+        except telefonoa.alsaaudio.ALSAAudioError as exc:
+            print("  Cannot open the loopback card (%s); load it with: sudo modprobe snd-aloop" % exc)
+            return
+        print("  %-8s %s" % (name, meter.summary(results)))
+
+
+def bench_downlink(args):
+    """Downlink latency, wakeups and CPU with the 10 ms sleep loop and with poll()."""
+    config, _ = telefonoa.load_telephone_config(Path(__file__).resolve().parent / 'phonebook.yaml')
+    budget_ms = args.latency_budget_ms
+    if budget_ms is None:
+        budget_ms = float(config['call'].get('latency_budget_ms', 0))
+    budget = telefonoa.latency_budget_options(budget_ms)
+    device_rate = int(config['audio'].get('device_rate', 0))
+    meter = telefonoa.LoopbackLatencyMeter(args.loopback)
+    for mode in ('sleep', 'poll'):
+        bridge = telefonoa.DownlinkBridge(device_rate=device_rate, **budget)
+        bridge.polled = mode == 'poll'
+        try:
+            # The bridge reports on stdout; its stats are kept in last_stats.
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = meter.measure(bridge, 2, 3, markers=args.markers)
+        except telefonoa.alsaaudio.ALSAAudioError as exc:
+            print("  Cannot open the loopback card (%s); load it with: sudo modprobe snd-aloop" % exc)
+            return
+        print("  %-5s %s" % (mode, meter.summary(results)))
+        print("        %s" % bridge.last_stats)
+
+
+STAND_IN_MODEM = '/hfp/org/bluez/hci0/dev_00_11_22_33_44_55'
+STAND_IN_INTERFACE = 'org.telefonoa.StandIn'
+# What a rejected Dial costs on a real phone, roughly.
+STAND_IN_DIAL_SECONDS = 0.05
+
+
+class StandInInvalidFormat(dbus.exceptions.DBusException):
+    _dbus_error_name = 'org.ofono.Error.InvalidFormat'
+
+
+class StandInCall(dbus.service.Object):
+    def __init__(self, bus, path):
+        dbus.service.Object.__init__(self, bus, path)
+        self.path = path
+        self.state = 'incoming'
+
+    @dbus.service.signal('org.ofono.VoiceCall', signature='sv')
+    def PropertyChanged(self, name, value):
+        pass
+
+
+class StandInModem(dbus.service.Object):
+    """Just enough of an oFono manager and modem for PhoneManager.
+
+    The benchmark drives one call through STAND_IN_INTERFACE; each control
+    method returns the time.monotonic() at which it emitted its signal.
+    """
+
+    def __init__(self, bus):
+        dbus.service.Object.__init__(self, bus, STAND_IN_MODEM)
+        self.bus = bus
+        self.call = None
+
+    @dbus.service.method('org.ofono.VoiceCallManager', out_signature='a(oa{sv})')
+    def GetCalls(self):
+        if self.call is None:
+            return []
+        return [(self.call.path, {'State': self.call.state})]
+
+    @dbus.service.signal('org.ofono.VoiceCallManager', signature='oa{sv}')
+    def CallAdded(self, path, properties):
+        pass
+
+    @dbus.service.signal('org.ofono.VoiceCallManager', signature='o')
+    def CallRemoved(self, path):
+        pass
+
+    @dbus.service.method('org.ofono.VoiceCallManager', in_signature='ss', out_signature='o')
+    def Dial(self, number, hide_id):
+        # Like some phones: no leading plus and no explicit 'default' caller ID.
+        time.sleep(STAND_IN_DIAL_SECONDS)
+        if number.startswith('+') or hide_id == 'default':
+            raise StandInInvalidFormat("Invalid format")
+        return STAND_IN_MODEM + '/voicecall01'
+
+    @dbus.service.method('org.ofono.VoiceCallManager')
+    def HangupAll(self):
+        pass
+
+    @dbus.service.method(STAND_IN_INTERFACE, out_signature='d')
+    def Ring(self):
+        self.call = StandInCall(self.bus, STAND_IN_MODEM + '/voicecall01')
+        sent = time.monotonic()
+        self.CallAdded(self.call.path, {'State': 'incoming'})
+        return sent
+
+    @dbus.service.method(STAND_IN_INTERFACE, out_signature='d')
+    def Answer(self):
+        self.call.state = 'active'
+        sent = time.monotonic()
+        self.call.PropertyChanged('State', 'active')
+        return sent
+
+    @dbus.service.method(STAND_IN_INTERFACE, out_signature='d')
+    def HangUp(self):
+        call, self.call = self.call, None
+        call.remove_from_connection()
+        sent = time.monotonic()
+        self.CallRemoved(call.path)
+        return sent
+
+
+class StandInProbedModem(dbus.service.Object):
+    """A modem that only answers GetCalls; a stale one takes ``stale_seconds``."""
+
+    def __init__(self, bus, path, stale_seconds=None):
+        dbus.service.Object.__init__(self, bus, path)
+        self.stale_seconds = stale_seconds
+
+    @dbus.service.method('org.ofono.VoiceCallManager', out_signature='a(oa{sv})', async_callbacks=('reply', 'error'))
+    def GetCalls(self, reply, error):
+        if self.stale_seconds is None:
+            reply([])
+            return
+        def answer():
+            reply([])
+            return False
+
+        # Answered from the loop later, so the other modems are not held up.
+        telefonoa.GLib.timeout_add(int(self.stale_seconds * 1000), answer)
+
+
+def probed_modem_paths(count):
+    """Paths of the extra stand-in modems; every second one is stale."""
+    return ['/hfp/org/bluez/hci0/dev_00_00_00_00_00_%02X%s' % (index, '_stale' if index % 2 else '') for index in range(count)]
+
+
+class StandInManager(dbus.service.Object):
+    def __init__(self, bus, path, modems=()):
+        dbus.service.Object.__init__(self, bus, path)
+        self.modems = [STAND_IN_MODEM] + list(modems)
+
+    @dbus.service.method('org.ofono.Manager', out_signature='a(oa{sv})')
+    def GetModems(self):
+        return [(path, {'Powered': True}) for path in self.modems]
+
+
+def run_stand_in_ofono(address, probed_modems=0, stale_seconds=0.0):
+    telefonoa.DBusGMainLoop(set_as_default=True)
+    bus = dbus.bus.BusConnection(address)
+    paths = probed_modem_paths(probed_modems)
+    # Exported for as long as the loop runs.
+    exported = [dbus.service.BusName('org.ofono', bus), StandInManager(bus, '/', paths), StandInModem(bus)]
+    exported.extend(StandInProbedModem(bus, path, stale_seconds if path.endswith('stale') else None) for path in paths)
+    telefonoa.GLib.MainLoop().run()
+
+
+@contextlib.contextmanager
+def stand_in_ofono(probed_modems=0, stale_seconds=0.0):
+    """Private bus with a stand-in oFono service; yields the bus address.
+
+    ``probed_modems`` extra modems (see probed_modem_paths) only answer
+    GetCalls, the stale ones after ``stale_seconds``.
+    """
+    daemon = subprocess.Popen(
+        ['dbus-daemon', '--session', '--nofork', '--print-address=1'],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    service = None
+    try:
+        address = daemon.stdout.readline().strip()
+        service = multiprocessing.get_context('spawn').Process(
+            target=run_stand_in_ofono,
+            args=(address, probed_modems, stale_seconds),
+            daemon=True,
+        )
+        service.start()
+        bus = dbus.bus.BusConnection(address)
+        deadline = time.monotonic() + 5
+        while not bus.name_has_owner('org.ofono'):
+            if time.monotonic() > deadline:
+                raise RuntimeError("stand-in oFono service did not start")
+            time.sleep(0.05)
+        yield address
+    finally:
+        if service is not None:
+            service.terminate()
+            service.join()
+        daemon.terminate()
+        daemon.wait()
+
+
+def bench_ofono(args):
+    """Call event to callback latency of PhoneManager, signals against polling."""
+    if telefonoa.GLib is None:
+        print("  python3-gi is not installed, only polling is available")
+        return
+    try:
+        with stand_in_ofono() as address:
+            _compare_call_monitoring(args, address)
+    except OSError as exc:
+        print("  Cannot start a private D-Bus daemon (%s)" % exc)
+
+
+def _compare_call_monitoring(args, address):
+    """Print the latency of each call event, with signals and with polling."""
+    bus = dbus.bus.BusConnection(address)
+    control = dbus.Interface(bus.get_object('org.ofono', STAND_IN_MODEM), STAND_IN_INTERFACE)
+    signal_loop = telefonoa.DBusSignalLoop(address)
+    for mode, loop in (('signals', signal_loop), ('polling', None)):
+        events = queue.Queue()
+        latencies = {'incoming': [], 'answered': [], 'ended': []}
+        # PhoneManager reports every call on stdout.
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager = telefonoa.PhoneManager(None, '.', bus=bus, signal_loop=loop)
+            manager.on_incoming_call_changed = lambda incoming: events.put(time.monotonic())
+            manager.on_call_ended = lambda: events.put(time.monotonic())
+            for _ in range(args.calls):
+                for name, trigger in (('incoming', control.Ring), ('answered', control.Answer), ('ended', control.HangUp)):
+                    sent = float(trigger())
+                    try:
+                        latencies[name].append(events.get(timeout=5) - sent)
+                    except queue.Empty:
+                        pass
+            manager.close()
+        for name, values in latencies.items():
+            print("  %-7s %-8s %6.1f ms avg, %6.1f ms max, %d of %d events" % (
+                mode,
+                name,
+                1000.0 * sum(values) / max(1, len(values)),
+                1000.0 * max(values, default=0),
+                len(values),
+                args.calls,
+            ))
+    signal_loop.stop()
+
+
+def bench_dial(args):
+    """Time to an accepted Dial, before and after the dial form is learned."""
+    if telefonoa.GLib is None:
+        print("  python3-gi is not installed")
+        return
+    try:
+        with stand_in_ofono() as address, tempfile.TemporaryDirectory() as directory:
+            _compare_dial_forms(args, address, Path(directory) / 'dial_formats.yaml')
+    except OSError as exc:
+        print("  Cannot start a private D-Bus daemon (%s)" % exc)
+
+
+def _compare_dial_forms(args, address, path):
+    """Dial args.calls times, then again with a new PhoneManager reading the learned forms."""
+    bus = dbus.bus.BusConnection(address)
+    signal_loop = telefonoa.DBusSignalLoop(address)
+    print("  the stand-in accepts the 4th of 6 dial forms, each Dial takes %.0f ms" % (STAND_IN_DIAL_SECONDS * 1000))
+    for label in ('first start', 'restart'):
+        events = queue.Queue()
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager = telefonoa.PhoneManager(None, '.', bus=bus, signal_loop=signal_loop, dial_format_path=path)
+            manager.on_call_started = lambda: events.put('started')
+            manager.on_call_ended = lambda: events.put('ended')
+            for _ in range(args.calls):
+                manager.call('+34600111222')
+                events.get(timeout=10)
+                manager.end_call()
+                events.get(timeout=10)
+            manager.close()
+        latencies = list(manager.dial_latencies)
+        rest = latencies[1:] or [0.0]
+        print("  %-11s first dial %5.0f ms, then %5.0f ms avg over %d dials" % (
+            label,
+            latencies[0] * 1000,
+            1000.0 * sum(rest) / len(rest),
+            len(rest),
+        ))
+    signal_loop.stop()
+
+
+def bench_modems(args):
+    """Time to bind one of N stand-in modems, half of them stale, probed serially and concurrently."""
+    if telefonoa.GLib is None:
+        print("  python3-gi is not installed")
+        return
+    try:
+        with stand_in_ofono(probed_modems=8, stale_seconds=args.stale_seconds) as address:
+            _compare_modem_binding(args, address)
+    except OSError as exc:
+        print("  Cannot start a private D-Bus daemon (%s)" % exc)
+
+
+def _compare_modem_binding(args, address):
+    bus = dbus.bus.BusConnection(address)
+    signal_loop = telefonoa.DBusSignalLoop(address)
+    print("  stale modems answer GetCalls after %.1f s, deadline %.1f s" % (
+        args.stale_seconds, telefonoa.PhoneManager.PROBE_DEADLINE_SECONDS))
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = telefonoa.PhoneManager(None, '.', bus=bus, signal_loop=signal_loop)
+    for count in (1, 2, 4, 8):
+        paths = probed_modem_paths(count)
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.monotonic()
+            # What binding did before the probes ran concurrently.
+            for path in paths:
+                manager._modem_supports_voice_calls(path)
+            serial = time.monotonic() - started
+            manager._bind_best_modem([(path, {}) for path in paths])
+        print("  %d modems: serial %6.0f ms, _bind_best_modem %6.0f ms (selected %s)" % (
+            count,
+            serial * 1000,
+            manager.last_bind_seconds * 1000,
+            manager.modem_path.rsplit('/', 1)[-1],
+        ))
+    manager.close()
+    signal_loop.stop()
+
+
+BENCHMARKS = {
+    'dial': bench_dial,
+    'downlink': bench_downlink,
+    'dsp': bench_dsp,
+    'latency': bench_latency,
+    'mixer': bench_mixer,
+    'modems': bench_modems,
+    'ofono': bench_ofono,
+    'resampler': bench_resampler,
+    'wideband': bench_wideband,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('benchmark', nargs='*', help="one of %s (default: all)" % ', '.join(sorted(BENCHMARKS)))
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--period-ms', type=int, default=10)
+    parser.add_argument('--device', help="sound card for playback comparisons, e.g. hw:Device,0")
+    parser.add_argument('--device-rate', type=int, default=48000)
+    parser.add_argument('--seconds', type=int, default=5)
+    parser.add_argument('--loopback', default='Loopback', help="ALSA loopback card for the latency benchmark")
+    parser.add_argument('--markers', type=int, default=10)
+    parser.add_argument('--latency-budget-ms', type=float, help="overrides call.latency_budget_ms")
+    parser.add_argument('--calls', type=int, default=20, help="calls for the ofono and dial benchmarks")
+    parser.add_argument('--stale-seconds', type=float, default=2.5, help="GetCalls time of a stale modem (oFono's is 8 s)")
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmark if name not in BENCHMARKS]
+    if unknown:
+        parser.error("unknown benchmark: %s" % ', '.join(unknown))
+    for name in args.benchmark or sorted(BENCHMARKS):
+        print("== %s ==" % name)
+        BENCHMARKS[name](args)
+
+
+if __name__ == '__main__':
+    main()
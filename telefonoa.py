@@ -3,22 +3,65 @@
 # This file is released under the "MIT License Agreement".
 # More information on this license can be read under https://opensource.org/licenses/MIT
 
-import RPi.GPIO as GPIO
 import dbus
 import alsaaudio
 import yaml
 import logging
 import math
+import os
 import re
+import select
+import signal
 import struct
+import sys
 
+from datetime import timedelta
 from pathlib import Path
 import time
 import wave
+import itertools
+import concurrent.futures
+import multiprocessing
 import queue
-from threading import Event, Lock, Thread
+import random
+from array import array
+from collections import OrderedDict, deque, namedtuple
+from fractions import Fraction
+from multiprocessing import shared_memory
+from threading import Condition, Event, Lock, Thread
 import subprocess
 
+try:
+    import RPi.GPIO as GPIO
+except (ImportError, RuntimeError):
+    # RPi.GPIO refuses to import outside a Raspberry Pi; the gpiod backend
+    # works on any Linux GPIO character device (including gpio-sim).
+    GPIO = None
+
+try:
+    import gpiod
+except ImportError:
+    gpiod = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import audioop
+except ImportError:
+    audioop = None
+
+try:
+    # D-Bus signals (SCO readiness) need a GLib main loop from python3-gi.
+    from gi.repository import GLib
+    import dbus.mainloop.glib
+    from dbus.mainloop.glib import DBusGMainLoop
+except ImportError:
+    GLib = None
+    DBusGMainLoop = None
+
 
 DEFAULT_CONFIG = {
     'pins': {
@@ -26,16 +69,59 @@ DEFAULT_CONFIG = {
         'rotary': 19,
         'ringer': 18,
     },
+    'gpio': {
+        'backend': 'auto',
+        'chip': '/dev/gpiochip0',
+    },
     'rotary': {
         'pulse_threshold_seconds': 0.2,
         'debounce_seconds': 0.09,
+        'adaptive': True,
+        'calibration_file': 'rotary_calibration.yaml',
     },
     'call': {
         'disable_wifi_during_call': True,
+        # Follow the SCO codec BlueALSA negotiated (16 kHz for mSBC).
+        'wideband': True,
+        # Buffering per direction across the bridge PCMs; 0 keeps ALSA's defaults.
+        'latency_budget_ms': 0,
+        'dial_plan': [],
+        # Dial form and hide_id each modem accepted, tried first next time.
+        'dial_format_file': 'dial_formats.yaml',
     },
     'actions': {
         'ringer_test_number': 5,
         'shutdown_number': 9,
+        'shortcut_confirm_seconds': 4.0,
+    },
+    'audio': {
+        'prompt_cache_bytes': 4 * 1024 * 1024,
+        'period_ms': 10,
+        'periods': 2,
+        'device': 'plughw:Device,0',
+        # Native rate of the sound card; 0 lets the ALSA plug layer convert.
+        'device_rate': 0,
+        # Run the call audio bridges in a separate process.
+        'process': False,
+        # Start the microphone capture when the handset is lifted.
+        'uplink_warm_standby': False,
+    },
+    'dsp': {
+        'enabled': False,
+        # Share of each period the stages may use before some are skipped.
+        'budget_percent': 50,
+        'uplink': ['highpass', 'echo_canceller', 'noise_gate', 'agc'],
+        'downlink': ['highpass', 'noise_gate'],
+        'highpass_hz': 200,
+        'noise_gate_dbfs': -50,
+        'agc_target_dbfs': -20,
+        'agc_max_gain_db': 24,
+        'echo_tail_ms': 64,
+    },
+    'tones': {
+        # Frequencies in Hz, cadence as alternating on/off milliseconds.
+        'dial': {'frequencies': [450], 'cadence': []},
+        'busy': {'frequencies': [450], 'cadence': [125, 375]},
     },
     'announcements': {
         'ready': 'ready.wav',
@@ -65,13 +151,7 @@ def load_telephone_config(config_path):
       phonebook: [...]
     and the legacy phonebook-only list format.
     """
-    config = {
-        'pins': dict(DEFAULT_CONFIG['pins']),
-        'rotary': dict(DEFAULT_CONFIG['rotary']),
-        'call': dict(DEFAULT_CONFIG['call']),
-        'actions': dict(DEFAULT_CONFIG['actions']),
-        'announcements': dict(DEFAULT_CONFIG['announcements']),
-    }
+    config = {section: dict(values) for section, values in DEFAULT_CONFIG.items()}
 
     try:
         with Path(config_path).open('r') as stream:
@@ -96,7 +176,7 @@ def load_telephone_config(config_path):
 
     loaded_config = loaded.get('config', {})
     if isinstance(loaded_config, dict):
-        for section in ('pins', 'rotary', 'call', 'actions', 'announcements'):
+        for section in config:
             section_data = loaded_config.get(section, {})
             if isinstance(section_data, dict):
                 config[section].update(section_data)
@@ -109,265 +189,2221 @@ def load_telephone_config(config_path):
     return config, phonebook
 
 
+class DialPlan(object):
+    """Dial plan recognising complete numbers while they are being dialed.
+
+    Patterns are strings of digits, ``X`` (any digit) and ``[...]`` digit
+    classes such as ``[6-9]``; a leading ``+`` stands for the ``00``
+    international prefix. The patterns are compiled once into a digit
+    automaton, so every dialed digit costs a single table lookup.
+    """
+
+    START = 0
+    _DIGITS = '0123456789'
+
+    def __init__(self, patterns=None):
+        self.patterns = []
+        # Prefix trie over digit classes: each node is [edges, is_final].
+        nodes = [[{}, False]]
+        for pattern in patterns or []:
+            try:
+                tokens = self._parse(pattern)
+            except ValueError as exc:
+                print("[DIALPLAN] Ignoring pattern %r: %s" % (pattern, exc))
+                continue
+            node = 0
+            for token in tokens:
+                edges = nodes[node][0]
+                if token not in edges:
+                    nodes.append([{}, False])
+                    edges[token] = len(nodes) - 1
+                node = edges[token]
+            nodes[node][1] = True
+            self.patterns.append(str(pattern))
+        self._compile(nodes)
+
+    def _parse(self, pattern):
+        text = str(pattern).strip().upper()
+        if text.startswith('+'):
+            text = '00' + text[1:]
+        if not text:
+            raise ValueError("empty pattern")
+
+        tokens = []
+        idx = 0
+        while idx < len(text):
+            ch = text[idx]
+            if ch.isdigit():
+                tokens.append(frozenset(ch))
+            elif ch == 'X':
+                tokens.append(frozenset(self._DIGITS))
+            elif ch == '[':
+                end = text.find(']', idx)
+                if end < 0:
+                    raise ValueError("unterminated digit class")
+                tokens.append(self._parse_class(text[idx + 1:end]))
+                idx = end
+            elif ch not in ' -':
+                raise ValueError("unexpected character %r" % ch)
+            idx += 1
+        return tokens
+
+    def _parse_class(self, body):
+        digits = set()
+        idx = 0
+        while idx < len(body):
+            if idx + 2 < len(body) and body[idx + 1] == '-':
+                low, high = body[idx], body[idx + 2]
+                if not (low.isdigit() and high.isdigit()) or low > high:
+                    raise ValueError("invalid range %s-%s" % (low, high))
+                digits.update(str(d) for d in range(int(low), int(high) + 1))
+                idx += 3
+                continue
+            if not body[idx].isdigit():
+                raise ValueError("invalid digit class [%s]" % body)
+            digits.add(body[idx])
+            idx += 1
+        if not digits:
+            raise ValueError("empty digit class")
+        return frozenset(digits)
+
+    def _compile(self, nodes):
+        """Turn the trie into a deterministic table (subset construction)."""
+        start = frozenset([0])
+        index = {start: self.START}
+        states = [start]
+        self._transitions = []
+        pos = 0
+        while pos < len(states):
+            row = []
+            for digit in self._DIGITS:
+                target = frozenset(
+                    child
+                    for node in states[pos]
+                    for token, child in nodes[node][0].items()
+                    if digit in token
+                )
+                if not target:
+                    row.append(None)
+                    continue
+                if target not in index:
+                    index[target] = len(states)
+                    states.append(target)
+                row.append(index[target])
+            self._transitions.append(row)
+            pos += 1
+        self._accepting = [any(nodes[node][1] for node in state) for state in states]
+        self._extendable = [any(target is not None for target in row) for row in self._transitions]
+
+    def advance(self, state, digit):
+        """Return the state after dialing ``digit``, or None once no pattern can match."""
+        if state is None:
+            return None
+        return self._transitions[state][int(digit)]
+
+    def is_complete(self, state):
+        """True when the digits so far form a number no pattern can extend."""
+        return state is not None and self._accepting[state] and not self._extendable[state]
+
+
+class RPiGPIOBackend(object):
+    """GPIO access through RPi.GPIO; edges are timestamped when the callback runs."""
+
+    name = 'rpi'
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self):
+        if GPIO is None:
+            raise RuntimeError("RPi.GPIO is not available")
+        GPIO.setmode(GPIO.BCM)
+        self._edges = {
+            'falling': GPIO.FALLING,
+            'rising': GPIO.RISING,
+            'both': GPIO.BOTH,
+        }
+
+    def setup_input(self, pin):
+        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+
+    def setup_output(self, pin, initial):
+        GPIO.setup(pin, GPIO.OUT, initial=GPIO.HIGH if initial else GPIO.LOW)
+
+    def input(self, pin):
+        return GPIO.HIGH if GPIO.input(pin) else GPIO.LOW
+
+    def output(self, pin, value):
+        GPIO.output(pin, GPIO.HIGH if value else GPIO.LOW)
+
+    def add_edge_callback(self, pin, edge, callback, bouncetime_ms):
+        """Call ``callback(pin, timestamp)`` on every edge; raises RuntimeError if unsupported."""
+        GPIO.add_event_detect(
+            pin,
+            self._edges[edge],
+            callback=lambda channel: callback(channel, time.monotonic()),
+            bouncetime=max(1, int(bouncetime_ms)),
+        )
+
+    def remove_edge_callback(self, pin):
+        try:
+            GPIO.remove_event_detect(pin)
+        except RuntimeError:
+            pass
+
+    def cleanup(self, pins):
+        GPIO.cleanup(tuple(pins))
+
+
+class GpiodBackend(object):
+    """GPIO access through the Linux GPIO character device (libgpiod >= 2.0).
+
+    Edge detection and debouncing are done by the kernel. A single reader
+    thread blocks on the line request descriptors, reads all pending edge
+    events in bulk and hands each one to its callback together with the
+    kernel CLOCK_MONOTONIC timestamp, so pulse timing does not depend on
+    when the Python thread gets scheduled.
+
+    Any chip works, so the service can be exercised on a plain Linux box
+    with the gpio-sim kernel module (see README).
+    """
+
+    name = 'gpiod'
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self, chip='/dev/gpiochip0', consumer='telefonoa'):
+        if gpiod is None:
+            raise RuntimeError("gpiod (libgpiod >= 2.0 Python bindings) is not available")
+        self.chip = str(chip)
+        self.consumer = consumer
+        self._lock = Lock()
+        self._requests = {}
+        self._callbacks = {}
+        self._thread = None
+        self._stop_event = Event()
+        self._wake_r, self._wake_w = os.pipe()
+        self._edges = {
+            'falling': gpiod.line.Edge.FALLING,
+            'rising': gpiod.line.Edge.RISING,
+            'both': gpiod.line.Edge.BOTH,
+        }
+
+    def _input_settings(self, edge=None, bouncetime_ms=0):
+        settings = gpiod.LineSettings(
+            direction=gpiod.line.Direction.INPUT,
+            bias=gpiod.line.Bias.PULL_UP,
+        )
+        if edge is not None:
+            settings.edge_detection = self._edges[edge]
+            settings.event_clock = gpiod.line.Clock.MONOTONIC
+            settings.debounce_period = timedelta(milliseconds=bouncetime_ms)
+        return settings
+
+    def _request(self, pin, settings):
+        with self._lock:
+            request = self._requests.get(pin)
+            if request is not None:
+                request.reconfigure_lines(config={pin: settings})
+                return request
+        try:
+            request = gpiod.request_lines(self.chip, consumer=self.consumer, config={pin: settings})
+        except OSError as exc:
+            raise RuntimeError("Cannot request line %d on %s: %s" % (pin, self.chip, exc))
+        with self._lock:
+            self._requests[pin] = request
+        return request
+
+    def setup_input(self, pin):
+        self._request(pin, self._input_settings())
+
+    def setup_output(self, pin, initial):
+        self._request(pin, gpiod.LineSettings(
+            direction=gpiod.line.Direction.OUTPUT,
+            output_value=gpiod.line.Value.ACTIVE if initial else gpiod.line.Value.INACTIVE,
+        ))
+
+    def input(self, pin):
+        value = self._requests[pin].get_value(pin)
+        return self.HIGH if value == gpiod.line.Value.ACTIVE else self.LOW
+
+    def output(self, pin, value):
+        self._requests[pin].set_value(pin, gpiod.line.Value.ACTIVE if value else gpiod.line.Value.INACTIVE)
+
+    def add_edge_callback(self, pin, edge, callback, bouncetime_ms):
+        """Call ``callback(pin, timestamp)`` on every edge; raises RuntimeError if unsupported."""
+        try:
+            self._request(pin, self._input_settings(edge, bouncetime_ms))
+        except OSError as exc:
+            raise RuntimeError("Edge detection unavailable on line %d: %s" % (pin, exc))
+        with self._lock:
+            self._callbacks[pin] = callback
+            if self._wake_r is None:
+                self._wake_r, self._wake_w = os.pipe()
+            if self._thread is None or not self._thread.is_alive():
+                self._stop_event.clear()
+                self._thread = Thread(target=self._read_events, daemon=True)
+                self._thread.start()
+        self._wake()
+
+    def remove_edge_callback(self, pin):
+        with self._lock:
+            if self._callbacks.pop(pin, None) is None:
+                return
+            request = self._requests.get(pin)
+        if request is not None:
+            try:
+                request.reconfigure_lines(config={pin: self._input_settings()})
+            except OSError:
+                pass
+        self._wake()
+
+    def cleanup(self, pins):
+        for pin in pins:
+            self.remove_edge_callback(pin)
+            with self._lock:
+                request = self._requests.pop(pin, None)
+            if request is not None:
+                request.release()
+        with self._lock:
+            thread = self._thread if not self._callbacks else None
+        if thread is not None:
+            self._stop_event.set()
+            self._wake()
+            thread.join(timeout=1)
+            if thread.is_alive():
+                return
+        with self._lock:
+            if self._requests or self._callbacks or self._wake_r is None:
+                return
+            wake_fds = (self._wake_r, self._wake_w)
+            self._wake_r = self._wake_w = None
+        for fd in wake_fds:
+            os.close(fd)
+
+    def _wake(self):
+        with self._lock:
+            wake_w = self._wake_w
+        if wake_w is None:
+            return
+        try:
+            os.write(wake_w, b'\0')
+        except OSError:
+            pass
+
+    def _read_events(self):
+        while not self._stop_event.is_set():
+            with self._lock:
+                watched = {
+                    self._requests[pin].fd: self._requests[pin]
+                    for pin in self._callbacks
+                    if pin in self._requests
+                }
+                callbacks = dict(self._callbacks)
+            poller = select.poll()
+            poller.register(self._wake_r, select.POLLIN)
+            for fd in watched:
+                poller.register(fd, select.POLLIN)
+
+            for fd, _ in poller.poll():
+                if fd == self._wake_r:
+                    os.read(self._wake_r, 512)
+                    continue
+                for event in watched[fd].read_edge_events():
+                    callback = callbacks.get(event.line_offset)
+                    if callback is None:
+                        continue
+                    try:
+                        callback(event.line_offset, event.timestamp_ns / 1e9)
+                    except Exception as exc:
+                        print("[GPIO] Edge callback for line %d failed: %s" % (event.line_offset, exc))
+
+
+def create_gpio_backend(gpio_config=None):
+    """Build the GPIO backend selected by the ``gpio`` config section."""
+    gpio_config = gpio_config if isinstance(gpio_config, dict) else {}
+    backend = str(gpio_config.get('backend', DEFAULT_CONFIG['gpio']['backend'])).lower()
+    chip = gpio_config.get('chip', DEFAULT_CONFIG['gpio']['chip'])
+    if backend == 'rpi':
+        return RPiGPIOBackend()
+    if backend == 'gpiod':
+        return GpiodBackend(chip)
+    if backend != 'auto':
+        print("[GPIO] Unknown gpio.backend %r (expected auto, rpi or gpiod), choosing automatically" % backend)
+    if GPIO is not None:
+        return RPiGPIOBackend()
+    return GpiodBackend(chip)
+
+
 class RotaryDial(Thread):
     """
     Thread class reading the dialed values and putting them into a thread queue
+
+    In adaptive mode the accepted pulse edges are kept in a small ring buffer and
+    the dial's pulse period is learned from every digit. The inter-digit gap and
+    the software debounce are then derived from that period instead of the fixed
+    configuration values, and the estimate is persisted to ``calibration_path``.
     """
 
-    def __init__(self, ns_pin, number_queue, pulse_threshold=0.2, debounce_seconds=0.09):
+    # Rotary dials are nominally 10 pps; accept anything between 6 and 14 pps.
+    _MIN_PULSE_PERIOD = 1.0 / 14
+    _MAX_PULSE_PERIOD = 1.0 / 6
+    # A digit ends after this many pulse periods without a new pulse.
+    _GAP_PERIODS = 2.0
+    # Pulses closer than this fraction of the period are contact bounce.
+    _DEBOUNCE_PERIODS = 0.5
+    _LEARNING_RATE = 0.25
+    _PULSE_HISTORY = 32
+    # Evenly spaced single-pulse digits this close together are one digit
+    # split by a gap learned from a faster dial.
+    _SPLIT_PULSES = 3
+    # Only rewrite the calibration file when the period moved by more than this.
+    _SAVE_TOLERANCE = 0.02
+
+    def __init__(self, ns_pin, number_queue, pulse_threshold=0.2, debounce_seconds=0.09, adaptive=True, calibration_path=None, gpio=None):
         super().__init__(daemon=True)
         self.pin = ns_pin
         self.number_q = number_queue
-        GPIO.setup(self.pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        self.gpio = gpio if gpio is not None else RPiGPIOBackend()
+        self.gpio.setup_input(self.pin)
         self.value = 0
         self.pulse_threshold = pulse_threshold
         self.poll_interval = 0.002
         self.debounce_seconds = debounce_seconds
+        self.adaptive = adaptive
+        self.calibration_path = Path(calibration_path) if calibration_path else None
+        self.pulse_period = min(max(pulse_threshold / self._GAP_PERIODS, self._MIN_PULSE_PERIOD), self._MAX_PULSE_PERIOD)
+        self.pulse_jitter = 0.0
+        self._saved_pulse_period = None
+        self._pulse_times = deque(maxlen=self._PULSE_HISTORY)
+        self._split_pulses = deque(maxlen=self._SPLIT_PULSES)
         self._stop_event = Event()
         self._value_lock = Lock()
+        # Signalled on every pulse (and on stop) so run() can sleep until the
+        # digit deadline instead of spinning on the lock.
+        self._value_cond = Condition(self._value_lock)
         self._last_pulse_at = 0.0
         self._uses_event_detect = False
-        self._last_state = GPIO.input(self.pin)
+        self._last_state = self.gpio.input(self.pin)
         self._last_fall_at = 0.0
 
-        try:
-            GPIO.remove_event_detect(self.pin)
-        except RuntimeError:
-            pass
+        if self.adaptive:
+            self._load_calibration()
+            self._apply_pulse_period()
+
+        self.gpio.remove_edge_callback(self.pin)
+
+        if self.adaptive:
+            # Only filter the shortest bounces in the driver; the learned
+            # debounce is applied in _increment so fast dials keep all pulses.
+            bouncetime_ms = int(self._MIN_PULSE_PERIOD * self._DEBOUNCE_PERIODS * 1000)
+        else:
+            bouncetime_ms = int(self.debounce_seconds * 1000)
 
         try:
-            GPIO.add_event_detect(self.pin, GPIO.FALLING, callback=self._increment, bouncetime=90)
+            self.gpio.add_edge_callback(self.pin, 'falling', self._increment, bouncetime_ms)
             self._uses_event_detect = True
         except RuntimeError as exc:
             # Some kernels/drivers do not allow edge detection on this pin;
             # keep working by sampling the pin directly in the thread loop.
             print("Rotary GPIO event detect unavailable on pin %d, using polling (%s)" % (self.pin, exc))
 
-    def _increment(self, pin_num):
+    def _load_calibration(self):
+        if self.calibration_path is None:
+            return
+        try:
+            with self.calibration_path.open('r') as stream:
+                loaded = yaml.safe_load(stream)
+        except FileNotFoundError:
+            return
+        except (OSError, yaml.YAMLError) as exc:
+            print("[ROTARY] Cannot read calibration %s: %s" % (self.calibration_path, exc))
+            return
+        if not isinstance(loaded, dict):
+            return
+        try:
+            period = float(loaded.get('pulse_period_seconds', 0.0))
+            jitter = float(loaded.get('pulse_jitter_seconds', 0.0))
+        except (TypeError, ValueError):
+            return
+        if not self._MIN_PULSE_PERIOD <= period <= self._MAX_PULSE_PERIOD:
+            return
+        self.pulse_period = period
+        self.pulse_jitter = max(0.0, jitter)
+        self._saved_pulse_period = period
+        print("[ROTARY] Loaded calibration: %.1f pps (jitter %.1f ms)" % (1.0 / period, jitter * 1000))
+
+    def _save_calibration(self):
+        if self.calibration_path is None:
+            return
+        with self._value_lock:
+            period = self.pulse_period
+            jitter = self.pulse_jitter
+        saved = self._saved_pulse_period
+        if saved is not None and abs(period - saved) <= saved * self._SAVE_TOLERANCE:
+            return
+        try:
+            with self.calibration_path.open('w') as stream:
+                yaml.safe_dump({
+                    'pulse_period_seconds': round(period, 5),
+                    'pulse_jitter_seconds': round(jitter, 5),
+                }, stream, default_flow_style=False)
+        except OSError as exc:
+            print("[ROTARY] Cannot write calibration %s: %s" % (self.calibration_path, exc))
+            return
+        self._saved_pulse_period = period
+
+    def _apply_pulse_period(self):
+        """Derive the inter-digit gap and debounce from the learned pulse period."""
+        self.pulse_threshold = max(
+            self.pulse_period * self._GAP_PERIODS,
+            self.pulse_period + 4 * self.pulse_jitter,
+        )
+        self.debounce_seconds = self.pulse_period * self._DEBOUNCE_PERIODS
+
+    def _learn_from_digit(self, pulse_count):
+        """Update the pulse period estimate from the edges of the digit just completed.
+
+        Must be called with the value lock held.
+        """
+        if pulse_count == 1 and self._pulse_times:
+            return self._learn_from_split_digit(self._pulse_times[-1])
+        self._split_pulses.clear()
+        if pulse_count < 3 or pulse_count > len(self._pulse_times):
+            return False
+        times = list(self._pulse_times)[-pulse_count:]
+        intervals = sorted(b - a for a, b in zip(times, times[1:]))
+        median = intervals[len(intervals) // 2]
+        if not self._MIN_PULSE_PERIOD <= median <= self._MAX_PULSE_PERIOD:
+            return False
+        deviation = sum(abs(interval - median) for interval in intervals) / len(intervals)
+        self.pulse_period += self._LEARNING_RATE * (median - self.pulse_period)
+        self.pulse_jitter += self._LEARNING_RATE * (deviation - self.pulse_jitter)
+        self._apply_pulse_period()
+        return True
+
+    def _learn_from_split_digit(self, pulse_at):
+        """Relearn a slower dial whose pulses each ended up as a digit of their own.
+
+        Digits of three or more pulses can only be learned once the gap is
+        long enough again, so this jumps straight to the observed period.
+        Must be called with the value lock held.
+        """
+        self._split_pulses.append(pulse_at)
+        if len(self._split_pulses) < self._SPLIT_PULSES:
+            return False
+        times = list(self._split_pulses)
+        intervals = [b - a for a, b in zip(times, times[1:])]
+        # Real single-pulse digits are far apart (the dial has to be wound
+        # up again); split ones are spaced like pulses.
+        if not all(self.pulse_threshold <= interval <= self._MAX_PULSE_PERIOD for interval in intervals):
+            return False
+        spread = max(intervals) - min(intervals)
+        if spread > self._LEARNING_RATE * max(intervals):
+            return False
+        self._split_pulses.clear()
+        self.pulse_period = sum(intervals) / len(intervals)
+        self.pulse_jitter = spread / 2
+        self._apply_pulse_period()
+        print("[ROTARY] Pulses arrived as separate digits, relearned %.1f pps" % (1.0 / self.pulse_period))
+        return True
+
+    def _increment(self, pin_num, timestamp=None):
         """
         Increment function trigered each time a falling pulse is detected.
         :param pin_num: GPIO pin triggering the event (Can only be self.ns_pin here)
+        :param timestamp: CLOCK_MONOTONIC time of the edge, if the backend provides it
         """
         del pin_num
-        with self._value_lock:
+        now = time.monotonic() if timestamp is None else timestamp
+        with self._value_cond:
+            if self.adaptive and self.value and now - self._last_pulse_at < self.debounce_seconds:
+                return
             self.value += 1
-            self._last_pulse_at = time.monotonic()
+            self._last_pulse_at = now
+            self._pulse_times.append(now)
+            self._value_cond.notify()
 
     def _poll_pin(self):
-        current_state = GPIO.input(self.pin)
+        current_state = self.gpio.input(self.pin)
         now = time.monotonic()
 
-        if self._last_state == GPIO.HIGH and current_state == GPIO.LOW:
+        if self._last_state == self.gpio.HIGH and current_state == self.gpio.LOW:
             if now - self._last_fall_at >= self.debounce_seconds:
-                self._increment(self.pin)
+                self._increment(self.pin, now)
                 self._last_fall_at = now
 
         self._last_state = current_state
 
-    def run(self):
-        while not self._stop_event.is_set():
-            if not self._uses_event_detect:
-                self._poll_pin()
-                time.sleep(self.poll_interval)
-
-            with self._value_lock:
+    def _take_completed_digit(self):
+        """Return the pulse count of a finished digit, or 0 if none is ready."""
+        with self._value_lock:
+            if self.value == 0:
+                return 0
+            if time.monotonic() - self._last_pulse_at < self.pulse_threshold:
+                return 0
+            dialed_value = self.value
+            self.value = 0
+            learned = self.adaptive and self._learn_from_digit(dialed_value)
+        if learned:
+            self._save_calibration()
+        return dialed_value
+
+    def _wait_for_completed_digit(self):
+        """Block until a digit is finished or the dial is stopped.
+
+        Every pulse re-arms the deadline (last pulse + pulse_threshold), so the
+        thread sleeps on the condition without using CPU between digits.
+        """
+        with self._value_cond:
+            while True:
+                if self._stop_event.is_set():
+                    return 0
                 if self.value == 0:
+                    self._value_cond.wait()
                     continue
-                if time.monotonic() - self._last_pulse_at < self.pulse_threshold:
+                remaining = self._last_pulse_at + self.pulse_threshold - time.monotonic()
+                if remaining > 0:
+                    self._value_cond.wait(remaining)
                     continue
-
                 dialed_value = self.value
                 self.value = 0
+                learned = self.adaptive and self._learn_from_digit(dialed_value)
+                break
+        if learned:
+            self._save_calibration()
+        return dialed_value
+
+    def run(self):
+        while not self._stop_event.is_set():
+            if self._uses_event_detect:
+                dialed_value = self._wait_for_completed_digit()
+            else:
+                self._poll_pin()
+                time.sleep(self.poll_interval)
+                dialed_value = self._take_completed_digit()
 
-            self.number_q.put(0 if dialed_value == 10 else dialed_value)
+            if dialed_value:
+                self.number_q.put(0 if dialed_value == 10 else dialed_value)
 
     def stop(self):
         self._stop_event.set()
-        try:
-            if self._uses_event_detect:
-                GPIO.remove_event_detect(self.pin)
-        except RuntimeError:
-            pass
+        with self._value_cond:
+            self._value_cond.notify_all()
+        if self._uses_event_detect:
+            self.gpio.remove_edge_callback(self.pin)
 
 
-class AudioPlayer(object):
-    """
-    Single-threaded WAV player shared by the telephone and the phone manager.
+PromptEntry = namedtuple('PromptEntry', ['data', 'channels', 'rate', 'sample_width', 'mtime_ns', 'file_size'])
+
+
+class PromptCache(object):
+    """Decoded WAV prompts kept in memory and bounded by an LRU byte budget.
+
+    Lookups only stat the file: an entry is reused while the file's mtime and
+    size are unchanged, so playback does not touch the SD card.
     """
 
-    def __init__(self, chunk_size=1024):
-        self.chunk_size = chunk_size
+    def __init__(self, max_bytes=4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
         self._lock = Lock()
-        self._thread = None
-        self._stop_event = None
-        self._playback_id = 0
 
-    @property
-    def is_playing(self):
-        with self._lock:
-            return self._thread is not None and self._thread.is_alive()
+    def preload(self, filenames):
+        for filename in filenames:
+            try:
+                entry = self.get(filename)
+            except (OSError, wave.Error, EOFError) as exc:
+                print("[AUDIO] Cannot cache prompt %s: %s" % (filename, exc))
+                continue
+            print("[AUDIO] Cached prompt %s (%d bytes, %d Hz)" % (filename, len(entry.data), entry.rate))
 
-    def play(self, filename, loop=False):
-        self.stop()
-        stop_event = Event()
+    def get(self, filename):
+        """Return the PromptEntry for ``filename``, (re)loading it when the file changed."""
+        path = str(filename)
+        stat = os.stat(path)
         with self._lock:
-            self._playback_id += 1
-            playback_id = self._playback_id
-            self._stop_event = stop_event
-            self._thread = Thread(
-                target=self._play_file,
-                args=(Path(filename), loop, stop_event, playback_id),
-                daemon=True,
+            entry = self._entries.get(path)
+            if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.file_size == stat.st_size:
+                self._entries.move_to_end(path)
+                return entry
+
+        with wave.open(path, 'rb') as wav_file:
+            entry = PromptEntry(
+                data=wav_file.readframes(wav_file.getnframes()),
+                channels=wav_file.getnchannels(),
+                rate=wav_file.getframerate(),
+                sample_width=wav_file.getsampwidth(),
+                mtime_ns=stat.st_mtime_ns,
+                file_size=stat.st_size,
             )
-            thread = self._thread
-        thread.start()
 
-    def play_tone_pattern(self, frequency_hz=450.0, on_ms=125, off_ms=375, sample_rate=8000):
-        self.stop()
-        stop_event = Event()
         with self._lock:
-            self._playback_id += 1
-            playback_id = self._playback_id
-            self._stop_event = stop_event
-            self._thread = Thread(
-                target=self._play_tone_pattern,
-                args=(frequency_hz, on_ms, off_ms, sample_rate, stop_event, playback_id),
-                daemon=True,
-            )
-            thread = self._thread
-        thread.start()
+            previous = self._entries.pop(path, None)
+            if previous is not None:
+                self._size -= len(previous.data)
+            self._entries[path] = entry
+            self._size += len(entry.data)
+            # Evict least recently used prompts, but never the one just loaded.
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.data)
+        return entry
+
+
+class PcmSource(object):
+    """A PCM buffer read period by period, optionally looping."""
+
+    def __init__(self, data, channels, rate, sample_width=2, loop=False, gain=1.0):
+        self.data = data
+        self.channels = channels
+        self.rate = rate
+        self.sample_width = sample_width
+        self.loop = loop
+        self.gain = gain
+        self.source_id = None
+        self._offset = 0
 
-    def stop(self):
-        with self._lock:
-            self._playback_id += 1
-            stop_event = self._stop_event
-            thread = self._thread
-            self._stop_event = None
-            self._thread = None
+    @property
+    def format(self):
+        return (self.channels, self.rate, self.sample_width)
 
-        if stop_event is not None:
-            stop_event.set()
-        if thread is not None and thread.is_alive():
-            thread.join(timeout=1)
+    @property
+    def frame_bytes(self):
+        return self.channels * self.sample_width
+
+    def read(self, nbytes):
+        """Return the next ``nbytes`` of audio, or b'' once a non-looping source is done."""
+        if not self.data:
+            return b''
+        if self._offset >= len(self.data):
+            if not self.loop:
+                return b''
+            self._offset = 0
+        chunk = self.data[self._offset:self._offset + nbytes]
+        self._offset += len(chunk)
+        # Looping sources always fill the whole period so they mix seamlessly.
+        while self.loop and len(chunk) < nbytes:
+            self._offset = nbytes - len(chunk)
+            chunk += self.data[:self._offset]
+        return chunk
+
+
+def mix_int16(chunks, gains, nbytes):
+    """Sum S16_LE ``chunks``, each scaled by its gain, with saturation.
+
+    Chunks shorter than ``nbytes`` count as padded with silence. Uses NumPy
+    when available, then audioop, then a plain array loop.
+    """
+    if np is not None:
+        mixed = np.zeros(nbytes // 2, dtype=np.int32)
+        for chunk, gain in zip(chunks, gains):
+            samples = np.frombuffer(chunk, dtype='<i2', count=len(chunk) // 2)
+            if gain == 1.0:
+                mixed[:len(samples)] += samples
+            else:
+                mixed[:len(samples)] += (samples * gain).astype(np.int32)
+        np.clip(mixed, -32768, 32767, out=mixed)
+        return mixed.astype('<i2').tobytes()
+
+    if audioop is not None and sys.byteorder == 'little':
+        mixed = None
+        for chunk, gain in zip(chunks, gains):
+            if len(chunk) < nbytes:
+                chunk += b'\x00' * (nbytes - len(chunk))
+            if gain != 1.0:
+                chunk = audioop.mul(chunk, 2, gain)
+            mixed = chunk if mixed is None else audioop.add(mixed, chunk, 2)
+        return mixed if mixed is not None else b'\x00' * nbytes
+
+    mixed = [0] * (nbytes // 2)
+    for chunk, gain in zip(chunks, gains):
+        samples = array('h', chunk[:len(chunk) // 2 * 2])
+        if sys.byteorder == 'big':
+            samples.byteswap()
+        for i, sample in enumerate(samples):
+            mixed[i] += int(sample * gain)
+    out = array('h', (max(-32768, min(32767, sample)) for sample in mixed))
+    if sys.byteorder == 'big':
+        out.byteswap()
+    return out.tobytes()
+
+
+def convert_int16(data, channels, rate, out_channels, out_rate):
+    """Convert S16_LE audio between mono/stereo and sample rates.
+
+    Uses NumPy (PolyphaseResampler) when available, then audioop; returns
+    None when neither can do the conversion.
+    """
+    if channels not in (1, 2) or out_channels not in (1, 2):
+        return None
+    if np is not None:
+        samples = np.frombuffer(data, dtype='<i2', count=len(data) // 2)
+        if channels == 2:
+            samples = samples[:len(samples) // 2 * 2].reshape(-1, 2).mean(axis=1).astype('<i2')
+        data = samples.tobytes()
+        if rate != out_rate:
+            data = PolyphaseResampler(rate, out_rate).process(data)
+        if out_channels == 2:
+            data = np.repeat(np.frombuffer(data, dtype='<i2'), 2).tobytes()
+        return data
+    if audioop is None or sys.byteorder != 'little':
+        return None
+    if channels == 2:
+        data = audioop.tomono(data, 2, 0.5, 0.5)
+    if rate != out_rate:
+        data, _ = audioop.ratecv(data, 2, 1, rate, out_rate, None)
+    if out_channels == 2:
+        data = audioop.tostereo(data, 2, 1.0, 1.0)
+    return data
+
+
+def native_device_rate(device_rate, tag):
+    """Return the configured sound card rate, or None to let ALSA convert."""
+    if not device_rate:
+        return None
+    if np is None:
+        print("[%s] NumPy is not installed, ALSA converts to %d Hz instead" % (tag, int(device_rate)))
+        return None
+    return int(device_rate)
 
-    def _play_file(self, filename, loop, stop_event, playback_id):
-        stream = None
-        try:
-            with wave.open(str(filename), "rb") as wav_file:
-                stream = alsaaudio.PCM(
-                    type=alsaaudio.PCM_PLAYBACK,
-                    mode=alsaaudio.PCM_NORMAL,
-                    channels=wav_file.getnchannels(),
-                    rate=wav_file.getframerate(),
-                )
 
-                while not stop_event.is_set():
-                    data = wav_file.readframes(self.chunk_size)
-                    if data:
-                        stream.write(data)
-                        continue
-                    if not loop:
-                        break
-                    wav_file.rewind()
-        except Exception as exc:
-            print("Audio playback failed for %s: %s" % (filename, exc))
-        finally:
-            if stream is not None:
-                del stream
-            with self._lock:
-                if playback_id == self._playback_id:
-                    self._thread = None
-                    self._stop_event = None
+class PolyphaseResampler(object):
+    """Streaming rational resampler for mono S16_LE audio (NumPy).
 
-    def _play_tone_pattern(self, frequency_hz, on_ms, off_ms, sample_rate, stop_event, playback_id):
-        stream = None
-        try:
-            stream = alsaaudio.PCM(
-                type=alsaaudio.PCM_PLAYBACK,
-                mode=alsaaudio.PCM_NORMAL,
-                channels=1,
-                rate=sample_rate,
-                format=alsaaudio.PCM_FORMAT_S16_LE,
-            )
+    The anti-aliasing filter for a rate pair is designed once, split into its
+    polyphase components and cached for all instances. Each call converts a
+    block, carrying the filter history and the output phase over to the next
+    one, so a stream can be fed in periods of any size. Every output phase
+    is one matrix-vector product over a strided view of the input.
+    """
 
-            on_frames = max(1, int(sample_rate * (on_ms / 1000.0)))
-            off_frames = max(0, int(sample_rate * (off_ms / 1000.0)))
+    # Filter taps per polyphase branch when interpolating; decimation scales it.
+    TAPS_PER_PHASE = 16
+    # Above this many branches, outputs are gathered instead of looped per branch.
+    _MAX_BRANCH_LOOP = 16
+    _tables = {}
+    _tables_lock = Lock()
+
+    def __init__(self, in_rate, out_rate):
+        if np is None:
+            raise RuntimeError("PolyphaseResampler requires NumPy")
+        self.in_rate = int(in_rate)
+        self.out_rate = int(out_rate)
+        self.up, self.down, self._phases = self._table(self.in_rate, self.out_rate)
+        self.taps = self._phases.shape[1]
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        # Position of the next output, in 1/up input samples from the buffer start.
+        self._position = (self.taps - 1) * self.up
 
-            amplitude = int(32767 * 0.3)
-            phase_step = (2.0 * math.pi * frequency_hz) / sample_rate
+    @property
+    def delay_seconds(self):
+        """Group delay added by the filter."""
+        if self.up == self.down:
+            return 0.0
+        return (self.taps * self.up - 1) / 2.0 / self.up / self.in_rate
+
+    @classmethod
+    def _table(cls, in_rate, out_rate):
+        key = (in_rate, out_rate)
+        with cls._tables_lock:
+            table = cls._tables.get(key)
+        if table is not None:
+            return table
+        divisor = math.gcd(in_rate, out_rate)
+        up, down = out_rate // divisor, in_rate // divisor
+        taps = cls.TAPS_PER_PHASE * max(1, -(-down // up))
+        length = taps * up
+        # Cut off at the lower of the two Nyquist rates, on the upsampled grid.
+        cutoff = 0.5 / max(up, down) * 0.9
+        index = np.arange(length, dtype=np.float64) - (length - 1) / 2.0
+        prototype = np.sinc(2.0 * cutoff * index) * np.kaiser(length, 8.0)
+        prototype *= up / prototype.sum()
+        # Branch p holds h[p], h[p + up], ... reversed to match oldest-first windows.
+        phases = np.ascontiguousarray(prototype.reshape(taps, up).T[:, ::-1], dtype=np.float32)
+        table = (up, down, phases)
+        with cls._tables_lock:
+            cls._tables[key] = table
+        return table
+
+    def output_frames(self, in_frames):
+        """Exact number of frames the next process() call yields for ``in_frames``."""
+        total = (self.taps - 1 + in_frames) * self.up
+        return max(0, -(-(total - self._position) // self.down))
+
+    def process(self, data):
+        """Convert a block of S16_LE samples; returns S16_LE at the output rate."""
+        if self.up == self.down:
+            return data
+        samples = np.frombuffer(data, dtype='<i2', count=len(data) // 2)
+        buf = np.concatenate((self._history, samples.astype(np.float32)))
+        count = self.output_frames(len(samples))
+        out = np.empty(count, dtype=np.float32)
+        step = buf.strides[0]
+        windows = np.lib.stride_tricks.as_strided(
+            buf,
+            shape=(len(buf) - self.taps + 1, self.taps),
+            strides=(step, step),
+            writeable=False,
+        )
+        if self.up <= self._MAX_BRANCH_LOOP:
+            for first in range(min(self.up, count)):
+                position = self._position + first * self.down
+                # Outputs first, first + up, ... share a branch and advance by `down` inputs.
+                row = position // self.up - (self.taps - 1)
+                outputs = out[first::self.up]
+                outputs[:] = windows[row::self.down][:len(outputs)].dot(self._phases[position % self.up])
+        else:
+            # Many branches (e.g. 44.1 kHz): gather one window and branch per output.
+            positions = self._position + np.arange(count, dtype=np.int64) * self.down
+            np.einsum('ij,ij->i', windows[positions // self.up - (self.taps - 1)], self._phases[positions % self.up], out=out)
+        self._position += count * self.down - len(samples) * self.up
+        self._history = buf[len(buf) - self.taps + 1:]
+        np.rint(out, out=out)
+        np.clip(out, -32768, 32767, out=out)
+        return out.astype('<i2').tobytes()
+
+
+class ToneBank(object):
+    """Call-progress tones rendered once per cadence and cached as int16 PCM.
+
+    A tone is one or more frequencies (summed, for dual-frequency tones) and
+    a cadence of alternating on/off milliseconds; an empty cadence is a
+    continuous tone. Continuous tones span a whole number of periods of every
+    frequency, and cadenced tones keep their phase running with short ramps
+    at each segment edge, so looping the buffer never clicks.
+    """
 
-            on_buffer = bytearray()
-            for i in range(on_frames):
-                sample = int(amplitude * math.sin(phase_step * i))
-                on_buffer.extend(struct.pack('<h', sample))
+    AMPLITUDE = 0.3
+    RAMP_MS = 4
+    # Longest continuous buffer: integer frequencies always loop seamlessly
+    # within one second, half-hertz ones within two.
+    _MAX_CONTINUOUS_SECONDS = 2
 
-            off_buffer = b'\x00\x00' * off_frames if off_frames > 0 else b''
+    def __init__(self):
+        self._cache = {}
+        self._lock = Lock()
 
-            while not stop_event.is_set():
-                stream.write(on_buffer)
-                if stop_event.is_set():
-                    break
-                if off_buffer:
-                    stream.write(off_buffer)
-        except Exception as exc:
-            print("Tone playback failed: %s" % exc)
-        finally:
-            if stream is not None:
-                del stream
+    def get(self, frequencies, cadence=(), sample_rate=8000):
+        """Return the looping PCM buffer (mono S16_LE) for this tone."""
+        frequencies = tuple(float(f) for f in frequencies)
+        cadence = tuple(int(ms) for ms in cadence)
+        if len(cadence) % 2:
+            cadence += (0,)
+        key = (frequencies, cadence, int(sample_rate))
+        with self._lock:
+            data = self._cache.get(key)
+        if data is None:
+            data = self._render(frequencies, cadence, int(sample_rate))
             with self._lock:
-                if playback_id == self._playback_id:
-                    self._thread = None
-                    self._stop_event = None
-
-    def close(self):
-        self.stop()
+                self._cache[key] = data
+        return data
 
+    def noise(self, sample_rate=8000, seconds=1):
+        """Return a cached buffer of full-scale white noise (scale it with a gain)."""
+        key = ('noise', int(sample_rate), int(seconds))
+        with self._lock:
+            data = self._cache.get(key)
+        if data is None:
+            generator = random.Random(0)
+            samples = array('h', (generator.randint(-32767, 32767) for _ in range(int(sample_rate * seconds))))
+            if sys.byteorder == 'big':
+                samples.byteswap()
+            data = samples.tobytes()
+            with self._lock:
+                self._cache[key] = data
+        return data
+
+    def _continuous_frames(self, frequencies, sample_rate):
+        frames = 1
+        for frequency in frequencies:
+            # sample_rate / frequency = p / q: after p samples exactly q cycles fit.
+            period = Fraction(sample_rate) / Fraction(frequency).limit_denominator(1000)
+            frames = frames * period.numerator // math.gcd(frames, period.numerator)
+        return min(frames, sample_rate * self._MAX_CONTINUOUS_SECONDS)
+
+    def _segments(self, frequencies, cadence, sample_rate):
+        """Return the buffer length and the (start, end) frames where the tone is on."""
+        if not any(cadence[1::2]):
+            frames = sum(int(sample_rate * ms / 1000) for ms in cadence[0::2])
+            if not cadence or frames == 0:
+                frames = self._continuous_frames(frequencies, sample_rate)
+            return frames, None
+        segments = []
+        position = 0
+        for index, ms in enumerate(cadence):
+            length = int(sample_rate * ms / 1000)
+            if index % 2 == 0 and length:
+                segments.append((position, position + length))
+            position += length
+        return position, segments
+
+    def _render(self, frequencies, cadence, sample_rate):
+        frames, segments = self._segments(frequencies, cadence, sample_rate)
+        amplitude = 32767 * self.AMPLITUDE / max(1, len(frequencies))
+        ramp = max(1, sample_rate * self.RAMP_MS // 1000)
+        if np is not None:
+            return self._render_numpy(frequencies, sample_rate, frames, segments, amplitude, ramp)
+
+        steps = [2.0 * math.pi * f / sample_rate for f in frequencies]
+        envelope = [1.0] * frames if segments is None else [0.0] * frames
+        for start, end in segments or ():
+            for i in range(start, end):
+                envelope[i] = min(1.0, (i - start + 1) / ramp, (end - i) / ramp)
+        samples = array('h', (
+            int(amplitude * envelope[i] * sum(math.sin(step * i) for step in steps)) if envelope[i] else 0
+            for i in range(frames)
+        ))
+        if sys.byteorder == 'big':
+            samples.byteswap()
+        return samples.tobytes()
+
+    def _render_numpy(self, frequencies, sample_rate, frames, segments, amplitude, ramp):
+        index = np.arange(frames, dtype=np.float64)
+        samples = np.zeros(frames, dtype=np.float64)
+        for frequency in frequencies:
+            samples += np.sin(index * (2.0 * np.pi * frequency / sample_rate))
+        if segments is not None:
+            envelope = np.zeros(frames, dtype=np.float64)
+            for start, end in segments:
+                position = np.arange(end - start, dtype=np.float64)
+                envelope[start:end] = np.minimum(1.0, np.minimum((position + 1) / ramp, (end - start - position) / ramp))
+            samples *= envelope
+        return (samples * amplitude).astype('<i2').tobytes()
 
-class UplinkBridge(object):
-    """Capture USB mic and pipe to BlueALSA SCO via arecord | aplay subprocesses.
 
-    Using subprocesses instead of a Python-level ALSA loop eliminates GIL
-    contention and prevents indefinite stalls caused by blocking PCM writes
-    when the Bluetooth SCO buffer is congested (critical on low-power hardware).
+class AudioPlayer(object):
+    """
+    Audio engine shared by the telephone and the phone manager.
+
+    A single persistent worker thread owns the output PCMs (one per sample
+    format, kept open between sounds) and takes play and stop commands from a
+    queue. A new source replaces the current ones at the next period boundary,
+    so switching between prompts and tones needs no thread spawn, PCM open or
+    join. Sources played with ``mix=True`` are summed into the output instead
+    (S16 only, same format as the current output), e.g. a beep over a tone.
+    During a call the output can be sent to a sink (see set_sink()) instead
+    of the local PCMs. With a ``device_rate``, mono S16 output is converted
+    by a PolyphaseResampler and the PCM is opened at that rate.
     """
 
-    _BACKOFF_INITIAL = 0.2
-    _BACKOFF_MAX = 8.0
-
-    def __init__(self, bt_device=None, capture_device='plughw:Device,0', sample_rate=8000, channels=1, period_frames=160):
-        self.bt_device = None
-        self.capture_device = capture_device
-        self.playback_device = None
-        self.sample_rate = sample_rate
-        self.channels = channels
-        self.period_frames = period_frames
-        self._stop_event = Event()
-        self._thread = None
+    _SAMPLE_FORMATS = {
+        1: alsaaudio.PCM_FORMAT_U8,
+        2: alsaaudio.PCM_FORMAT_S16_LE,
+        3: alsaaudio.PCM_FORMAT_S24_3LE,
+        4: alsaaudio.PCM_FORMAT_S32_LE,
+    }
+    # Bounds the per-period mixing cost; the oldest mixed source is dropped.
+    MAX_SOURCES = 4
+    COMFORT_NOISE_LEVEL = 0.01
+
+    def __init__(self, period_ms=10, periods=2, prompt_cache=None, device_rate=None):
+        self.period_ms = period_ms
+        self.periods = periods
+        self.device_rate = native_device_rate(device_rate, 'AUDIO')
+        self.prompt_cache = prompt_cache if prompt_cache is not None else PromptCache()
+        self.tone_bank = ToneBank()
+        # Seconds from a play command to its first period reaching ALSA.
+        self.last_switch_latency = None
         self._lock = Lock()
-        self._proc_lock = Lock()
-        self._rec_proc = None
-        self._play_proc = None
-        self.set_bt_device(bt_device)
+        self._commands = queue.Queue()
+        self._source_ids = itertools.count(1)
+        self._generation = 0
+        self._active = False
+        self._output_format = None
+        self._pcms = {}
+        self._resamplers = {}
+        self._sink = None
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
 
-    def set_bt_device(self, bt_device):
+    @property
+    def is_playing(self):
         with self._lock:
-            self.bt_device = str(bt_device).strip() if bt_device else None
-            if self.bt_device:
-                self.playback_device = "bluealsa:DEV=%s,PROFILE=sco" % self.bt_device
-            else:
-                self.playback_device = None
+            return self._active
 
-    @property
-    def is_running(self):
+    def play(self, filename, loop=False, mix=False, gain=1.0):
+        """Play a WAV file; returns a source id usable with stop_source()."""
+        try:
+            prompt = self.prompt_cache.get(filename)
+        except (OSError, wave.Error, EOFError) as exc:
+            print("Audio playback failed for %s: %s" % (filename, exc))
+            if not mix:
+                self.stop()
+            return None
+        return self._submit(PcmSource(prompt.data, prompt.channels, prompt.rate, prompt.sample_width, loop=loop, gain=gain), mix)
+
+    def play_tone(self, frequencies, cadence=(), sample_rate=8000, mix=False, gain=1.0):
+        """Loop a tone from the tone bank; see ToneBank for the cadence format.
+
+        Mixed tones are rendered at the current output rate.
+        """
+        if mix:
+            sample_rate = self._mix_rate(sample_rate)
+        source = PcmSource(self.tone_bank.get(frequencies, cadence, sample_rate), 1, sample_rate, loop=True, gain=gain)
+        return self._submit(source, mix)
+
+    def play_comfort_noise(self, level=None, sample_rate=8000):
+        """Mix low-level white noise under the current output."""
+        sample_rate = self._mix_rate(sample_rate)
+        level = self.COMFORT_NOISE_LEVEL if level is None else level
+        source = PcmSource(self.tone_bank.noise(sample_rate), 1, sample_rate, loop=True, gain=level)
+        return self._submit(source, True)
+
+    def stop(self, release=False):
+        """Stop playback. With ``release`` the output PCMs are closed as well
+        (e.g. before a call bridge opens the same device) and the call waits
+        until they are."""
+        released = Event() if release else None
         with self._lock:
-            return self._thread is not None and self._thread.is_alive()
+            self._generation += 1
+            self._active = False
+            self._commands.put(('stop', self._generation, released))
+        if released is not None and not released.wait(timeout=1):
+            print("[AUDIO] Output device was not released within timeout")
+
+    def stop_source(self, source_id):
+        """Stop a single source, leaving the others playing."""
+        if source_id is not None:
+            self._commands.put(('stop_source', source_id))
+
+    def set_sink(self, sink):
+        """Send the output to ``sink`` (with ``format`` and a non-blocking
+        ``write()``, e.g. an AudioProcess) instead of the PCMs; None undoes it."""
+        with self._lock:
+            self._sink = sink
 
-    def start(self):
-        if not self.playback_device:
-            print("[UPLINK] No Bluetooth device configured, not starting")
-            return
+    def _mix_rate(self, sample_rate):
         with self._lock:
-            if self._thread is not None and self._thread.is_alive():
+            output_format = self._output_format if self._active else None
+        return output_format[1] if output_format is not None else sample_rate
+
+    def _submit(self, source, mix=False):
+        source.source_id = next(self._source_ids)
+        with self._lock:
+            self._generation += 1
+            self._active = True
+            self._commands.put(('play', self._generation, source, mix, time.monotonic()))
+        return source.source_id
+
+    def _resampled(self, source):
+        return self.device_rate is not None and source.rate != self.device_rate and source.channels == 1 and source.sample_width == 2
+
+    def _output_pcm(self, source):
+        rate = self.device_rate if self._resampled(source) else source.rate
+        key = (source.channels, rate, source.sample_width)
+        pcm = self._pcms.get(key)
+        if pcm is not None:
+            return pcm
+
+        def open_pcm():
+            return alsaaudio.PCM(
+                type=alsaaudio.PCM_PLAYBACK,
+                mode=alsaaudio.PCM_NORMAL,
+                channels=source.channels,
+                rate=rate,
+                format=self._SAMPLE_FORMATS.get(source.sample_width, alsaaudio.PCM_FORMAT_S16_LE),
+                periodsize=max(1, rate * self.period_ms // 1000),
+                periods=self.periods,
+            )
+
+        try:
+            pcm = open_pcm()
+        except alsaaudio.ALSAAudioError:
+            if not self._pcms:
+                raise
+            # Devices without a mixer only allow one open stream at a time.
+            self._close_pcms()
+            pcm = open_pcm()
+        self._pcms[key] = pcm
+        return pcm
+
+    def _close_pcms(self):
+        for pcm in self._pcms.values():
+            try:
+                pcm.close()
+            except alsaaudio.ALSAAudioError:
+                pass
+        self._pcms.clear()
+        self._resamplers.clear()
+
+    def _to_device_rate(self, source, chunk):
+        if not self._resampled(source):
+            return chunk
+        resampler = self._resamplers.get(source.rate)
+        if resampler is None:
+            resampler = self._resamplers[source.rate] = PolyphaseResampler(source.rate, self.device_rate)
+        return resampler.process(chunk)
+
+    def _set_output_format(self, sources):
+        with self._lock:
+            self._output_format = sources[0].format if sources else None
+
+    def _finish(self, generation):
+        with self._lock:
+            if generation == self._generation:
+                self._active = False
+
+    def _add_source(self, sources, source, mix):
+        if not mix or not sources:
+            sources[:] = [source]
+            return
+        output_format = sources[0].format
+        if source.format != output_format:
+            # Prompts (e.g. 24 kHz) are mixed over 8 kHz tones: bring the
+            # whole buffer to the output format once.
+            data = None
+            if source.sample_width == 2 and output_format[2] == 2:
+                data = convert_int16(source.data, source.channels, source.rate, output_format[0], output_format[1])
+            if data is None:
+                print("[AUDIO] Cannot mix %s into output %s, ignoring source" % (source.format, output_format))
+                return
+            converted = PcmSource(data, output_format[0], output_format[1], loop=source.loop, gain=source.gain)
+            converted.source_id = source.source_id
+            source = converted
+        sources.append(source)
+        if len(sources) > self.MAX_SOURCES:
+            del sources[1]
+
+    def _write_to_sink(self, sink, chunk):
+        # The sink never blocks: wait for room at period pace, but give up as
+        # soon as a new command arrives.
+        written = sink.write(chunk)
+        while written < len(chunk) and self._commands.empty():
+            time.sleep(self.period_ms / 2000.0)
+            written += sink.write(chunk[written:])
+
+    def _next_period(self, sources):
+        """Read one period from every source and return the mixed output."""
+        primary = sources[0]
+        nbytes = max(1, primary.rate * self.period_ms // 1000) * primary.frame_bytes
+        chunks = []
+        gains = []
+        for source in list(sources):
+            chunk = source.read(nbytes)
+            if not chunk:
+                sources.remove(source)
+                continue
+            chunks.append(chunk)
+            gains.append(source.gain)
+        if len(chunks) == 1 and gains[0] == 1.0:
+            return chunks[0]
+        if not chunks:
+            return b''
+        return mix_int16(chunks, gains, max(len(chunk) for chunk in chunks))
+
+    def _run(self):
+        sources = []
+        generation = None
+        submitted_at = None
+        while True:
+            try:
+                # Sleep while idle; otherwise only peek between periods.
+                command = self._commands.get(block=not sources)
+            except queue.Empty:
+                command = None
+
+            if command is not None:
+                kind = command[0]
+                if kind == 'shutdown':
+                    break
+                if kind == 'play':
+                    _, generation, source, mix, submitted_at = command
+                    self._add_source(sources, source, mix)
+                elif kind == 'stop_source':
+                    sources[:] = [source for source in sources if source.source_id != command[1]]
+                    if not sources:
+                        self._finish(generation)
+                else:
+                    _, generation, released = command
+                    sources = []
+                    if released is not None:
+                        self._close_pcms()
+                        released.set()
+                self._set_output_format(sources)
+                continue
+
+            if not sources:
+                continue
+
+            with self._lock:
+                sink = self._sink
+            if sink is not None and sources[0].format != sink.format:
+                print("[AUDIO] Cannot play %s into the call output %s, ignoring source" % (sources[0].format, sink.format))
+                sources = []
+                self._set_output_format(sources)
+                self._finish(generation)
+                continue
+
+            try:
+                primary = sources[0]
+                stream = self._output_pcm(primary) if sink is None else None
+                chunk = self._next_period(sources)
+                if not sources:
+                    self._set_output_format(sources)
+                    self._finish(generation)
+                if not chunk:
+                    continue
+                if stream is None:
+                    self._write_to_sink(sink, chunk)
+                else:
+                    stream.write(self._to_device_rate(primary, chunk))
+                if submitted_at is not None:
+                    self.last_switch_latency = time.monotonic() - submitted_at
+                    submitted_at = None
+            except alsaaudio.ALSAAudioError as exc:
+                print("Audio playback failed: %s" % exc)
+                self._close_pcms()
+                sources = []
+                self._set_output_format(sources)
+                self._finish(generation)
+
+        self._close_pcms()
+
+    def close(self):
+        self.stop()
+        self._commands.put(('shutdown',))
+        if self._thread.is_alive():
+            self._thread.join(timeout=1)
+
+
+def _db_to_gain(db):
+    return 10.0 ** (db / 20.0)
+
+
+class SampleHistory(object):
+    """Linear float32 sample buffer exposing sliding windows without copies.
+
+    Each block is appended after the previous ones; only when the buffer end
+    is reached are the last ``keep`` samples moved back to the front, so the
+    per-block cost is a single copy of the block itself.
+    """
+
+    def __init__(self, keep, block_frames, blocks=32):
+        self.keep = keep
+        blocks = max(blocks, keep // max(1, block_frames) + 2)
+        self._buf = np.zeros(keep + block_frames * blocks, dtype=np.float32)
+        self._end = keep
+
+    def append(self, samples):
+        count = len(samples)
+        if self._end + count > len(self._buf):
+            self._buf[:self.keep] = self._buf[self._end - self.keep:self._end]
+            self._end = self.keep
+        self._buf[self._end:self._end + count] = samples
+        self._end += count
+
+    def latest(self, count):
+        return self._buf[self._end - count:self._end]
+
+    def windows(self, count):
+        """(count, keep + 1) view; row i ends with the i-th of the last ``count`` samples."""
+        base = self._buf[self._end - count - self.keep:self._end]
+        step = base.strides[0]
+        return np.lib.stride_tricks.as_strided(base, shape=(count, self.keep + 1), strides=(step, step), writeable=False)
+
+
+class DspStage(object):
+    """One step of a DspPipeline.
+
+    ``process`` modifies a float32 block (int16 scale) in place, using
+    buffers allocated up front for ``period_frames``. Stages with a higher
+    ``priority`` number are the first to be skipped when the pipeline runs
+    over its CPU budget.
+    """
+
+    name = 'stage'
+    priority = 0
+
+    def __init__(self, sample_rate, period_frames):
+        self.sample_rate = sample_rate
+        self.period_frames = period_frames
+        self.skipped = False
+        self.periods = 0
+        self.cpu_seconds = 0.0
+        # Smoothed CPU time per period, kept while the stage is skipped.
+        self.cpu_average = 0.0
+
+    def record(self, seconds):
+        self.periods += 1
+        self.cpu_seconds += seconds
+        self.cpu_average += 0.05 * (seconds - self.cpu_average)
+
+    def process(self, block):
+        raise NotImplementedError
+
+
+class HighPassFilter(DspStage):
+    """Linear-phase FIR high-pass (windowed sinc) against hum and rumble."""
+
+    name = 'highpass'
+    priority = 1
+
+    def __init__(self, sample_rate, period_frames, cutoff_hz=200.0, taps=63):
+        DspStage.__init__(self, sample_rate, period_frames)
+        index = np.arange(taps, dtype=np.float64) - (taps - 1) / 2.0
+        lowpass = np.sinc(2.0 * cutoff_hz / sample_rate * index) * np.hamming(taps)
+        lowpass /= lowpass.sum()
+        kernel = -lowpass
+        kernel[(taps - 1) // 2] += 1.0
+        # Reversed so that a window row (oldest sample first) dots into y[n].
+        self._kernel = kernel[::-1].astype(np.float32)
+        self._history = SampleHistory(taps - 1, period_frames)
+        self._out = np.zeros(period_frames, dtype=np.float32)
+
+    def process(self, block):
+        count = len(block)
+        self._history.append(block)
+        out = self._out[:count]
+        np.dot(self._history.windows(count), self._kernel, out=out)
+        block[:] = out
+
+
+class NoiseGate(DspStage):
+    """Attenuates periods whose level stays below a threshold."""
+
+    name = 'noise_gate'
+    priority = 2
+
+    def __init__(self, sample_rate, period_frames, threshold_dbfs=-50.0, floor_db=-20.0, hold_ms=200, release_ms=100):
+        DspStage.__init__(self, sample_rate, period_frames)
+        self.threshold = 32768.0 * _db_to_gain(threshold_dbfs)
+        self.floor = _db_to_gain(floor_db)
+        period_ms = 1000.0 * period_frames / sample_rate
+        self._hold_periods = int(hold_ms / period_ms)
+        self._release_step = (1.0 - self.floor) * min(1.0, period_ms / max(1.0, release_ms))
+        self._quiet_periods = 0
+        self.gain = 1.0
+        self._ramp = np.arange(1, period_frames + 1, dtype=np.float32) / period_frames
+        self._gains = np.zeros(period_frames, dtype=np.float32)
+
+    def process(self, block):
+        count = len(block)
+        level = math.sqrt(float(np.dot(block, block)) / max(1, count))
+        if level >= self.threshold:
+            self._quiet_periods = 0
+            target = 1.0
+        else:
+            self._quiet_periods += 1
+            target = self.gain if self._quiet_periods <= self._hold_periods else self.floor
+        # Open at once, close gradually.
+        if target < self.gain:
+            target = max(target, self.gain - self._release_step)
+        _apply_gain_ramp(block, self.gain, target, self._ramp, self._gains)
+        self.gain = target
+
+
+class AutomaticGainControl(DspStage):
+    """Slowly steers the speech level towards a target, within a maximum gain."""
+
+    name = 'agc'
+    priority = 0
+
+    def __init__(self, sample_rate, period_frames, target_dbfs=-20.0, max_gain_db=24.0, noise_floor_dbfs=-55.0):
+        DspStage.__init__(self, sample_rate, period_frames)
+        self.target = 32768.0 * _db_to_gain(target_dbfs)
+        self.max_gain = _db_to_gain(max_gain_db)
+        self.noise_floor = 32768.0 * _db_to_gain(noise_floor_dbfs)
+        self.gain = 1.0
+        self._ramp = np.arange(1, period_frames + 1, dtype=np.float32) / period_frames
+        self._gains = np.zeros(period_frames, dtype=np.float32)
+
+    def process(self, block):
+        count = len(block)
+        level = math.sqrt(float(np.dot(block, block)) / max(1, count))
+        target = self.gain
+        # Silence and line noise must not pump the gain up.
+        if level > self.noise_floor:
+            wanted = min(self.max_gain, self.target / level)
+            # Attack fast on loud input, recover slowly.
+            rate = 0.3 if wanted < self.gain else 0.02
+            target = self.gain + rate * (wanted - self.gain)
+        _apply_gain_ramp(block, self.gain, target, self._ramp, self._gains)
+        self.gain = target
+
+
+def _apply_gain_ramp(block, start, end, ramp, gains):
+    count = len(block)
+    if start == end:
+        if start != 1.0:
+            block *= start
+        return
+    gains = gains[:count]
+    np.multiply(ramp[:count], end - start, out=gains)
+    gains += start
+    block *= gains
+
+
+class EchoCanceller(DspStage):
+    """Block NLMS acoustic echo canceller for the handset.
+
+    The downlink bridge feeds what it plays to the speaker through
+    ``feed_reference`` and the uplink removes the estimated echo of it from
+    the microphone signal. Adaptation freezes during double talk (Geigel
+    detector) and while the far end is silent.
+
+    The reference is held back by the bulk delay between the two: the
+    speaker queue (``set_playback_delay``, measured by the downlink) plus
+    the microphone buffering (``set_capture_delay``), so the echo falls
+    into the filter's tail instead of beyond it.
+    """
+
+    name = 'echo_canceller'
+    priority = 3
+    _DOUBLE_TALK_RATIO = 0.5
+
+    def __init__(self, sample_rate, period_frames, tail_ms=64, step=0.3, max_reference_ms=500):
+        DspStage.__init__(self, sample_rate, period_frames)
+        self.taps = max(16, sample_rate * tail_ms // 1000)
+        self.step = step
+        self.weights = np.zeros(self.taps, dtype=np.float32)
+        self._history = SampleHistory(self.taps - 1, period_frames)
+        self._estimate = np.zeros(period_frames, dtype=np.float32)
+        self._gradient = np.zeros(self.taps, dtype=np.float32)
+        self._magnitude = np.zeros(max(period_frames, self.taps), dtype=np.float32)
+        self._reference = np.zeros(max(period_frames, sample_rate * max_reference_ms // 1000), dtype=np.float32)
+        self._reference_read = 0
+        self._reference_count = 0
+        self._reference_lock = Lock()
+        self._block = np.zeros(period_frames, dtype=np.float32)
+        self.playback_delay_frames = 0
+        self.capture_delay_frames = 0
+
+    @property
+    def bulk_delay_frames(self):
+        """How long the reference is held back: the measured delay minus a
+        quarter of the tail, so a slightly early echo is still modelled."""
+        delay = self.playback_delay_frames + self.capture_delay_frames - self.taps // 4
+        return max(0, min(delay, len(self._reference) - 2 * self.period_frames))
+
+    def set_playback_delay(self, frames):
+        """Frames queued for the speaker ahead of the reference just fed."""
+        self.playback_delay_frames = frames
+
+    def set_capture_delay(self, frames):
+        """Frames between the microphone and this stage."""
+        self.capture_delay_frames = frames
+
+    def feed_reference(self, data):
+        """Queue S16_LE audio that was just written to the speaker."""
+        samples = np.frombuffer(data, dtype='<i2', count=len(data) // 2)
+        size = len(self._reference)
+        samples = samples[-size:]
+        with self._reference_lock:
+            start = (self._reference_read + self._reference_count) % size
+            first = min(len(samples), size - start)
+            self._reference[start:start + first] = samples[:first]
+            self._reference[:len(samples) - first] = samples[first:]
+            self._reference_count += len(samples)
+            if self._reference_count > size:
+                # The uplink fell behind; keep only the newest audio.
+                self._reference_read = (self._reference_read + self._reference_count - size) % size
+                self._reference_count = size
+
+    def _take_reference(self, count):
+        block = self._block[:count]
+        size = len(self._reference)
+        delay = self.bulk_delay_frames
+        with self._reference_lock:
+            # What stays queued after this block is how long the reference is
+            # held back. Periods arrive in bursts, so only a period or more
+            # off target is corrected: by dropping the oldest reference, or by
+            # leading with silence.
+            excess = self._reference_count - count - delay
+            if excess > self.period_frames:
+                self._reference_read = (self._reference_read + excess) % size
+                self._reference_count -= excess
+            lead = min(count, -excess) if excess < -self.period_frames else 0
+            available = min(count - lead, self._reference_count)
+            first = min(available, size - self._reference_read)
+            block[:lead] = 0.0
+            block[lead:lead + first] = self._reference[self._reference_read:self._reference_read + first]
+            block[lead + first:lead + available] = self._reference[:available - first]
+            self._reference_read = (self._reference_read + available) % size
+            self._reference_count -= available
+        block[lead + available:] = 0.0
+        return block
+
+    def process(self, block):
+        count = len(block)
+        self._history.append(self._take_reference(count))
+        windows = self._history.windows(count)
+        estimate = self._estimate[:count]
+        np.dot(windows, self.weights, out=estimate)
+
+        newest = self._history.latest(self.taps)
+        power = float(np.dot(newest, newest))
+        magnitude = self._magnitude[:self.taps]
+        np.abs(newest, out=magnitude)
+        far_peak = float(magnitude.max())
+        magnitude = self._magnitude[:count]
+        np.abs(block, out=magnitude)
+        near_peak = float(magnitude.max())
+
+        block -= estimate
+        if power < self.taps or near_peak > self._DOUBLE_TALK_RATIO * far_peak:
+            return
+        np.dot(windows.T, block, out=self._gradient)
+        self._gradient *= self.step / (power + 1.0)
+        self.weights += self._gradient
+
+
+class DspPipeline(object):
+    """Runs DSP stages on every period of one bridge direction.
+
+    Samples are converted once into a preallocated float32 block, each stage
+    works on it in place, and the result is saturated back to int16. The
+    CPU time of every stage is measured per period. When their sum exceeds
+    ``budget_fraction`` of the period, the active stage with the highest
+    priority number is skipped; skipped stages come back once the others
+    leave enough room for them again.
+    """
+
+    _WARMUP_PERIODS = 50
+    _RETRY_PERIODS = 500
+
+    def __init__(self, name, stages, sample_rate, period_frames, budget_fraction=0.5):
+        self.name = name
+        self.stages = list(stages)
+        self.sample_rate = sample_rate
+        self.period_frames = period_frames
+        self.budget_seconds = budget_fraction * period_frames / float(sample_rate)
+        self.periods = 0
+        self._block = np.zeros(period_frames, dtype=np.float32)
+        self._out = np.zeros(period_frames, dtype='<i2')
+
+    def process(self, data):
+        """Process one period (or less) of S16_LE audio and return the result."""
+        count = min(len(data) // 2, self.period_frames)
+        if count == 0:
+            return data
+        block = self._block[:count]
+        block[:] = np.frombuffer(data, dtype='<i2', count=count)
+        for stage in self.stages:
+            if stage.skipped:
+                continue
+            started = time.thread_time()
+            stage.process(block)
+            stage.record(time.thread_time() - started)
+        self.periods += 1
+        self._check_budget()
+        np.rint(block, out=block)
+        np.clip(block, -32768, 32767, out=block)
+        out = self._out[:count]
+        out[:] = block
+        return out.tobytes() + data[count * 2:]
+
+    def _check_budget(self):
+        if self.periods < self._WARMUP_PERIODS:
+            return
+        active = [stage for stage in self.stages if not stage.skipped]
+        used = sum(stage.cpu_average for stage in active)
+        if used > self.budget_seconds and active:
+            stage = max(active, key=lambda s: s.priority)
+            stage.skipped = True
+            print("[DSP] %s: skipping %s, %.2f ms per period over the %.2f ms budget" % (
+                self.name, stage.name, used * 1000, self.budget_seconds * 1000))
+        elif self.periods % self._RETRY_PERIODS == 0:
+            skipped = [stage for stage in self.stages if stage.skipped]
+            if skipped:
+                stage = min(skipped, key=lambda s: s.priority)
+                if used + stage.cpu_average < 0.8 * self.budget_seconds:
+                    stage.skipped = False
+                    print("[DSP] %s: resuming %s" % (self.name, stage.name))
+
+    def summary(self):
+        period_ms = 1000.0 * self.period_frames / self.sample_rate
+        return "%s dsp per %.1f ms period: %s" % (self.name, period_ms, ', '.join(
+            '%s %.3f ms%s' % (stage.name, 1000.0 * stage.cpu_seconds / max(1, stage.periods), ' (skipped)' if stage.skipped else '')
+            for stage in self.stages
+        ))
+
+
+def build_call_dsp(dsp_config, uplink_rate=8000, uplink_period=160, downlink_rate=8000, downlink_period=120):
+    """Build the (uplink, downlink, echo_canceller) DSP objects from config.
+
+    Returns Nones when DSP is disabled or NumPy is missing.
+    """
+    dsp_config = dsp_config if isinstance(dsp_config, dict) else {}
+    if not dsp_config.get('enabled', DEFAULT_CONFIG['dsp']['enabled']):
+        return None, None, None
+    if np is None:
+        print("[DSP] NumPy is not installed, call audio is not processed")
+        return None, None, None
+
+    def setting(key):
+        return dsp_config.get(key, DEFAULT_CONFIG['dsp'][key])
+
+    def make_stage(name, rate, period):
+        if name == 'highpass':
+            return HighPassFilter(rate, period, cutoff_hz=float(setting('highpass_hz')))
+        if name == 'noise_gate':
+            return NoiseGate(rate, period, threshold_dbfs=float(setting('noise_gate_dbfs')))
+        if name == 'agc':
+            return AutomaticGainControl(rate, period, target_dbfs=float(setting('agc_target_dbfs')), max_gain_db=float(setting('agc_max_gain_db')))
+        print("[DSP] Unknown stage %r ignored" % name)
+        return None
+
+    budget = float(setting('budget_percent')) / 100.0
+    echo_canceller = None
+    uplink_stages = []
+    for name in setting('uplink') or []:
+        if name == 'echo_canceller':
+            echo_canceller = EchoCanceller(uplink_rate, uplink_period, tail_ms=int(setting('echo_tail_ms')))
+            uplink_stages.append(echo_canceller)
+        else:
+            uplink_stages.append(make_stage(str(name), uplink_rate, uplink_period))
+    downlink_stages = [make_stage(str(name), downlink_rate, downlink_period) for name in setting('downlink') or []]
+    uplink_stages = [stage for stage in uplink_stages if stage is not None]
+    downlink_stages = [stage for stage in downlink_stages if stage is not None]
+    uplink = DspPipeline('uplink', uplink_stages, uplink_rate, uplink_period, budget) if uplink_stages else None
+    downlink = DspPipeline('downlink', downlink_stages, downlink_rate, downlink_period, budget) if downlink_stages else None
+    return uplink, downlink, echo_canceller
+
+
+ScoFormat = namedtuple('ScoFormat', 'codec rate')
+
+# How long the bridges wait for a BlueALSA signal before probing the PCM.
+SCO_SIGNAL_TIMEOUT_SECONDS = 1.0
+
+
+def query_bluealsa_sco_format(bt_device, bus=None, timeout=2):
+    """Return the ScoFormat BlueALSA uses for ``bt_device``'s SCO link, or None.
+
+    CVSD runs at 8 kHz and mSBC at 16 kHz. BlueALSA 4.1+ names the rate
+    property ``Rate``, older releases ``Sampling``.
+    """
+    if not bt_device:
+        return None
+    device_path = 'dev_' + str(bt_device).replace(':', '_').upper()
+    try:
+        bus = bus if bus is not None else dbus.SystemBus()
+        manager = dbus.Interface(bus.get_object('org.bluealsa', '/org/bluealsa'), 'org.bluealsa.Manager1')
+        pcms = manager.GetPCMs(timeout=timeout)
+    except dbus.exceptions.DBusException as exc:
+        print("[BLUEALSA] Cannot query SCO codec: %s" % exc)
+        return None
+    for path, props in pcms.items():
+        if device_path not in str(props.get('Device', path)):
+            continue
+        transport = str(props.get('Transport', ''))
+        if 'HFP' not in transport and 'HSP' not in transport:
+            continue
+        rate = int(props.get('Rate', props.get('Sampling', 0)))
+        if rate:
+            return ScoFormat(str(props.get('Codec', '')), rate)
+    return None
+
+
+class DBusSignalLoop(object):
+    """GLib main loop thread that delivers D-Bus signals (needs python3-gi).
+
+    Signal handlers run in the loop thread on a private system bus
+    connection (or one to the bus at ``address``), so they never block on,
+    or get blocked by, method calls made from other threads on the shared
+    connection.
+    """
+
+    _shared = None
+    _shared_lock = Lock()
+
+    def __init__(self, address=None):
+        if hasattr(dbus.mainloop.glib, 'threads_init'):
+            dbus.mainloop.glib.threads_init()
+        if address is None:
+            self.bus = dbus.SystemBus(mainloop=DBusGMainLoop(), private=True)
+        else:
+            self.bus = dbus.bus.BusConnection(address, mainloop=DBusGMainLoop())
+        self._loop = GLib.MainLoop()
+        self._thread = Thread(target=self._loop.run, name='dbus-signals', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def shared(cls):
+        """Return the process-wide loop, or None without python3-gi or a bus."""
+        with cls._shared_lock:
+            if cls._shared is None and GLib is not None:
+                try:
+                    cls._shared = cls()
+                except dbus.exceptions.DBusException as exc:
+                    print("[DBUS] Cannot start the signal loop: %s" % exc)
+            return cls._shared
+
+    def stop(self):
+        self._loop.quit()
+
+
+class ScoReadiness(object):
+    """Tracks BlueALSA's SCO PCMs from D-Bus signals.
+
+    The PCM list is read once and then kept current from the PCMAdded,
+    PCMRemoved and PropertiesChanged signals (and resynchronised when
+    BlueALSA restarts), so the bridges can wait for their PCM instead of
+    opening it over and over.
+    """
+
+    _SERVICE = 'org.bluealsa'
+    _MANAGER_INTERFACE = 'org.bluealsa.Manager1'
+    _PCM_INTERFACE = 'org.bluealsa.PCM1'
+
+    def __init__(self, signal_loop):
+        self._bus = signal_loop.bus
+        self._pcms = {}
+        self._cond = Condition()
+        self._bus.add_signal_receiver(self._on_pcm_added, 'PCMAdded', self._MANAGER_INTERFACE)
+        self._bus.add_signal_receiver(self._on_pcm_removed, 'PCMRemoved', self._MANAGER_INTERFACE)
+        self._bus.add_signal_receiver(
+            self._on_properties_changed,
+            'PropertiesChanged',
+            'org.freedesktop.DBus.Properties',
+            arg0=self._PCM_INTERFACE,
+            path_keyword='path',
+        )
+        # Also called right away with the current owner, which does the first sync.
+        self._bus.watch_name_owner(self._SERVICE, self._on_owner_changed)
+
+    @classmethod
+    def create(cls):
+        """Return a tracker, or None when D-Bus signals are unavailable."""
+        signal_loop = DBusSignalLoop.shared()
+        if signal_loop is None:
+            print("[BLUEALSA] python3-gi is not installed, SCO readiness is probed")
+            return None
+        return cls(signal_loop)
+
+    def _on_owner_changed(self, owner):
+        pcms = {}
+        if owner:
+            try:
+                manager = dbus.Interface(self._bus.get_object(self._SERVICE, '/org/bluealsa'), self._MANAGER_INTERFACE)
+                pcms = {str(path): dict(props) for path, props in manager.GetPCMs(timeout=2).items()}
+            except dbus.exceptions.DBusException as exc:
+                print("[BLUEALSA] Cannot list PCMs: %s" % exc)
+        with self._cond:
+            self._pcms = pcms
+            self._cond.notify_all()
+
+    def _on_pcm_added(self, path, props):
+        with self._cond:
+            self._pcms[str(path)] = dict(props)
+            self._cond.notify_all()
+
+    def _on_pcm_removed(self, path):
+        with self._cond:
+            self._pcms.pop(str(path), None)
+            self._cond.notify_all()
+
+    def _on_properties_changed(self, interface, changed, invalidated, path=None):
+        with self._cond:
+            props = self._pcms.get(str(path))
+            if props is not None:
+                props.update(changed)
+                self._cond.notify_all()
+
+    def _find(self, bt_device, mode):
+        device_path = 'dev_' + str(bt_device).replace(':', '_').upper()
+        for path, props in self._pcms.items():
+            transport = str(props.get('Transport', ''))
+            if device_path in str(props.get('Device', path)) and str(props.get('Mode', '')) == mode \
+                    and ('HFP' in transport or 'HSP' in transport):
+                return props
+        return None
+
+    def sco_format(self, bt_device):
+        """Like query_bluealsa_sco_format(), from the tracked properties."""
+        with self._cond:
+            props = self._find(bt_device, 'source') or self._find(bt_device, 'sink')
+            if props is None:
+                return None
+            rate = int(props.get('Rate', props.get('Sampling', 0)))
+            return ScoFormat(str(props.get('Codec', '')), rate) if rate else None
+
+    def wait_ready(self, bt_device, mode, stop_event, timeout):
+        """Wait until the SCO PCM of ``bt_device`` in ``mode`` ('source' or
+        'sink') exists; False on timeout or when ``stop_event`` is set."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._find(bt_device, mode) is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or stop_event.is_set():
+                    return False
+                self._cond.wait(remaining)
+            return not stop_event.is_set()
+
+    def wake(self):
+        """Let waiters re-check their stop event."""
+        with self._cond:
+            self._cond.notify_all()
+
+
+def log_bluez_device(device):
+    """Print one device record as BluezDeviceCache and PhoneManager list them."""
+    print("[BT] Device %s (%s): paired=%s connected=%s blocked=%s" % (
+        device['alias'],
+        device['address'],
+        device['paired'],
+        device['connected'],
+        device['blocked'],
+    ))
+
+
+class BluezDeviceCache(object):
+    """BlueZ devices kept current from ObjectManager and property signals.
+
+    Seeded with one GetManagedObjects(), then updated by InterfacesAdded,
+    InterfacesRemoved and PropertiesChanged (and resynchronised when
+    bluetoothd restarts). The usable devices are indexed, so the questions
+    PhoneManager asks are answered without a D-Bus round trip.
+    ``on_change(present)`` runs in the signal loop thread whenever a paired,
+    connected and unblocked device appears or the last one goes away.
+    """
+
+    _SERVICE = 'org.bluez'
+    _DEVICE_INTERFACE = 'org.bluez.Device1'
+    _OBJECT_MANAGER = 'org.freedesktop.DBus.ObjectManager'
+
+    def __init__(self, signal_loop, on_change=None):
+        self._bus = signal_loop.bus
+        self.on_change = on_change
+        self._lock = Lock()
+        self._devices = {}
+        # Paths of paired, unblocked devices, and of those also connected.
+        self._paired = set()
+        self._connected = set()
+        self._present = False
+        self._bus.add_signal_receiver(self._on_interfaces_added, 'InterfacesAdded', self._OBJECT_MANAGER, self._SERVICE)
+        self._bus.add_signal_receiver(self._on_interfaces_removed, 'InterfacesRemoved', self._OBJECT_MANAGER, self._SERVICE)
+        self._bus.add_signal_receiver(
+            self._on_properties_changed,
+            'PropertiesChanged',
+            'org.freedesktop.DBus.Properties',
+            self._SERVICE,
+            arg0=self._DEVICE_INTERFACE,
+            path_keyword='path',
+        )
+        try:
+            self._owner = str(self._bus.get_name_owner(self._SERVICE))
+        except dbus.exceptions.DBusException:
+            self._owner = ''
+        self._sync(self._owner)
+        self._bus.watch_name_owner(self._SERVICE, self._on_owner_changed)
+
+    @classmethod
+    def create(cls, signal_loop, on_change=None):
+        """Return a cache, or None when BlueZ cannot be watched."""
+        try:
+            return cls(signal_loop, on_change)
+        except dbus.exceptions.DBusException as exc:
+            print("[BT] Cannot watch BlueZ devices: %s" % exc)
+            return None
+
+    def _on_owner_changed(self, owner):
+        # The first call repeats the owner the cache was seeded from.
+        if str(owner) == self._owner:
+            return
+        self._owner = str(owner)
+        self._sync(self._owner)
+
+    def _sync(self, owner):
+        managed_objects = {}
+        if owner:
+            try:
+                object_manager = dbus.Interface(self._bus.get_object(self._SERVICE, '/'), self._OBJECT_MANAGER)
+                managed_objects = object_manager.GetManagedObjects()
+            except dbus.exceptions.DBusException as exc:
+                print("[BT] Cannot list BlueZ devices: %s" % exc)
+        with self._lock:
+            self._devices = {}
+            self._paired = set()
+            self._connected = set()
+            for path, interfaces in managed_objects.items():
+                if self._DEVICE_INTERFACE in interfaces:
+                    self._store(str(path), interfaces[self._DEVICE_INTERFACE])
+            changed = self._update_presence()
+        self._notify(changed)
+
+    def _store(self, path, properties):
+        device = self._devices.setdefault(path, {
+            'path': path,
+            'address': '',
+            'alias': 'unknown',
+            'paired': False,
+            'connected': False,
+            'blocked': False,
+        })
+        for key, name in (('address', 'Address'), ('alias', 'Alias')):
+            if name in properties:
+                device[key] = str(properties[name])
+        for key, name in (('paired', 'Paired'), ('connected', 'Connected'), ('blocked', 'Blocked')):
+            if name in properties:
+                device[key] = bool(properties[name])
+        self._index(path)
+        return device
+
+    def _index(self, path):
+        device = self._devices.get(path)
+        usable = device is not None and device['paired'] and not device['blocked']
+        if usable:
+            self._paired.add(path)
+        else:
+            self._paired.discard(path)
+        if usable and device['connected']:
+            self._connected.add(path)
+        else:
+            self._connected.discard(path)
+
+    def _update_presence(self):
+        present = bool(self._connected)
+        if present == self._present:
+            return None
+        self._present = present
+        return present
+
+    def _notify(self, present):
+        if present is not None and self.on_change is not None:
+            self.on_change(present)
+
+    def _on_interfaces_added(self, path, interfaces):
+        if self._DEVICE_INTERFACE not in interfaces:
+            return
+        with self._lock:
+            device = self._store(str(path), interfaces[self._DEVICE_INTERFACE])
+            changed = self._update_presence()
+        log_bluez_device(device)
+        self._notify(changed)
+
+    def _on_interfaces_removed(self, path, interfaces):
+        if self._DEVICE_INTERFACE not in interfaces:
+            return
+        with self._lock:
+            device = self._devices.pop(str(path), None)
+            self._index(str(path))
+            changed = self._update_presence()
+        if device is not None:
+            print("[BT] Device %s (%s) removed" % (device['alias'], device['address']))
+        self._notify(changed)
+
+    def _on_properties_changed(self, interface, changed, invalidated, path=None):
+        with self._lock:
+            if str(path) not in self._devices:
+                return
+            device = self._store(str(path), changed)
+            presence = self._update_presence()
+        if {'Paired', 'Connected', 'Blocked'} & set(str(name) for name in changed):
+            log_bluez_device(device)
+        self._notify(presence)
+
+    def devices(self):
+        """Return copies of all device records (as PhoneManager lists them)."""
+        with self._lock:
+            return [dict(device) for device in self._devices.values()]
+
+    def has_usable(self, require_connected=True):
+        with self._lock:
+            return bool(self._connected if require_connected else self._paired)
+
+    def connected_address(self, preferred_path=None):
+        """Address of ``preferred_path`` if it is connected, else of any usable connected device."""
+        with self._lock:
+            device = self._devices.get(preferred_path)
+            if device is not None and device['connected'] and device['address']:
+                return device['address']
+            for path in self._connected:
+                if self._devices[path]['address']:
+                    return self._devices[path]['address']
+        return None
+
+
+class ExitWatcher(object):
+    """Blocks until one of a set of subprocesses exits, without polling.
+
+    Processes are watched through pidfds (Linux 5.3+, Python 3.9+), or else
+    by a thread blocked in ``wait()`` for each of them. ``wake()`` interrupts
+    a wait.
+    """
+
+    def __init__(self):
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_write, False)
+        self._lock = Lock()
+        self._waiters = {}
+
+    def wake(self):
+        try:
+            os.write(self._wake_write, b'\0')
+        except BlockingIOError:
+            # Enough wakeups are pending already.
+            pass
+
+    def wait(self, procs):
+        """Return the first of ``procs`` that exited (reaped), or None when woken."""
+        poller = select.poll()
+        poller.register(self._wake_read, select.POLLIN)
+        pidfds = {}
+        try:
+            for proc in procs:
+                if proc.poll() is not None:
+                    return proc
+                fd = self._pidfd(proc)
+                if fd is None:
+                    self._wait_in_thread(proc)
+                else:
+                    pidfds[fd] = proc
+                    poller.register(fd, select.POLLIN)
+            for fd, _ in poller.poll():
+                if fd in pidfds:
+                    pidfds[fd].wait()
+                    return pidfds[fd]
+            self._discard_wakeups()
+            # Waiter threads report exits through the wake pipe too.
+            for proc in procs:
+                if proc.poll() is not None:
+                    return proc
+            return None
+        finally:
+            for fd in pidfds:
+                os.close(fd)
+
+    @staticmethod
+    def _pidfd(proc):
+        if not hasattr(os, 'pidfd_open'):
+            return None
+        try:
+            return os.pidfd_open(proc.pid)
+        except OSError:
+            # Old kernel, or the process was reaped meanwhile.
+            return None
+
+    def _wait_in_thread(self, proc):
+        with self._lock:
+            self._waiters = {pid: thread for pid, thread in self._waiters.items() if thread.is_alive()}
+            if proc.pid in self._waiters:
+                return
+            thread = Thread(target=self._wait_and_wake, args=(proc,), daemon=True)
+            self._waiters[proc.pid] = thread
+        thread.start()
+
+    def _wait_and_wake(self, proc):
+        proc.wait()
+        self.wake()
+
+    def _discard_wakeups(self):
+        while select.select([self._wake_read], [], [], 0)[0]:
+            os.read(self._wake_read, 4096)
+
+
+def discard_pending(fd):
+    """Read and drop whatever is waiting in the pipe ``fd``."""
+    while select.select([fd], [], [], 0)[0]:
+        if not os.read(fd, 65536):
+            break
+
+
+# Periods buffered by each PCM of a bridge under a latency budget.
+LATENCY_BUDGET_PERIODS = 2
+_MIN_BUDGET_PERIOD_MS = 2.5
+
+
+def latency_budget_options(budget_ms, sample_rate=8000):
+    """Bridge keyword arguments that fit ``budget_ms`` of buffering per direction.
+
+    Each direction has two PCMs (uplink: microphone and SCO, downlink: SCO
+    and speaker) of LATENCY_BUDGET_PERIODS periods each, so a period is a
+    quarter of the budget. The downlink JitterBuffer comes on top. A budget
+    of 0 keeps the bridges' defaults.
+    """
+    budget_ms = float(budget_ms)
+    if budget_ms <= 0:
+        return {}
+    period_ms = budget_ms / (2 * LATENCY_BUDGET_PERIODS)
+    if period_ms < _MIN_BUDGET_PERIOD_MS:
+        print("[AUDIO] Latency budget of %.0f ms is too small, using %.0f ms" % (
+            budget_ms, _MIN_BUDGET_PERIOD_MS * 2 * LATENCY_BUDGET_PERIODS))
+        period_ms = _MIN_BUDGET_PERIOD_MS
+    return {
+        'period_frames': int(round(sample_rate * period_ms / 1000.0)),
+        'buffer_periods': LATENCY_BUDGET_PERIODS,
+    }
+
+
+class UplinkBridge(object):
+    """Capture USB mic and pipe to BlueALSA SCO via arecord | aplay subprocesses.
+
+    Using subprocesses instead of a Python-level ALSA loop eliminates GIL
+    contention and prevents indefinite stalls caused by blocking PCM writes
+    when the Bluetooth SCO buffer is congested (critical on low-power hardware).
+    With a DSP pipeline or a ``device_rate`` (microphone opened at the sound
+    card's native rate and converted by a PolyphaseResampler), raw audio is
+    read from arecord, processed one period at a time and written to aplay;
+    the devices stay in the subprocesses.
+
+    In warm standby, ``park()`` starts arecord while the handset is off-hook
+    and discards its audio; once SCO is ready only aplay has to be spawned,
+    and the parked capture is pumped into it.
+
+    Both legs stream headerless audio, so when one of them exits it is
+    restarted on its own, as soon as an ExitWatcher reports the exit. Only
+    a leg that keeps failing sends the bridge back to waiting for SCO.
+    """
+
+    _BACKOFF_INITIAL = 0.2
+    _BACKOFF_MAX = 8.0
+    # A restarted leg that dies again sooner than this reconnects the bridge.
+    _MIN_LEG_UPTIME = 1.0
+
+    def __init__(self, bt_device=None, capture_device='plughw:Device,0', sample_rate=8000, channels=1, period_frames=160, dsp=None, device_rate=None, sco_tracker=None, warm_standby=False, buffer_periods=None):
+        self.bt_device = None
+        self.sco_tracker = sco_tracker
+        # PCM opens made without (or despite) a readiness signal.
+        self.fallback_probes = 0
+        self.warm_standby = warm_standby
+        # Seconds from SCO ready to the first frame written to aplay.
+        self.last_attach_latency = None
+        # Restarts of each leg, and the seconds between exit and replacement.
+        self.restarts = {'arecord': 0, 'aplay': 0}
+        self.restart_gaps = deque(maxlen=100)
+        self._exit_watcher = ExitWatcher()
+        self.capture_device = capture_device
+        self.playback_device = None
+        self.sample_rate = sample_rate
+        self._native_rate = native_device_rate(device_rate, 'UPLINK')
+        self.channels = channels
+        self.period_frames = period_frames
+        # Periods of period_frames in the arecord and aplay buffers; None
+        # leaves both sizes to ALSA.
+        self.buffer_periods = buffer_periods
+        self.dsp = dsp
+        self._stop_event = Event()
+        self._thread = None
+        self._lock = Lock()
+        self._proc_lock = Lock()
+        self._rec_proc = None
+        self._play_proc = None
+        self._parked_proc = None
+        self._parked_format = None
+        self._park_thread = None
+        self._park_stop = Event()
+        self.set_bt_device(bt_device)
+
+    def set_bt_device(self, bt_device):
+        with self._lock:
+            self.bt_device = str(bt_device).strip() if bt_device else None
+            if self.bt_device:
+                self.playback_device = "bluealsa:DEV=%s,PROFILE=sco" % self.bt_device
+            else:
+                self.playback_device = None
+
+    @property
+    def is_running(self):
+        with self._lock:
+            return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if not self.playback_device:
+            print("[UPLINK] No Bluetooth device configured, not starting")
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
                 return
             self._stop_event.clear()
             self._thread = Thread(target=self._run, daemon=True)
@@ -375,9 +2411,65 @@ class UplinkBridge(object):
         print("[UPLINK] Starting subprocess ALSA bridge")
         thread.start()
 
+    def park(self):
+        """Start capturing ahead of the call, discarding audio until SCO is ready."""
+        if not self.warm_standby or self.is_running:
+            return
+        with self._proc_lock:
+            if self._parked_proc is not None and self._parked_proc.poll() is None:
+                return
+            try:
+                proc = self._spawn_arecord(subprocess.PIPE)
+            except OSError as exc:
+                print("[UPLINK] Cannot park capture (%s)" % exc)
+                return
+            self._park_stop.clear()
+            self._parked_proc = proc
+            self._parked_format = self._capture_format()
+            self._park_thread = Thread(target=self._drain_parked, args=(proc,), daemon=True)
+            self._park_thread.start()
+        print("[UPLINK] Capture parked in warm standby")
+
+    def _drain_parked(self, proc):
+        fd = proc.stdout.fileno()
+        while not self._park_stop.is_set():
+            readable, _, _ = select.select([fd], [], [], 0.2)
+            if readable and not os.read(fd, 65536):
+                # arecord exited; _take_parked() notices and starts a new one.
+                break
+
+    def _take_parked(self):
+        """Return the parked arecord with its backlog discarded, or None."""
+        with self._proc_lock:
+            proc, thread, capture_format = self._parked_proc, self._park_thread, self._parked_format
+            self._parked_proc = None
+            self._park_thread = None
+        if proc is None:
+            return None
+        self._park_stop.set()
+        thread.join(timeout=1)
+        if proc.poll() is not None or capture_format != self._capture_format():
+            # Dead, or parked before a wideband call changed the rate (or the
+            # echo canceller the buffering).
+            self._end_proc(proc)
+            return None
+        discard_pending(proc.stdout.fileno())
+        return proc
+
+    def unpark(self):
+        """Release a parked capture that no call is going to use."""
+        proc = self._take_parked()
+        if proc is not None:
+            self._end_proc(proc)
+            print("[UPLINK] Parked capture released")
+
     def stop(self):
         self._stop_event.set()
+        if self.sco_tracker is not None:
+            self.sco_tracker.wake()
+        self.unpark()
         self._terminate_procs()
+        self._exit_watcher.wake()
         with self._lock:
             thread = self._thread
         if thread is not None and thread.is_alive():
@@ -389,6 +2481,17 @@ class UplinkBridge(object):
             if self._thread is thread:
                 self._thread = None
         print("[UPLINK] Stopped subprocess ALSA bridge")
+        if self.restart_gaps:
+            print("[UPLINK] %s" % self.restart_summary())
+
+    def restart_summary(self):
+        gaps = list(self.restart_gaps)
+        return "Leg restarts: arecord %d, aplay %d; gap avg %.1f ms, max %.1f ms" % (
+            self.restarts['arecord'],
+            self.restarts['aplay'],
+            1000.0 * sum(gaps) / max(1, len(gaps)),
+            1000.0 * max(gaps, default=0),
+        )
 
     def _terminate_procs(self):
         with self._proc_lock:
@@ -396,19 +2499,36 @@ class UplinkBridge(object):
             self._rec_proc = None
             self._play_proc = None
         for proc in (rec, play):
-            if proc is None:
-                continue
-            if proc.poll() is None:
-                proc.terminate()
-            try:
-                proc.wait(timeout=1)
-            except subprocess.TimeoutExpired:
-                proc.kill()
-                proc.wait()
+            if proc is not None:
+                self._end_proc(proc)
+
+    @staticmethod
+    def _end_proc(proc):
+        if proc.poll() is None:
+            proc.terminate()
+        try:
+            proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
 
     def _wait_for_sco_available(self):
-        """Return True once the BlueALSA SCO PCM device can be opened, False if stopped."""
+        """Return True once the BlueALSA SCO PCM device can be opened, False if stopped.
+
+        With a ScoReadiness tracker this waits for BlueALSA's signal; opening
+        the PCM is only the fallback when no signal arrives in time.
+        """
+        started = time.monotonic()
+        probes = 0
         while not self._stop_event.is_set():
+            if self.sco_tracker is not None and self.sco_tracker.wait_ready(
+                    self.bt_device, 'sink', self._stop_event, SCO_SIGNAL_TIMEOUT_SECONDS):
+                print("[UPLINK] BlueALSA SCO available (signalled after %.0f ms)" % ((time.monotonic() - started) * 1000))
+                return True
+            if self._stop_event.is_set():
+                break
+            probes += 1
+            self.fallback_probes += 1
             try:
                 pcm = alsaaudio.PCM(
                     type=alsaaudio.PCM_PLAYBACK,
@@ -420,67 +2540,222 @@ class UplinkBridge(object):
                     periodsize=self.period_frames,
                 )
                 del pcm
-                print("[UPLINK] BlueALSA SCO available")
+                print("[UPLINK] BlueALSA SCO available (probed after %.0f ms, %d probes, %d total)" % (
+                    (time.monotonic() - started) * 1000, probes, self.fallback_probes))
                 return True
             except alsaaudio.ALSAAudioError:
-                time.sleep(0.2)
+                if self.sco_tracker is None:
+                    time.sleep(0.2)
         return False
 
+    def set_sample_rate(self, sample_rate):
+        """Switch to the SCO rate of the next call, keeping the period length."""
+        with self._lock:
+            self.period_frames = self.period_frames * sample_rate // self.sample_rate
+            self.sample_rate = sample_rate
+
+    @property
+    def device_rate(self):
+        """Rate the sound card is opened at; the SCO rate without a native rate."""
+        return self._native_rate or self.sample_rate
+
+    @property
+    def _pumps_in_python(self):
+        return self.warm_standby or self.dsp is not None or self.device_rate != self.sample_rate
+
+    @property
+    def _has_echo_canceller(self):
+        return self.dsp is not None and any(isinstance(stage, EchoCanceller) for stage in self.dsp.stages)
+
+    @property
+    def capture_delay_frames(self):
+        """Microphone to DSP delay: arecord's period plus the period read from it."""
+        return 2 * self.period_frames
+
+    def _capture_format(self):
+        return self.device_rate, tuple(self._buffer_args())
+
+    def _buffer_args(self):
+        periods = self.buffer_periods
+        if periods is None:
+            if not self._has_echo_canceller:
+                return []
+            # arecord's default period can be 125 ms; the echo canceller
+            # needs a known, short capture delay.
+            periods = LATENCY_BUDGET_PERIODS
+        # In microseconds, so the same values hold at any rate.
+        period_us = 1000000 * self.period_frames // self.sample_rate
+        return ['-F', str(period_us), '-B', str(period_us * periods)]
+
+    def _spawn_arecord(self, stdout):
+        # Headerless audio lets the other leg (or the Python pump) pick up
+        # the stream of a restarted process at any point.
+        return subprocess.Popen(
+            [
+                'arecord',
+                '-D', self.capture_device,
+                '-f', 'S16_LE',
+                '-r', str(self.device_rate),
+                '-c', str(self.channels),
+                '-t', 'raw',
+            ] + self._buffer_args(),
+            stdout=stdout,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def _spawn_aplay(self, stdin):
+        return subprocess.Popen(
+            [
+                'aplay',
+                '-D', self.playback_device,
+                '-f', 'S16_LE',
+                '-r', str(self.sample_rate),
+                '-c', str(self.channels),
+                '-t', 'raw',
+            ] + self._buffer_args(),
+            stdin=stdin,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def _restart_leg(self, leg, exited, spawn, started):
+        """Replace the ``leg`` process that exited; returns the new process.
+
+        None means the bridge is stopping, or the leg died again within
+        _MIN_LEG_UPTIME and the whole bridge should reconnect.
+        """
+        detected = time.monotonic()
+        self._end_proc(exited)
+        for stream in (exited.stdin, exited.stdout):
+            if stream is not None:
+                try:
+                    stream.close()
+                except OSError:
+                    pass
+        if self._stop_event.is_set():
+            return None
+        if detected - started[leg] < self._MIN_LEG_UPTIME:
+            print("[UPLINK] %s exited after only %.0f ms (rc=%s), reconnecting..." % (
+                leg, (detected - started[leg]) * 1000, exited.returncode))
+            return None
+        try:
+            proc = spawn()
+        except OSError as exc:
+            print("[UPLINK] Cannot restart %s (%s), reconnecting..." % (leg, exc))
+            return None
+        with self._proc_lock:
+            stopping = self._stop_event.is_set()
+            if not stopping and leg == 'arecord':
+                self._rec_proc = proc
+            elif not stopping:
+                self._play_proc = proc
+        if stopping:
+            self._end_proc(proc)
+            return None
+        started[leg] = time.monotonic()
+        gap = started[leg] - detected
+        self.restarts[leg] += 1
+        self.restart_gaps.append(gap)
+        print("[UPLINK] %s exited (rc=%s), restarted in %.1f ms" % (leg, exited.returncode, gap * 1000))
+        return proc
+
+    def _supervise_pipe(self, rec_proc, play_proc, read_fd, write_fd):
+        """Restart whichever of arecord | aplay exits until stopped or failing."""
+        started = {'arecord': time.monotonic(), 'aplay': time.monotonic()}
+        while not self._stop_event.is_set():
+            exited = self._exit_watcher.wait([rec_proc, play_proc])
+            if exited is None:
+                continue
+            if exited is rec_proc:
+                rec_proc = self._restart_leg('arecord', rec_proc, lambda: self._spawn_arecord(write_fd), started)
+                if rec_proc is None:
+                    return
+            else:
+                # Audio queued for the dead aplay is stale by now.
+                discard_pending(read_fd)
+                play_proc = self._restart_leg('aplay', play_proc, lambda: self._spawn_aplay(read_fd), started)
+                if play_proc is None:
+                    return
+
+    def _pump_python(self, rec_proc, play_proc, ready_at=None, warm=False):
+        """Move audio from arecord through resampling and DSP into aplay."""
+        resampler = None
+        if self.device_rate != self.sample_rate:
+            resampler = PolyphaseResampler(self.device_rate, self.sample_rate)
+        period_bytes = self.period_frames * self.device_rate // self.sample_rate * self.channels * 2
+        started = {'arecord': time.monotonic(), 'aplay': time.monotonic()}
+        try:
+            while not self._stop_event.is_set():
+                data = rec_proc.stdout.read(period_bytes)
+                if len(data) < period_bytes:
+                    rec_proc = self._restart_leg('arecord', rec_proc, lambda: self._spawn_arecord(subprocess.PIPE), started)
+                    if rec_proc is None:
+                        break
+                    continue
+                if resampler is not None:
+                    data = resampler.process(data)
+                if self.dsp is not None:
+                    data = self.dsp.process(data)
+                try:
+                    play_proc.stdin.write(data)
+                    play_proc.stdin.flush()
+                except BrokenPipeError:
+                    play_proc = self._restart_leg('aplay', play_proc, lambda: self._spawn_aplay(subprocess.PIPE), started)
+                    if play_proc is None:
+                        break
+                    continue
+                if ready_at is not None:
+                    self.last_attach_latency = time.monotonic() - ready_at
+                    print("[UPLINK] First frame %.0f ms after SCO ready (%s)" % (
+                        self.last_attach_latency * 1000, 'warm standby' if warm else 'cold start'))
+                    ready_at = None
+        except ValueError:
+            # A pipe was closed under us while stopping.
+            pass
+        finally:
+            if self.dsp is not None:
+                print("[UPLINK] %s" % self.dsp.summary())
+
     def _run(self):
         backoff = self._BACKOFF_INITIAL
         while not self._stop_event.is_set():
             if not self._wait_for_sco_available():
                 break
 
-            rec_proc = None
-            play_proc = None
+            ready_at = time.monotonic()
+            rec_proc = self._take_parked()
+            warm = rec_proc is not None
+            pipe_fds = ()
             try:
-                rec_proc = subprocess.Popen(
-                    [
-                        'arecord',
-                        '-D', self.capture_device,
-                        '-f', 'S16_LE',
-                        '-r', str(self.sample_rate),
-                        '-c', str(self.channels),
-                    ],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.DEVNULL,
-                )
-                play_proc = subprocess.Popen(
-                    [
-                        'aplay',
-                        '-D', self.playback_device,
-                        '-f', 'S16_LE',
-                        '-r', str(self.sample_rate),
-                        '-c', str(self.channels),
-                    ],
-                    stdin=rec_proc.stdout,
-                    stderr=subprocess.DEVNULL,
-                )
-                # Close parent copy so rec_proc receives SIGPIPE if play_proc exits.
-                rec_proc.stdout.close()
-
+                if self._pumps_in_python:
+                    stdout = stdin = subprocess.PIPE
+                else:
+                    # The parent keeps both ends open, so either leg can exit
+                    # and be replaced without taking the other one down.
+                    pipe_fds = os.pipe()
+                    stdin, stdout = pipe_fds
+                if rec_proc is None:
+                    rec_proc = self._spawn_arecord(stdout)
                 with self._proc_lock:
                     self._rec_proc = rec_proc
+                play_proc = self._spawn_aplay(stdin)
+                with self._proc_lock:
                     self._play_proc = play_proc
 
                 backoff = self._BACKOFF_INITIAL
-                while not self._stop_event.is_set():
-                    if play_proc.poll() is not None:
-                        print("[UPLINK] aplay exited (rc=%d), reconnecting..." % play_proc.returncode)
-                        break
-                    if rec_proc.poll() is not None:
-                        print("[UPLINK] arecord exited (rc=%d), reconnecting..." % rec_proc.returncode)
-                        break
-                    time.sleep(0.3)
+                if self._pumps_in_python:
+                    self._pump_python(rec_proc, play_proc, ready_at, warm)
+                else:
+                    self._supervise_pipe(rec_proc, play_proc, *pipe_fds)
+                if not self._stop_event.is_set():
+                    print("[UPLINK] Audio stream interrupted, reconnecting...")
 
             except Exception as exc:
                 print("[UPLINK] Bridge error (%s), reconnecting..." % exc)
 
             finally:
                 self._terminate_procs()
-                rec_proc = None
-                play_proc = None
+                for fd in pipe_fds:
+                    os.close(fd)
                 if not self._stop_event.is_set():
                     time.sleep(backoff)
                     backoff = min(backoff * 2, self._BACKOFF_MAX)
@@ -489,22 +2764,222 @@ class UplinkBridge(object):
             self._thread = None
 
 
+class BridgeStats(object):
+    """Wakeup, CPU and queueing counters for one bridge session."""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.wakeups = 0
+        self.frames = 0
+        self.dropped_frames = 0
+        self._queued_frames_total = 0
+        self._writes = 0
+        self._started_at = time.monotonic()
+        self._cpu_started_at = time.thread_time()
+
+    def record_write(self, frames, queued_frames):
+        self.frames += frames
+        self._queued_frames_total += queued_frames
+        self._writes += 1
+
+    def summary(self, sample_rate):
+        """Must be called from the thread that created the stats."""
+        elapsed = max(1e-6, time.monotonic() - self._started_at)
+        cpu = time.thread_time() - self._cpu_started_at
+        queued_ms = 1000.0 * self._queued_frames_total / max(1, self._writes) / sample_rate
+        return "%s mode: %.1f wakeups/s, cpu %.1f%%, queued %.1f ms avg, %d frames, %d dropped" % (
+            self.mode,
+            self.wakeups / elapsed,
+            100.0 * cpu / elapsed,
+            queued_ms,
+            self.frames,
+            self.dropped_frames,
+        )
+
+
+class JitterBuffer(object):
+    """Adaptive playout buffer between two independently clocked PCMs.
+
+    Captured frames are pushed as they arrive and the speaker pops exactly one
+    period whenever it has room, so the playback clock drives consumption.
+    Playout starts once the buffer holds the target depth. The smoothed fill
+    level is then steered towards that target: clock drift is absorbed by
+    dropping or repeating a single quiet frame, a starved speaker raises the
+    target and re-primes the buffer, and the target slowly decays back
+    towards the minimum while playout is clean.
+    """
+
+    # Smoothing of the fill level per popped period (~1.5 s at 15 ms periods).
+    _FILL_SMOOTHING = 0.01
+    # Periods between two drift corrections (bounds the correction rate).
+    _ADJUST_INTERVAL = 10
+    # Clean periods before the target depth is lowered again.
+    _DECAY_INTERVAL = 2000
+
+    def __init__(self, frame_bytes, period_frames, min_periods=1, max_periods=8):
+        self.frame_bytes = frame_bytes
+        self.period_frames = period_frames
+        self.min_frames = int(min_periods * period_frames)
+        self.max_frames = int(max_periods * period_frames)
+        self.target_frames = min(self.max_frames, self.min_frames + period_frames // 2)
+        self.fill_average = float(self.target_frames)
+        self.primed = False
+        self.underruns = 0
+        self.overflows = 0
+        self.dropped_frames = 0
+        self.inserted_frames = 0
+        self._data = bytearray()
+        self._since_adjust = 0
+        self._since_underrun = 0
+
+    @property
+    def fill_frames(self):
+        return len(self._data) // self.frame_bytes
+
+    @property
+    def _ready(self):
+        # The target counts the slack left behind after a period is popped.
+        return self.fill_frames >= self.target_frames + self.period_frames
+
+    def push(self, data):
+        self._data += data
+        excess = len(self._data) - (self.max_frames + self.period_frames) * self.frame_bytes
+        if excess > 0:
+            excess -= excess % self.frame_bytes
+            del self._data[:excess]
+            self.overflows += 1
+            self.dropped_frames += excess // self.frame_bytes
+        if not self.primed and self._ready:
+            self.primed = True
+
+    def pop(self):
+        """Return one period of audio, or None if less than a period is buffered."""
+        fill = self.fill_frames - self.period_frames
+        if not self.primed or fill < 0:
+            return None
+        self.fill_average += self._FILL_SMOOTHING * (fill - self.fill_average)
+        self._since_adjust += 1
+        self._since_underrun += 1
+
+        if self._since_underrun >= self._DECAY_INTERVAL:
+            self._since_underrun = 0
+            self.target_frames = max(self.min_frames, self.target_frames - self.period_frames // 4)
+
+        period_bytes = self.period_frames * self.frame_bytes
+        tolerance = self.period_frames / 2.0
+        if self._since_adjust >= self._ADJUST_INTERVAL:
+            if self.fill_average > self.target_frames + tolerance and fill > 0:
+                self._since_adjust = 0
+                self.dropped_frames += 1
+                self.fill_average -= 1
+                chunk = bytearray(self._data[:period_bytes + self.frame_bytes])
+                del self._data[:period_bytes + self.frame_bytes]
+                index = self._quietest_frame(chunk)
+                del chunk[index:index + self.frame_bytes]
+                return bytes(chunk)
+            if self.fill_average < self.target_frames - tolerance:
+                self._since_adjust = 0
+                self.inserted_frames += 1
+                self.fill_average += 1
+                chunk = bytearray(self._data[:period_bytes - self.frame_bytes])
+                del self._data[:period_bytes - self.frame_bytes]
+                index = self._quietest_frame(chunk)
+                chunk[index:index] = chunk[index:index + self.frame_bytes]
+                return bytes(chunk)
+
+        chunk = bytes(self._data[:period_bytes])
+        del self._data[:period_bytes]
+        return chunk
+
+    def starved(self):
+        """Record that the speaker ran dry: buffer deeper and re-prime."""
+        self.underruns += 1
+        self._since_underrun = 0
+        self.target_frames = min(self.max_frames, self.target_frames + self.period_frames // 2)
+        self.fill_average = float(self.target_frames)
+        self.primed = self._ready
+
+    def _quietest_frame(self, chunk):
+        """Byte offset of the frame whose first sample is closest to zero."""
+        samples = array('h', bytes(chunk[:len(chunk) - len(chunk) % 2]))
+        if sys.byteorder == 'big':
+            samples.byteswap()
+        step = self.frame_bytes // 2
+        frame = min(range(0, len(samples), step), key=lambda i: abs(samples[i])) // step
+        return frame * self.frame_bytes
+
+    def summary(self, sample_rate):
+        return "jitter buffer: target %.1f ms, fill %.1f ms avg, %d underruns, %d overflows, %d dropped, %d inserted frames" % (
+            1000.0 * self.target_frames / sample_rate,
+            1000.0 * self.fill_average / sample_rate,
+            self.underruns,
+            self.overflows,
+            self.dropped_frames,
+            self.inserted_frames,
+        )
+
+
 class DownlinkBridge(object):
-    """Capture BlueALSA SCO and play to USB audio device (phone speaker)."""
+    """Capture BlueALSA SCO and play to USB audio device (phone speaker).
+
+    Both PCMs are non-blocking and the bridge thread sleeps in poll() on their
+    descriptors, so data moves as soon as a period is ready. Captured audio
+    goes through a JitterBuffer that compensates the drift between the SCO
+    and USB clocks. PCMs without poll descriptors fall back to the old
+    read-or-sleep loop. With a ``device_rate`` the speaker is opened at that
+    rate and the audio is converted by a PolyphaseResampler.
+
+    With ``sco_format_probe`` the SCO rate (8 kHz CVSD or 16 kHz mSBC) is
+    looked up before the SCO PCM is opened, and passed to ``on_sco_ready``
+    so the rest of the call chain can follow.
+    """
 
-    def __init__(self, bt_device=None, playback_device='plughw:Device,0', sample_rate=8000, channels=1, period_frames=120, on_sco_ready=None):
+    # Poll timeout as a safety net; stop() wakes the thread through a pipe.
+    _POLL_TIMEOUT_MS = 1000
+    JITTER_MIN_PERIODS = 1
+    JITTER_MAX_PERIODS = 8
+
+    def __init__(self, bt_device=None, playback_device='plughw:Device,0', sample_rate=8000, channels=1, period_frames=120, on_sco_ready=None, inject_ring=None, dsp=None, echo_canceller=None, device_rate=None, sco_format_probe=None, sco_tracker=None, buffer_periods=None):
         self.bt_device = None
+        self.sco_tracker = sco_tracker
+        # PCM opens made without (or despite) a readiness signal.
+        self.fallback_probes = 0
         self.capture_device = None
         self.playback_device = playback_device
         self.sample_rate = sample_rate
+        self.period_ms = 1000.0 * period_frames / sample_rate
+        self._native_rate = native_device_rate(device_rate, 'DOWNLINK')
+        self.sco_format_probe = sco_format_probe
+        self._narrowband_rate = sample_rate
+        self._resampler = None
         self.channels = channels
         self.period_frames = period_frames
+        # Periods buffered by each PCM; None keeps ALSA's (and the speaker's
+        # two-period) defaults.
+        self.buffer_periods = buffer_periods
         self.on_sco_ready = on_sco_ready
+        # Optional SharedRing whose audio is mixed into the speaker output.
+        self.inject_ring = inject_ring
+        self.dsp = dsp
+        # Gets everything played to the speaker as its echo reference.
+        self.echo_canceller = echo_canceller
         self._stop_event = Event()
         self._thread = None
         self._lock = Lock()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        # False keeps the 10 ms sleep loop even where poll() works, so the
+        # two can be compared (benchmarks.py downlink).
+        self.polled = True
+        # BridgeStats summary of the last session.
+        self.last_stats = None
         self.set_bt_device(bt_device)
 
+    @property
+    def device_rate(self):
+        """Rate the speaker is opened at; the SCO rate without a native rate."""
+        return self._native_rate or self.sample_rate
+
     def set_bt_device(self, bt_device):
         with self._lock:
             self.bt_device = str(bt_device).strip() if bt_device else None
@@ -516,104 +2991,845 @@ class DownlinkBridge(object):
     @property
     def is_running(self):
         with self._lock:
-            return self._thread is not None and self._thread.is_alive()
+            return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if not self.capture_device:
+            print("[DOWNLINK] No Bluetooth device configured, not starting")
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._drain_wake_pipe()
+            self._thread = Thread(target=self._run, daemon=True)
+            thread = self._thread
+        print("[DOWNLINK] Starting Python ALSA bridge")
+        thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread = self._thread
+            self._stop_event.set()
+        os.write(self._wake_w, b'\0')
+        if self.sco_tracker is not None:
+            self.sco_tracker.wake()
+        if thread is not None and thread.is_alive():
+            thread.join(timeout=2)
+        if thread is not None and thread.is_alive():
+            print("[DOWNLINK] Bridge thread did not stop within timeout")
+            return
+        with self._lock:
+            if self._thread is thread:
+                self._thread = None
+        print("[DOWNLINK] Stopped Python ALSA bridge")
+
+    def _drain_wake_pipe(self):
+        try:
+            while os.read(self._wake_r, 512):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _create_pcm(self, pcm_type, device, mode=None, periods=None, rate=None):
+        if mode is None:
+            mode = alsaaudio.PCM_NONBLOCK if pcm_type == alsaaudio.PCM_CAPTURE else alsaaudio.PCM_NORMAL
+        rate = rate or self.sample_rate
+        options = {}
+        if periods is not None:
+            options['periods'] = periods
+        return alsaaudio.PCM(
+            type=pcm_type,
+            mode=mode,
+            device=device,
+            channels=self.channels,
+            rate=rate,
+            format=alsaaudio.PCM_FORMAT_S16_LE,
+            periodsize=self.period_frames * rate // self.sample_rate,
+            **options
+        )
+
+    def _process(self, data):
+        """Apply the DSP pipeline and injected audio to a period for the speaker."""
+        if self.dsp is not None:
+            data = self.dsp.process(data)
+        if self.inject_ring is not None and self.inject_ring.readable:
+            injected = self.inject_ring.read(len(data))
+            data = mix_int16([data, injected], [1.0, 1.0], len(data))
+        if self.echo_canceller is not None:
+            self.echo_canceller.feed_reference(data)
+        if self._resampler is not None:
+            data = self._resampler.process(data)
+        return data
+
+    def _measure_playback_delay(self, playback):
+        """Tell the echo canceller how much audio the speaker still has queued."""
+        if self.echo_canceller is None:
+            return
+        if hasattr(playback, 'delay'):
+            frames = playback.delay()
+        elif hasattr(playback, 'avail'):
+            frames = self._playback_buffer_frames - playback.avail()
+        else:
+            frames = self._playback_buffer_frames
+        queued = max(0, frames) * self.sample_rate // self.device_rate
+        if self._resampler is not None:
+            queued += int(self._resampler.delay_seconds * self.sample_rate)
+        self.echo_canceller.set_playback_delay(queued)
+
+    @property
+    def _playback_buffer_frames(self):
+        # Speaker PCMs are opened with buffer_periods (or two) periods.
+        return (self.buffer_periods or 2) * self.period_frames * self.device_rate // self.sample_rate
+
+    def _apply_sco_format(self):
+        sco_format = self.sco_format_probe(self.bt_device)
+        rate = sco_format.rate if sco_format is not None else self._narrowband_rate
+        if rate != self.sample_rate:
+            print("[DOWNLINK] SCO codec %s at %d Hz" % (sco_format.codec if sco_format else 'CVSD', rate))
+            self.sample_rate = rate
+            self.period_frames = int(round(self.period_ms * rate / 1000.0))
+
+    def _wait_for_capture_ready(self):
+        started = time.monotonic()
+        probes = 0
+        while not self._stop_event.is_set():
+            signalled = self.sco_tracker is not None and self.sco_tracker.wait_ready(
+                self.bt_device, 'source', self._stop_event, SCO_SIGNAL_TIMEOUT_SECONDS)
+            if self._stop_event.is_set():
+                break
+            capture = None
+            try:
+                capture = self._create_pcm(alsaaudio.PCM_CAPTURE, self.capture_device, periods=self.buffer_periods)
+                # The codec is settled once SCO is up, so ask only after the
+                # PCM opened: without python3-gi each query is a blocking
+                # GetPCMs. A different rate means reopening once.
+                if self.sco_format_probe is not None:
+                    opened_rate = self.sample_rate
+                    self._apply_sco_format()
+                    if self.sample_rate != opened_rate:
+                        # Close the old PCM before opening the new one.
+                        capture = None
+                        capture = self._create_pcm(alsaaudio.PCM_CAPTURE, self.capture_device, periods=self.buffer_periods)
+                if signalled and not probes:
+                    how = "signalled"
+                else:
+                    probes += 1
+                    self.fallback_probes += 1
+                    how = "%d probes, %d total" % (probes, self.fallback_probes)
+                print("[DOWNLINK] BlueALSA capture ready (%d Hz) after %.0f ms (%s)" % (
+                    self.sample_rate, (time.monotonic() - started) * 1000, how))
+                return capture
+            except alsaaudio.ALSAAudioError:
+                if capture is not None:
+                    del capture
+                probes += 1
+                self.fallback_probes += 1
+                time.sleep(0.2)
+        return None
+
+    def _pump_sleeping(self, capture, playback, stats):
+        while not self._stop_event.is_set():
+            stats.wakeups += 1
+            frames, data = capture.read()
+            if frames <= 0 or not data:
+                time.sleep(0.01)
+                continue
+            playback.write(self._process(data))
+            stats.record_write(frames, frames)
+            self._measure_playback_delay(playback)
+
+    def _pump_polled(self, capture, playback, stats):
+        frame_bytes = self.channels * 2
+        period_seconds = float(self.period_frames) / self.sample_rate
+        jitter = JitterBuffer(frame_bytes, self.period_frames, self.JITTER_MIN_PERIODS, self.JITTER_MAX_PERIODS)
+        capture_fds = capture.polldescriptors()
+        playback_fds = playback.polldescriptors()
+        poller = select.poll()
+        poller.register(self._wake_r, select.POLLIN)
+        for fd, mask in capture_fds:
+            poller.register(fd, mask)
+
+        pending = b''
+        hungry_since = None
+        waiting_for_playback = False
+        try:
+            while not self._stop_event.is_set():
+                # Only wait for speaker space while there is a period to give it.
+                playable = bool(pending) or (jitter.primed and jitter.fill_frames >= self.period_frames)
+                if playable != waiting_for_playback:
+                    waiting_for_playback = playable
+                    for fd, mask in playback_fds:
+                        if waiting_for_playback:
+                            poller.register(fd, mask)
+                        else:
+                            poller.unregister(fd)
+                events = dict(poller.poll(self._POLL_TIMEOUT_MS))
+                stats.wakeups += 1
+                if self._wake_r in events:
+                    self._drain_wake_pipe()
+
+                # Plugin PCMs (the bluealsa ioplug among them) only clear
+                # their poll fds while demangling revents, so every fired
+                # descriptor goes through polldescriptors_revents.
+                if any(fd in events for fd, _ in capture_fds):
+                    revents = capture.polldescriptors_revents([(fd, events.get(fd, 0)) for fd, _ in capture_fds])
+                    # On POLLERR the read recovers the PCM or raises.
+                    if revents & (select.POLLIN | select.POLLERR):
+                        frames, data = capture.read()
+                        if frames > 0 and data:
+                            jitter.push(data)
+                            # The speaker asked for data more than a period ago (with
+                            # at most one period left queued), so it has run dry.
+                            if hungry_since is not None and time.monotonic() - hungry_since > period_seconds:
+                                jitter.starved()
+                                hungry_since = None
+
+                if not waiting_for_playback or not any(fd in events for fd, _ in playback_fds):
+                    continue
+                revents = playback.polldescriptors_revents([(fd, events.get(fd, 0)) for fd, _ in playback_fds])
+                if not revents & (select.POLLOUT | select.POLLERR):
+                    continue
+                while True:
+                    if not pending:
+                        pending = jitter.pop()
+                        if pending is None:
+                            pending = b''
+                            if jitter.primed and hungry_since is None:
+                                hungry_since = time.monotonic()
+                            break
+                        hungry_since = None
+                        pending = self._process(pending)
+                    written = playback.write(pending)
+                    if written <= 0:
+                        break
+                    stats.record_write(written * self.sample_rate // self.device_rate, jitter.fill_frames)
+                    pending = pending[written * frame_bytes:]
+                    self._measure_playback_delay(playback)
+        finally:
+            stats.dropped_frames = jitter.dropped_frames
+            print("[DOWNLINK] %s" % jitter.summary(self.sample_rate))
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            capture = self._wait_for_capture_ready()
+            if capture is None:
+                return
+
+            if self.on_sco_ready is not None:
+                self.on_sco_ready(self.sample_rate)
+
+            playback = None
+            stats = None
+            if self.device_rate != self.sample_rate:
+                self._resampler = PolyphaseResampler(self.sample_rate, self.device_rate)
+            try:
+                if self.polled and hasattr(capture, 'polldescriptors_revents'):
+                    stats = BridgeStats('poll')
+                    # Keep the speaker buffer short; the jitter buffer holds the slack.
+                    playback = self._create_pcm(alsaaudio.PCM_PLAYBACK, self.playback_device, alsaaudio.PCM_NONBLOCK, periods=self.buffer_periods or 2, rate=self.device_rate)
+                    self._pump_polled(capture, playback, stats)
+                else:
+                    stats = BridgeStats('sleep')
+                    playback = self._create_pcm(alsaaudio.PCM_PLAYBACK, self.playback_device, periods=self.buffer_periods, rate=self.device_rate)
+                    self._pump_sleeping(capture, playback, stats)
+            except alsaaudio.ALSAAudioError as exc:
+                print("[DOWNLINK] ALSA stream reset (%s), reconnecting..." % exc)
+                time.sleep(0.2)
+            finally:
+                if stats is not None:
+                    self.last_stats = stats.summary(self.sample_rate)
+                    print("[DOWNLINK] %s" % self.last_stats)
+                if self.dsp is not None:
+                    print("[DOWNLINK] %s" % self.dsp.summary())
+                if capture is not None:
+                    del capture
+                if playback is not None:
+                    del playback
+        with self._lock:
+            self._thread = None
+
+
+class SharedRing(object):
+    """Lock-free single-producer/single-consumer byte ring in shared memory.
+
+    The header holds the capacity and two free-running 32-bit positions. The
+    producer only stores the write position and the consumer only the read
+    position, each after copying its data, so the two sides can live in
+    different processes without any lock. The capacity must be a power of
+    two so the positions can wrap at 2**32.
+    """
+
+    _HEADER = struct.Struct('=III')
+    _POSITION = struct.Struct('=I')
+    _WRITE_OFFSET = 4
+    _READ_OFFSET = 8
+
+    def __init__(self, name=None, capacity=8192):
+        if name is None:
+            if capacity <= 0 or capacity & (capacity - 1):
+                raise ValueError("ring capacity must be a power of two, got %d" % capacity)
+            self._shm = shared_memory.SharedMemory(create=True, size=self._HEADER.size + capacity)
+            self._HEADER.pack_into(self._shm.buf, 0, capacity, 0, 0)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self.capacity = self._HEADER.unpack_from(self._shm.buf, 0)[0]
+        self._mask = self.capacity - 1
+        self._data = self._shm.buf[self._HEADER.size:self._HEADER.size + self.capacity]
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def _positions(self):
+        _, write_pos, read_pos = self._HEADER.unpack_from(self._shm.buf, 0)
+        return write_pos, read_pos
+
+    @property
+    def readable(self):
+        write_pos, read_pos = self._positions()
+        return (write_pos - read_pos) & 0xFFFFFFFF
+
+    def write(self, data):
+        """Copy as much of ``data`` as fits; returns the number of bytes written."""
+        write_pos, read_pos = self._positions()
+        count = min(len(data), self.capacity - ((write_pos - read_pos) & 0xFFFFFFFF))
+        if count <= 0:
+            return 0
+        data = memoryview(data)
+        start = write_pos & self._mask
+        first = min(count, self.capacity - start)
+        self._data[start:start + first] = data[:first]
+        self._data[:count - first] = data[first:count]
+        self._POSITION.pack_into(self._shm.buf, self._WRITE_OFFSET, (write_pos + count) & 0xFFFFFFFF)
+        return count
+
+    def read(self, nbytes):
+        """Return up to ``nbytes`` of queued data."""
+        write_pos, read_pos = self._positions()
+        count = min(nbytes, (write_pos - read_pos) & 0xFFFFFFFF)
+        if count <= 0:
+            return b''
+        start = read_pos & self._mask
+        first = min(count, self.capacity - start)
+        data = bytes(self._data[start:start + first]) + bytes(self._data[:count - first])
+        self._POSITION.pack_into(self._shm.buf, self._READ_OFFSET, (read_pos + count) & 0xFFFFFFFF)
+        return data
+
+    def close(self):
+        self._data.release()
+        self._shm.close()
+
+    def unlink(self):
+        self._shm.unlink()
+
+
+class LoopbackLatencyMeter(object):
+    """Measures the latency of a call bridge through an ALSA loopback card.
+
+    With snd-aloop loaded, audio played to ``hw:Loopback,0,N`` is captured
+    from ``hw:Loopback,1,N``. The bridge under test captures from one
+    substream and plays to another, in place of its microphone, SCO or
+    speaker devices. The meter plays silence with a short 1 kHz marker into
+    the bridge's input and timestamps the marker's onset at the bridge's
+    output. Its own buffering is subtracted, so the result is the bridge
+    latency to within one meter period.
+    """
+
+    MARKER_MS = 5
+    SETTLE_SECONDS = 1.0
+    TIMEOUT_SECONDS = 2.0
+    _THRESHOLD = 8000
+
+    def __init__(self, card='Loopback', rate=8000, period_frames=40):
+        self.card = card
+        self.rate = rate
+        self.period_frames = period_frames
+
+    def _pcm(self, pcm_type, device, mode):
+        return alsaaudio.PCM(
+            type=pcm_type,
+            mode=mode,
+            device=device,
+            channels=1,
+            rate=self.rate,
+            format=alsaaudio.PCM_FORMAT_S16_LE,
+            periodsize=self.period_frames,
+            periods=2,
+        )
+
+    def _marker(self):
+        burst = self.rate * self.MARKER_MS // 1000
+        samples = array('h', (int(20000 * math.sin(2 * math.pi * 1000 * i / self.rate)) for i in range(burst)))
+        samples.extend([0] * max(0, self.period_frames - burst))
+        if sys.byteorder == 'big':
+            samples.byteswap()
+        return samples.tobytes()
+
+    def _onset(self, data):
+        samples = array('h', data)
+        if sys.byteorder == 'big':
+            samples.byteswap()
+        for index, sample in enumerate(samples):
+            if abs(sample) > self._THRESHOLD:
+                return index
+        return None
+
+    def measure(self, bridge, input_substream, output_substream, markers=10, interval=0.5):
+        """Run ``bridge`` between two loopback substreams.
+
+        Returns the latency of each marker in seconds, None for lost ones.
+        """
+        # Both bridges name their input capture_device and their output
+        # playback_device.
+        bridge.capture_device = 'plughw:%s,1,%d' % (self.card, input_substream)
+        bridge.playback_device = 'plughw:%s,0,%d' % (self.card, output_substream)
+        playback = self._pcm(alsaaudio.PCM_PLAYBACK, 'plughw:%s,0,%d' % (self.card, input_substream), alsaaudio.PCM_NORMAL)
+        capture = self._pcm(alsaaudio.PCM_CAPTURE, 'plughw:%s,1,%d' % (self.card, output_substream), alsaaudio.PCM_NONBLOCK)
+        silence = bytes(self.period_frames * 2)
+        marker = self._marker()
+        results = []
+        bridge.start()
+        try:
+            sent_at = None
+            next_marker = time.monotonic() + self.SETTLE_SECONDS
+            while len(results) < markers:
+                if sent_at is None and time.monotonic() >= next_marker:
+                    playback.write(marker)
+                    # The blocking write returns with about one period queued
+                    # ahead of the marker.
+                    sent_at = time.monotonic() + float(self.period_frames) / self.rate
+                else:
+                    playback.write(silence)
+                while True:
+                    frames, data = capture.read()
+                    if frames <= 0 or not data:
+                        break
+                    if sent_at is None:
+                        continue
+                    now = time.monotonic()
+                    onset = self._onset(data)
+                    if onset is not None:
+                        results.append(now - float(frames - onset) / self.rate - sent_at)
+                    elif now - sent_at < self.TIMEOUT_SECONDS:
+                        continue
+                    else:
+                        results.append(None)
+                    sent_at = None
+                    next_marker = now + interval
+        finally:
+            bridge.stop()
+            del playback
+            del capture
+        return results
+
+    @staticmethod
+    def summary(results):
+        measured = [latency for latency in results if latency is not None]
+        if not measured:
+            return "no marker came through (%d sent)" % len(results)
+        return "%.1f ms avg, %.1f ms min, %.1f ms max, %d of %d markers lost" % (
+            1000.0 * sum(measured) / len(measured),
+            1000.0 * min(measured),
+            1000.0 * max(measured),
+            len(results) - len(measured),
+            len(results),
+        )
+
+
+def prepare_call_chain(uplink, downlink, dsp_config, sample_rate):
+    """Bring the uplink and fresh DSP pipelines to the SCO rate of this call."""
+    uplink.set_sample_rate(sample_rate)
+    uplink.dsp, downlink.dsp, downlink.echo_canceller = build_call_dsp(
+        dsp_config,
+        uplink_rate=sample_rate,
+        uplink_period=uplink.period_frames,
+        downlink_rate=sample_rate,
+        downlink_period=downlink.period_frames,
+    )
+    if downlink.echo_canceller is not None:
+        downlink.echo_canceller.set_capture_delay(uplink.capture_delay_frames)
+
+
+def audio_process_main(conn, ring_name, options):
+    """Entry point of the audio process started by AudioProcess."""
+    # Ctrl-C reaches the whole process group; the parent shuts us down.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ring = SharedRing(ring_name)
+    released = Event()
+    send_lock = Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    def on_sco_ready(sample_rate):
+        prepare_call_chain(uplink, downlink, options.get('dsp'), sample_rate)
+        released.clear()
+        send(('sco_ready', sample_rate))
+        # The parent frees the speaker first, but a stalled parent must not
+        # hold up the call audio.
+        if not released.wait(timeout=AudioProcess.RELEASE_TIMEOUT_SECONDS):
+            print("[AUDIOPROC] Speaker release not confirmed, starting anyway")
+        uplink.start()
+
+    sco_tracker = ScoReadiness.create()
+    sco_format_probe = None
+    if options.get('wideband'):
+        sco_format_probe = sco_tracker.sco_format if sco_tracker is not None else query_bluealsa_sco_format
+    budget = latency_budget_options(options.get('latency_budget_ms', 0))
+    uplink = UplinkBridge(
+        capture_device=options['device'],
+        device_rate=options.get('device_rate'),
+        sco_tracker=sco_tracker,
+        warm_standby=options.get('warm_standby', False),
+        **budget
+    )
+    downlink = DownlinkBridge(
+        playback_device=options['device'],
+        on_sco_ready=on_sco_ready,
+        inject_ring=ring,
+        device_rate=options.get('device_rate'),
+        sco_format_probe=sco_format_probe,
+        sco_tracker=sco_tracker,
+        **budget
+    )
+    try:
+        while True:
+            message = conn.recv()
+            kind = message[0]
+            if kind == 'start':
+                uplink.set_bt_device(message[1])
+                downlink.set_bt_device(message[1])
+                downlink.start()
+            elif kind == 'park':
+                uplink.park()
+            elif kind == 'unpark':
+                uplink.unpark()
+            elif kind == 'stop':
+                uplink.stop()
+                downlink.stop()
+                # Whatever was not played belongs to the finished call.
+                ring.read(ring.capacity)
+                send(('stopped',))
+            elif kind == 'released':
+                released.set()
+            elif kind == 'shutdown':
+                break
+    except EOFError:
+        print("[AUDIOPROC] Parent went away, stopping")
+    finally:
+        uplink.stop()
+        downlink.stop()
+        ring.close()
+
+
+class AudioProcess(object):
+    """Runs the SCO downlink and uplink bridges in a dedicated child process.
+
+    The child has its own interpreter and GIL, so the D-Bus, rotary dial and
+    tone threads of this process (or an 8 s D-Bus timeout) cannot delay a
+    single audio frame. Control messages go over a pipe; sounds played
+    during a call are written into a SharedRing that the child mixes into
+    the speaker output.
+
+    It replaces both bridges: ``start()`` brings up the downlink, and the
+    child starts the uplink on its own once SCO is ready.
+    """
+
+    RELEASE_TIMEOUT_SECONDS = 0.5
+    _STOP_TIMEOUT_SECONDS = 3
+    # Bounds how far sounds written by this process run ahead of the speaker.
+    _MAX_QUEUED_SECONDS = 0.06
+
+    def __init__(self, bt_device=None, device='plughw:Device,0', sample_rate=8000, channels=1, on_sco_ready=None, ring_bytes=8192, dsp_config=None, device_rate=None, wideband=False, warm_standby=False, latency_budget_ms=0):
+        self.bt_device = None
+        self.device = device
+        self.device_rate = device_rate
+        self.wideband = wideband
+        self.warm_standby = warm_standby
+        self.latency_budget_ms = latency_budget_ms
+        self.dsp_config = dsp_config
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.on_sco_ready = on_sco_ready
+        self.ring = SharedRing(capacity=ring_bytes)
+        self._lock = Lock()
+        self._stopped = Event()
+        self._process = None
+        self._conn = None
+        self.set_bt_device(bt_device)
+        self._spawn()
+
+    @property
+    def format(self):
+        return (self.channels, self.sample_rate, 2)
+
+    def set_bt_device(self, bt_device):
+        with self._lock:
+            self.bt_device = str(bt_device).strip() if bt_device else None
+
+    @property
+    def is_running(self):
+        with self._lock:
+            return self._process is not None and self._process.is_alive()
+
+    def _spawn(self):
+        # spawn rather than fork: the child must not inherit our threads' locks.
+        context = multiprocessing.get_context('spawn')
+        conn, child_conn = context.Pipe()
+        process = context.Process(
+            target=audio_process_main,
+            args=(child_conn, self.ring.name, {
+                'device': self.device,
+                'device_rate': self.device_rate,
+                'dsp': self.dsp_config,
+                'wideband': self.wideband,
+                'warm_standby': self.warm_standby,
+                'latency_budget_ms': self.latency_budget_ms,
+            }),
+            name='telefonoa-audio',
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        with self._lock:
+            old_conn = self._conn
+            self._process = process
+            self._conn = conn
+        if old_conn is not None:
+            # The dead child's pipe; its reader thread sees EOF or OSError.
+            old_conn.close()
+        Thread(target=self._read_events, args=(conn,), daemon=True).start()
+        print("[AUDIOPROC] Started audio process (pid %d)" % process.pid)
+
+    def _send(self, message):
+        with self._lock:
+            conn = self._conn
+        try:
+            conn.send(message)
+            return True
+        except (OSError, ValueError) as exc:
+            print("[AUDIOPROC] Cannot reach audio process (%s)" % exc)
+            return False
+
+    def _read_events(self, conn):
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = message[0]
+            if kind == 'sco_ready':
+                # Sounds written into the call must match its rate.
+                self.sample_rate = message[1]
+                if self.on_sco_ready is not None:
+                    self.on_sco_ready(message[1])
+                self._send(('released',))
+            elif kind == 'stopped':
+                self._stopped.set()
 
     def start(self):
-        if not self.capture_device:
-            print("[DOWNLINK] No Bluetooth device configured, not starting")
-            return
         with self._lock:
-            if self._thread is not None and self._thread.is_alive():
-                return
-            self._stop_event.clear()
-            self._thread = Thread(target=self._run, daemon=True)
-            thread = self._thread
-        print("[DOWNLINK] Starting Python ALSA bridge")
-        thread.start()
+            bt_device = self.bt_device
+        if not bt_device:
+            print("[AUDIOPROC] No Bluetooth device configured, not starting")
+            return
+        if not self.is_running:
+            print("[AUDIOPROC] Audio process died, restarting it")
+            self._spawn()
+        self._send(('start', bt_device))
+
+    def park(self):
+        """Park the uplink capture in the child (see UplinkBridge.park)."""
+        if self.warm_standby and self.is_running:
+            self._send(('park',))
+
+    def unpark(self):
+        if self.warm_standby and self.is_running:
+            self._send(('unpark',))
 
     def stop(self):
-        with self._lock:
-            thread = self._thread
-            self._stop_event.set()
-        if thread is not None and thread.is_alive():
-            thread.join(timeout=2)
-        if thread is not None and thread.is_alive():
-            print("[DOWNLINK] Bridge thread did not stop within timeout")
+        if not self.is_running:
             return
+        self._stopped.clear()
+        if self._send(('stop',)) and not self._stopped.wait(timeout=self._STOP_TIMEOUT_SECONDS):
+            print("[AUDIOPROC] Bridges did not stop within timeout")
+
+    def write(self, data):
+        """Queue speaker audio for the current call; returns bytes accepted."""
+        room = int(self.sample_rate * self._MAX_QUEUED_SECONDS) * self.channels * 2 - self.ring.readable
+        room -= room % (self.channels * 2)
+        if room <= 0:
+            return 0
+        return self.ring.write(memoryview(data)[:room])
+
+    def close(self):
         with self._lock:
-            if self._thread is thread:
-                self._thread = None
-        print("[DOWNLINK] Stopped Python ALSA bridge")
+            process = self._process
+        if process is not None and process.is_alive():
+            self._send(('shutdown',))
+            process.join(timeout=self._STOP_TIMEOUT_SECONDS)
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout=1)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+        self.ring.close()
+        self.ring.unlink()
 
-    def _create_pcm(self, pcm_type, device):
-        mode = alsaaudio.PCM_NONBLOCK if pcm_type == alsaaudio.PCM_CAPTURE else alsaaudio.PCM_NORMAL
-        return alsaaudio.PCM(
-            type=pcm_type,
-            mode=mode,
-            device=device,
-            channels=self.channels,
-            rate=self.sample_rate,
-            format=alsaaudio.PCM_FORMAT_S16_LE,
-            periodsize=self.period_frames,
-        )
 
-    def _wait_for_capture_ready(self):
-        while not self._stop_event.is_set():
-            capture = None
-            try:
-                capture = self._create_pcm(alsaaudio.PCM_CAPTURE, self.capture_device)
-                print("[DOWNLINK] BlueALSA capture ready")
-                return capture
-            except alsaaudio.ALSAAudioError:
-                if capture is not None:
-                    del capture
-                time.sleep(0.2)
-        return None
+def probe_concurrently(probe, keys, deadline, max_workers=8):
+    """Run ``probe(key)`` for all ``keys`` in a small thread pool.
 
-    def _run(self):
-        while not self._stop_event.is_set():
-            capture = self._wait_for_capture_ready()
-            if capture is None:
-                return
+    Returns {key: result} for the probes that finished within ``deadline``
+    seconds. Slower ones are left to finish in the background, so ``probe``
+    should give up by about ``deadline`` itself; probes that raised are
+    missing too.
+    """
+    results = {}
+    if not keys:
+        return results
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(keys)))
+    futures = {executor.submit(probe, key): key for key in keys}
+    done, pending = concurrent.futures.wait(futures, timeout=deadline)
+    for future in pending:
+        future.cancel()
+    executor.shutdown(wait=False)
+    for future in done:
+        try:
+            results[futures[future]] = future.result()
+        except Exception as exc:
+            print("[PROBE] %s failed: %s" % (futures[future], exc))
+    return results
 
-            if self.on_sco_ready is not None:
-                self.on_sco_ready()
 
-            playback = None
-            try:
-                playback = self._create_pcm(alsaaudio.PCM_PLAYBACK, self.playback_device)
-                while not self._stop_event.is_set():
-                    frames, data = capture.read()
-                    if frames <= 0 or not data:
-                        time.sleep(0.01)
-                        continue
-                    playback.write(data)
-            except alsaaudio.ALSAAudioError as exc:
-                print("[DOWNLINK] ALSA stream reset (%s), reconnecting..." % exc)
-                time.sleep(0.2)
-            finally:
-                if capture is not None:
-                    del capture
-                if playback is not None:
-                    del playback
-        with self._lock:
-            self._thread = None
+class DialFormatCache(object):
+    """Remembers the dial form and hide_id a modem accepted, per number class.
+
+    Entries are keyed by modem path (an HFP modem's path carries the phone's
+    address) and stored in ``path`` so they survive restarts. Only the
+    PhoneManager operations thread uses the cache.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._entries = {}
+        self._load()
+
+    def _load(self):
+        if self.path is None:
+            return
+        try:
+            with self.path.open('r') as stream:
+                loaded = yaml.safe_load(stream)
+        except FileNotFoundError:
+            return
+        except (OSError, yaml.YAMLError) as exc:
+            print("[DIAL] Cannot read dial formats %s: %s" % (self.path, exc))
+            return
+        if not isinstance(loaded, dict):
+            return
+        for key, classes in loaded.items():
+            if not isinstance(classes, dict):
+                continue
+            for number_class, entry in classes.items():
+                if isinstance(entry, dict) and 'transform' in entry:
+                    self._entries.setdefault(str(key), {})[str(number_class)] = {
+                        'transform': str(entry['transform']),
+                        'hide_id': str(entry.get('hide_id', 'default')),
+                        'requested_hide_id': str(entry.get('requested_hide_id', 'default')),
+                    }
+
+    def _save(self):
+        if self.path is None:
+            return
+        try:
+            with self.path.open('w') as stream:
+                yaml.safe_dump(self._entries, stream, default_flow_style=False)
+        except OSError as exc:
+            print("[DIAL] Cannot write dial formats %s: %s" % (self.path, exc))
+
+    def lookup(self, key, number_class, requested_hide_id):
+        """(transform, hide_id) learned for this modem and number class, or None."""
+        entry = self._entries.get(key, {}).get(number_class)
+        if entry is None or entry['requested_hide_id'] != requested_hide_id:
+            return None
+        return entry['transform'], entry['hide_id']
+
+    def learn(self, key, number_class, requested_hide_id, transform, hide_id):
+        entry = {
+            'transform': transform,
+            'hide_id': hide_id,
+            'requested_hide_id': requested_hide_id,
+        }
+        if self._entries.get(key, {}).get(number_class) == entry:
+            return
+        self._entries.setdefault(key, {})[number_class] = entry
+        print("[DIAL] Learned %s numbers on %s: %s, hide_id=%r" % (number_class, key, transform, hide_id))
+        self._save()
 
 
 class PhoneManager(object):
     POLL_INTERVAL_SECONDS = 0.5
+    # With oFono signals, GetCalls only double-checks the call table.
+    RECONCILE_INTERVAL_SECONDS = 30
     DBUS_TIMEOUT_SECONDS = 8
+    # All modems are probed at once; unanswered ones score below those that answered.
+    PROBE_DEADLINE_SECONDS = 2.0
 
-    def __init__(self, audio_player, asset_dir, announcements=None):
+    def __init__(self, audio_player, asset_dir, announcements=None, bus=None, signal_loop=None, dial_format_path=None):
         """
         The PhoneManager class manages the calls and the communication with the ofono service.
+
+        Call changes arrive as oFono signals through ``signal_loop`` (the
+        shared DBusSignalLoop on the system bus by default), or are polled
+        when there is none. A ``bus`` other than the system bus comes with
+        its own ``signal_loop``. The dial forms each modem accepted are kept
+        in ``dial_format_path`` (in memory only when None).
         """
         self.audio_player = audio_player
         self.asset_dir = Path(asset_dir)
         self.announcements = dict(DEFAULT_CONFIG['announcements'])
         if isinstance(announcements, dict):
             self.announcements.update(announcements)
-        self.bus = dbus.SystemBus()
+        self.bus = bus if bus is not None else dbus.SystemBus()
+        if bus is None and signal_loop is None:
+            signal_loop = DBusSignalLoop.shared()
+        self._signal_loop = signal_loop
+        # Call path -> State of the bound modem's calls, kept by the signals.
+        self._calls = {}
+        self._calls_cond = Condition()
+        self._calls_version = 0
+        # When the oldest signal not yet turned into callbacks arrived.
+        self._event_at = None
+        # Seconds from a call signal to its callbacks.
+        self.event_latencies = deque(maxlen=100)
+        self._signal_matches = []
+        # Seconds the last _bind_best_modem() took.
+        self.last_bind_seconds = None
+        # Dial, Answer and Hangup run here, in order, so callers (the GPIO
+        # hook callback among them) never wait on D-Bus.
+        self._operations = queue.Queue()
+        self._dial_pending = Event()
+        # Bumped by end_call(); a dial started before it gives up and its
+        # reply is ignored.
+        self._hangup_generation = 0
+        self._dial_formats = DialFormatCache(dial_format_path)
+        # Seconds from the first Dial attempt to the accepted one.
+        self.dial_latencies = deque(maxlen=100)
+        self._operations_thread = Thread(target=self._run_operations, name='ofono-operations', daemon=True)
+        self._operations_thread.start()
+        # The call callbacks start and stop the bridges; they run here, in
+        # order, so neither the operations nor the monitor thread waits on them.
+        self._callbacks = queue.Queue()
+        self._callbacks_thread = Thread(target=self._run_callbacks, name='phone-callbacks', daemon=True)
+        self._callbacks_thread.start()
+        self._devices_changed = False
+        self._device_cache = None
+        if self._signal_loop is not None:
+            self._device_cache = BluezDeviceCache.create(self._signal_loop, self._on_devices_changed)
         self.voice_call_manager = None
         self.modem_path = None
         self.bt_device_path = None
@@ -622,6 +3838,8 @@ class PhoneManager(object):
         self.on_incoming_call_changed = None
         self.on_call_started = None
         self.on_call_ended = None
+        # Called when call() ends without a call (rejected or failed Dial).
+        self.on_dial_failed = None
         self.on_device_availability_changed = None
         self._connected_device_present = False
         self.available = False
@@ -630,6 +3848,12 @@ class PhoneManager(object):
 
         self._manager = None
 
+        if self._signal_loop is not None:
+            # Before binding the modem, so no change slips in after its first GetCalls.
+            self._subscribe_call_signals()
+        else:
+            print("[OFONO] D-Bus signals unavailable, polling calls every %.1f s" % self.POLL_INTERVAL_SECONDS)
+
         try:
             self._manager = dbus.Interface(self.bus.get_object('org.ofono', '/'), 'org.ofono.Manager')
             modems = self._manager.GetModems()
@@ -648,7 +3872,8 @@ class PhoneManager(object):
             return
 
         self.available = True
-        has_call, has_incoming = self._get_call_info()
+        with self._calls_cond:
+            has_call, has_incoming = self._call_info(self._calls)
         self.call_in_progress = has_call
         self.incoming_call = has_incoming
         self._connected_device_present = self.has_paired_device(require_connected=True)
@@ -665,6 +3890,8 @@ class PhoneManager(object):
         return None
 
     def _list_bluez_devices(self):
+        if self._device_cache is not None:
+            return self._device_cache.devices()
         try:
             object_manager = dbus.Interface(
                 self.bus.get_object('org.bluez', '/'),
@@ -689,17 +3916,22 @@ class PhoneManager(object):
             })
         return devices
 
-    def _modem_supports_voice_calls(self, modem_path):
+    def _modem_supports_voice_calls(self, modem_path, timeout=None):
+        """True or False, or None when the modem did not answer within ``timeout``."""
         try:
             ofono_obj = self.bus.get_object('org.ofono', modem_path)
             voice_call_manager = dbus.Interface(ofono_obj, 'org.ofono.VoiceCallManager')
             # Probe a lightweight call. If the method is missing, this modem is stale.
-            voice_call_manager.GetCalls(timeout=self.DBUS_TIMEOUT_SECONDS)
+            voice_call_manager.GetCalls(timeout=timeout if timeout is not None else self.DBUS_TIMEOUT_SECONDS)
             return True
         except dbus.exceptions.DBusException as exc:
-            return exc.get_dbus_name() != 'org.freedesktop.DBus.Error.UnknownMethod'
+            name = exc.get_dbus_name()
+            if name == 'org.freedesktop.DBus.Error.NoReply':
+                return None
+            return name != 'org.freedesktop.DBus.Error.UnknownMethod'
 
     def _bind_best_modem(self, modems):
+        started = time.monotonic()
         bluez_devices = self._list_bluez_devices()
         connected_paths = {
             d['path'] for d in bluez_devices
@@ -713,13 +3945,20 @@ class PhoneManager(object):
         best = None
         best_score = None
 
-        for idx, (path, _) in enumerate(modems):
-            modem_path = str(path)
+        modem_paths = [str(path) for path, _ in modems]
+        # Probes past the deadline time out with it instead of holding the bus.
+        voice_support = probe_concurrently(
+            lambda path: self._modem_supports_voice_calls(path, timeout=self.PROBE_DEADLINE_SECONDS),
+            modem_paths,
+            self.PROBE_DEADLINE_SECONDS,
+        )
+        for idx, modem_path in enumerate(modem_paths):
             bt_path = self._modem_to_bt_path(modem_path)
-            supports_voice = self._modem_supports_voice_calls(modem_path)
+            # None: no answer before the deadline.
+            supports_voice = voice_support.get(modem_path)
             score = (
                 1 if bt_path in connected_paths else 0,
-                1 if supports_voice else 0,
+                {True: 2, None: 1, False: 0}[supports_voice],
                 1 if bt_path in paired_paths else 0,
                 -idx,
             )
@@ -738,9 +3977,20 @@ class PhoneManager(object):
 
         self.modem_path = best
         self.bt_device_path = self._modem_to_bt_path(best)
-        print("[OFONO] Selected modem %s" % self.modem_path)
+        self.last_bind_seconds = time.monotonic() - started
+        print("[OFONO] Selected modem %s in %.0f ms (%d of %d modems answered)" % (
+            self.modem_path,
+            self.last_bind_seconds * 1000,
+            len(voice_support),
+            len(modem_paths),
+        ))
         self.org_ofono_obj = self.bus.get_object('org.ofono', self.modem_path)
         self.voice_call_manager = dbus.Interface(self.org_ofono_obj, 'org.ofono.VoiceCallManager')
+        with self._calls_cond:
+            # Forget the calls of the previous modem.
+            self._calls = {}
+            self._calls_version += 1
+        self._reconcile_calls()
         return True
 
     def _rebind_modem(self):
@@ -755,6 +4005,20 @@ class PhoneManager(object):
             return False
         return self._bind_best_modem(modems)
 
+    def prepare_call(self):
+        """Queue a check that the bound modem still offers voice calls."""
+        self._submit('PrepareCall', self._check_call_modem)
+
+    def _check_call_modem(self):
+        """Check that the bound modem still offers voice calls, rebinding it if not."""
+        if not self.available:
+            return False
+        # A modem that is only slow to answer keeps its binding.
+        if self.modem_path and self._modem_supports_voice_calls(self.modem_path) is not False:
+            return True
+        print("[OFONO] Modem %s cannot place calls, refreshing modem binding..." % self.modem_path)
+        return self._rebind_modem()
+
     def _report_init_error(self, exc):
         name = exc.get_dbus_name()
         print("Cannot access ofono over D-Bus: %s" % name)
@@ -768,19 +4032,87 @@ class PhoneManager(object):
         filename = self.announcements.get(key, default_filename)
         return self.asset_dir / str(filename)
 
-    def _get_call_info(self):
-        """Returns (has_any_call, has_incoming_call)."""
+    @staticmethod
+    def _call_info(calls):
+        # A disconnected call is only waiting to be removed.
+        states = [state for state in calls.values() if state != 'disconnected']
+        return bool(states), 'incoming' in states
+
+    def _fetch_calls(self):
+        """Return {call path: state} from GetCalls; None if that fails."""
         if self.voice_call_manager is None:
-            return False, False
+            return {}
         try:
             calls = self.voice_call_manager.GetCalls(timeout=self.DBUS_TIMEOUT_SECONDS)
-            if not calls:
-                return False, False
-            states = {str(props.get('State', '')) for _, props in calls}
-            has_incoming = 'incoming' in states
-            return True, has_incoming
-        except dbus.exceptions.DBusException:
-            return False, False
+        except dbus.exceptions.DBusException as exc:
+            print("[OFONO] GetCalls failed, keeping the call table: %s" % exc)
+            return None
+        return {str(path): str(props.get('State', '')) for path, props in calls}
+
+    def _subscribe_call_signals(self):
+        bus = self._signal_loop.bus
+        for handler, name, interface in (
+                (self._on_call_added, 'CallAdded', 'org.ofono.VoiceCallManager'),
+                (self._on_call_removed, 'CallRemoved', 'org.ofono.VoiceCallManager'),
+                (self._on_call_property_changed, 'PropertyChanged', 'org.ofono.VoiceCall')):
+            self._signal_matches.append(bus.add_signal_receiver(
+                handler, name, interface, 'org.ofono', path_keyword='path'))
+
+    def _on_call_added(self, call_path, properties, path=None):
+        if str(path) == self.modem_path:
+            self._update_call(str(call_path), str(properties.get('State', '')))
+
+    def _on_call_removed(self, call_path, path=None):
+        if str(path) == self.modem_path:
+            self._update_call(str(call_path), None)
+
+    def _on_call_property_changed(self, name, value, path=None):
+        # Call objects live below their modem.
+        if str(name) == 'State' and self.modem_path and str(path).startswith(self.modem_path + '/'):
+            self._update_call(str(path), str(value))
+
+    def _update_call(self, call_path, state):
+        """Record a signalled call change and wake the monitor thread."""
+        with self._calls_cond:
+            if state is None:
+                self._calls.pop(call_path, None)
+            else:
+                self._calls[call_path] = state
+            self._calls_version += 1
+            if self._event_at is None:
+                self._event_at = time.monotonic()
+            self._calls_cond.notify_all()
+
+    def _reconcile_calls(self, report=False):
+        """Replace the call table with GetCalls, unless a signal changed it meanwhile.
+
+        A failed GetCalls leaves the table as it is; one timeout must not end
+        an active call.
+        """
+        with self._calls_cond:
+            version = self._calls_version
+        calls = self._fetch_calls()
+        with self._calls_cond:
+            if calls is None or self._calls_version != version:
+                return
+            if report and calls != self._calls:
+                print("[OFONO] Call table corrected by GetCalls: %s" % calls)
+            self._calls = calls
+
+    def _apply_calls(self):
+        """Fire the callbacks for the current call table."""
+        with self._calls_cond:
+            has_call, has_incoming = self._call_info(self._calls)
+            event_at = self._event_at
+            self._event_at = None
+        if has_call == self.call_in_progress and has_incoming == self.incoming_call:
+            return
+        if event_at is not None:
+            latency = time.monotonic() - event_at
+            self.event_latencies.append(latency)
+            print("[OFONO] Call signal handled after %.1f ms" % (latency * 1000))
+        self._set_call_state(has_call)
+        self._set_incoming_state(has_incoming)
 
     def _disconnect_bt_device(self):
         if not self.bt_device_path:
@@ -815,43 +4147,121 @@ class PhoneManager(object):
             call_iface.Hangup(timeout=self.DBUS_TIMEOUT_SECONDS)
 
     def _set_call_state(self, in_progress):
-        if in_progress == self.call_in_progress:
-            return
-        self.call_in_progress = in_progress
-        if in_progress:
-            print("Call in progress!")
-            if self.on_call_started is not None:
-                self.on_call_started()
-        else:
-            print("Call ended!")
-            if self.on_call_ended is not None:
-                self.on_call_ended()
+        # The monitor and the operations thread both report call changes.
+        with self._calls_cond:
+            if in_progress == self.call_in_progress:
+                return
+            self.call_in_progress = in_progress
+            if in_progress:
+                print("Call in progress!")
+                self._notify(self.on_call_started)
+            else:
+                print("Call ended!")
+                self._notify(self.on_call_ended)
 
     def _set_incoming_state(self, is_incoming):
-        if is_incoming == self.incoming_call:
-            return
-        self.incoming_call = is_incoming
-        if is_incoming:
-            print("Incoming call!")
-        else:
-            print("Incoming call ended or answered.")
-        if self.on_incoming_call_changed is not None:
-            self.on_incoming_call_changed(is_incoming)
+        with self._calls_cond:
+            if is_incoming == self.incoming_call:
+                return
+            self.incoming_call = is_incoming
+            if is_incoming:
+                print("Incoming call!")
+            else:
+                print("Incoming call ended or answered.")
+            self._notify(self.on_incoming_call_changed, is_incoming)
+
+    def _notify(self, callback, *args):
+        """Queue ``callback(*args)`` for the callbacks thread."""
+        if callback is not None:
+            self._callbacks.put((callback, args))
+
+    def _run_callbacks(self):
+        while True:
+            item = self._callbacks.get()
+            if item is None:
+                break
+            callback, args = item
+            try:
+                callback(*args)
+            except Exception as exc:
+                print("[OFONO] Callback %s raised: %s" % (getattr(callback, '__name__', callback), exc))
+
+    def _on_devices_changed(self, present):
+        # Runs in the signal loop; the monitor thread fires the callback.
+        with self._calls_cond:
+            self._devices_changed = True
+            self._calls_cond.notify_all()
 
     def _poll_device_availability(self):
         now_available = self.has_paired_device(require_connected=True)
         if now_available != self._connected_device_present:
             self._connected_device_present = now_available
             print("[BT] Device availability changed: %s" % now_available)
+            if self._device_cache is None:
+                for device in self._list_bluez_devices():
+                    log_bluez_device(device)
             if self.on_device_availability_changed is not None:
                 self.on_device_availability_changed(now_available)
 
     def _monitor_calls(self):
-        while not self._stop_event.wait(self.POLL_INTERVAL_SECONDS):
-            has_call, has_incoming = self._get_call_info()
-            self._set_call_state(has_call)
-            self._set_incoming_state(has_incoming)
-            self._poll_device_availability()
+        # Without signals, calls are polled; without the device cache, devices are.
+        poll_calls = self._signal_loop is None
+        poll_devices = self._device_cache is None
+        now = time.monotonic()
+        next_poll = now + self.POLL_INTERVAL_SECONDS
+        next_reconcile = now + self.RECONCILE_INTERVAL_SECONDS
+        while not self._stop_event.is_set():
+            deadline = next_poll if poll_calls or poll_devices else next_reconcile
+            with self._calls_cond:
+                if self._event_at is None and not self._devices_changed:
+                    self._calls_cond.wait(max(0.0, deadline - time.monotonic()))
+                devices_changed = self._devices_changed
+                self._devices_changed = False
+            if self._stop_event.is_set():
+                break
+            now = time.monotonic()
+            poll_due = (poll_calls or poll_devices) and now >= next_poll
+            if poll_due:
+                next_poll = now + self.POLL_INTERVAL_SECONDS
+            if (poll_calls and poll_due) or now >= next_reconcile:
+                self._reconcile_calls(report=not poll_calls)
+                next_reconcile = now + self.RECONCILE_INTERVAL_SECONDS
+            self._apply_calls()
+            if (poll_devices and poll_due) or devices_changed:
+                self._poll_device_availability()
+
+    def _submit(self, name, operation, on_reply=None, on_error=None):
+        """Queue a D-Bus ``operation`` for the operations thread and return at once.
+
+        ``on_reply(result)`` or ``on_error(exc)`` runs on that thread when it
+        completes; without ``on_error`` a DBusException is only logged.
+        """
+        self._operations.put((name, operation, on_reply, on_error, time.monotonic()))
+
+    def _run_operations(self):
+        while True:
+            item = self._operations.get()
+            if item is None:
+                break
+            name, operation, on_reply, on_error, submitted_at = item
+            started = time.monotonic()
+            try:
+                result = operation()
+            except dbus.exceptions.DBusException as exc:
+                if on_error is None:
+                    print("[OFONO] %s failed: %s" % (name, exc))
+                else:
+                    on_error(exc)
+            except Exception as exc:
+                print("[OFONO] %s raised: %s" % (name, exc))
+            else:
+                if on_reply is not None:
+                    on_reply(result)
+            print("[OFONO] %s done in %.0f ms (queued %.0f ms)" % (
+                name,
+                (time.monotonic() - started) * 1000,
+                (started - submitted_at) * 1000,
+            ))
 
     def end_call(self):
         """
@@ -859,40 +4269,57 @@ class PhoneManager(object):
         """
         if not self.available or self.voice_call_manager is None:
             return
-        try:
-            self._hangup_all_calls()
-            self._set_call_state(False)
-            self._set_incoming_state(False)
-        except dbus.exceptions.DBusException as exc:
-            name = exc.get_dbus_name()
-            # oFono may transiently reject hangup while another call operation is active.
-            # Treat this as non-fatal so the main runtime loop keeps running.
-            if name == 'org.ofono.Error.InProgress':
-                print("Hangup in progress, keeping service alive")
-                self._disconnect_bt_device()
-                return
-            if name == 'org.freedesktop.DBus.Error.NoReply':
-                print("Hangup timed out, forcing HFP reconnect")
-                self._disconnect_bt_device()
-                return
-            print("Failed to hang up call: %s" % exc)
+        self._hangup_generation += 1
+        self._submit('Hangup', self._hangup_all_calls, self._on_hangup_reply, self._on_hangup_error)
+
+    def _on_hangup_reply(self, result):
+        self._set_call_state(False)
+        self._set_incoming_state(False)
+
+    def _on_hangup_error(self, exc):
+        name = exc.get_dbus_name()
+        # oFono may transiently reject hangup while another call operation is active.
+        # Treat this as non-fatal so the main runtime loop keeps running.
+        if name == 'org.ofono.Error.InProgress':
+            print("Hangup in progress, keeping service alive")
+            self._disconnect_bt_device()
+            return
+        if name == 'org.freedesktop.DBus.Error.NoReply':
+            print("Hangup timed out, forcing HFP reconnect")
+            self._disconnect_bt_device()
+            return
+        print("Failed to hang up call: %s" % exc)
 
     def answer_call(self):
         """Answer an incoming call."""
         if not self.available or self.voice_call_manager is None:
             return
-        try:
+        self._submit(
+            'Answer',
+            self._answer_incoming_call,
+            self._on_answer_reply,
+            lambda exc: print("Failed to answer call: %s" % exc),
+        )
+
+    def _answer_incoming_call(self):
+        """Answer the first incoming call; False if there is none."""
+        if self._signal_loop is not None:
+            with self._calls_cond:
+                paths = [path for path, state in self._calls.items() if state == 'incoming']
+        else:
             calls = self.voice_call_manager.GetCalls(timeout=self.DBUS_TIMEOUT_SECONDS)
-            for path, props in calls:
-                if str(props.get('State', '')) == 'incoming':
-                    call_obj = self.bus.get_object('org.ofono', path)
-                    call_iface = dbus.Interface(call_obj, 'org.ofono.VoiceCall')
-                    call_iface.Answer(timeout=self.DBUS_TIMEOUT_SECONDS)
-                    self._set_call_state(True)
-                    self._set_incoming_state(False)
-                    return
-        except dbus.exceptions.DBusException as e:
-            print("Failed to answer call: %s" % e)
+            paths = [path for path, props in calls if str(props.get('State', '')) == 'incoming']
+        for path in paths:
+            call_obj = self.bus.get_object('org.ofono', path)
+            call_iface = dbus.Interface(call_obj, 'org.ofono.VoiceCall')
+            call_iface.Answer(timeout=self.DBUS_TIMEOUT_SECONDS)
+            return True
+        return False
+
+    def _on_answer_reply(self, answered):
+        if answered:
+            self._set_call_state(True)
+            self._set_incoming_state(False)
 
     def _normalize_number(self, number):
         # Keep only digits and one optional leading plus for oFono dial.
@@ -913,6 +4340,8 @@ class PhoneManager(object):
         BlueZ directly for any connected+paired device. This handles device
         switches where oFono's cached path may not match the active device.
         """
+        if self._device_cache is not None:
+            return self._device_cache.connected_address(self.bt_device_path)
         # Try modem-associated device first
         if self.bt_device_path:
             try:
@@ -949,65 +4378,142 @@ class PhoneManager(object):
         
         return None
 
+    @staticmethod
+    def _number_class(normalized_number):
+        if normalized_number.startswith('+'):
+            return 'plus'
+        if normalized_number.startswith('00'):
+            return 'international'
+        if normalized_number.startswith('0'):
+            return 'national'
+        return 'local'
+
     def _dial_candidates(self, normalized_number):
-        candidates = [normalized_number]
+        """(transform, number) pairs to try, the number as dialed first."""
+        candidates = [('as_dialed', normalized_number)]
         if normalized_number.startswith('+'):
             national = normalized_number[1:]
-            candidates.append(national)
-            candidates.append('00' + national)
+            candidates.append(('drop_plus', national))
+            candidates.append(('plus_to_00', '00' + national))
         elif normalized_number.startswith('00') and len(normalized_number) > 2:
-            candidates.append('+' + normalized_number[2:])
+            candidates.append(('00_to_plus', '+' + normalized_number[2:]))
 
         # Preserve order while dropping duplicates/empty values.
         unique = []
-        for candidate in candidates:
-            if candidate and candidate not in unique:
-                unique.append(candidate)
+        for transform, candidate in candidates:
+            if candidate and candidate not in [number for _, number in unique]:
+                unique.append((transform, candidate))
         return unique
 
+    def _dial_forms(self, normalized_number, number_class, hide_id):
+        """(transform, number, hide_id) triples to try, the learned one first."""
+        hide_id_candidates = [hide_id, 'default', '']
+        hide_id_candidates = [h for i, h in enumerate(hide_id_candidates) if h not in hide_id_candidates[:i]]
+        forms = [
+            (transform, candidate, hide_id_option)
+            for transform, candidate in self._dial_candidates(normalized_number)
+            for hide_id_option in hide_id_candidates
+        ]
+        learned = self._dial_formats.lookup(self.modem_path, number_class, hide_id)
+        for index, form in enumerate(forms):
+            if (form[0], form[2]) == learned:
+                forms.insert(0, forms.pop(index))
+                break
+        return forms
+
     def call(self, number, hide_id='default'):
         """
         Method to place call. It handles incorrectly dialed numbers thanks to ofono exceptions
+
+        Returns at once; the number is dialed on the operations thread.
         """
         if not self.available or self.voice_call_manager is None:
             print("Call system not available")
             self.audio_player.play(self._announcement_path('not_connected', 'not_connected.wav'))
+            self._dial_failed()
             return
 
         normalized_number = self._normalize_number(number)
         if not normalized_number:
             print("Invalid dialed number format!")
             self.audio_player.play(self._announcement_path('format_incorrect', 'format_incorrect.wav'))
+            self._dial_failed()
             return
 
-        candidates = self._dial_candidates(normalized_number)
-        hide_id_candidates = [hide_id, 'default', '']
-        hide_id_candidates = [h for i, h in enumerate(hide_id_candidates) if h not in hide_id_candidates[:i]]
+        if self._dial_pending.is_set():
+            print("A number is already being dialed, ignoring %s" % normalized_number)
+            return
+        self._dial_pending.set()
+        generation = self._hangup_generation
+        self._submit(
+            'Dial',
+            lambda: self._dial(normalized_number, hide_id, generation),
+            lambda dialed: self._on_dial_reply(dialed, generation),
+            lambda exc: self._dial_failed(),
+        )
+
+    def _dial_failed(self):
+        self._notify(self.on_dial_failed)
+
+    def _on_dial_reply(self, dialed, generation):
+        if not dialed:
+            self._dial_failed()
+            return
+        if generation != self._hangup_generation:
+            # The queued hangup ends this call; the handset is already down.
+            print("[DIAL] Dial accepted after the hangup request, not starting the call")
+            return
+        self._set_call_state(True)
+
+    def _dial(self, normalized_number, hide_id, generation):
+        """Try the number's dial forms until oFono accepts one; True once dialed."""
+        try:
+            return self._try_dial_forms(normalized_number, hide_id, generation)
+        finally:
+            self._dial_pending.clear()
+
+    def _try_dial_forms(self, normalized_number, hide_id, generation):
+        number_class = self._number_class(normalized_number)
+        started = time.monotonic()
+        attempts = 0
 
         last_error = None
         for attempt in range(2):
             try:
-                for candidate in candidates:
-                    for hide_id_option in hide_id_candidates:
-                        try:
-                            print("Dialing via oFono modem=%s: %s (hide_id=%r)" % (
-                                self.modem_path,
-                                candidate,
-                                hide_id_option,
-                            ))
-                            self.voice_call_manager.Dial(
-                                candidate,
-                                hide_id_option,
-                                timeout=self.DBUS_TIMEOUT_SECONDS,
-                            )
-                            self._set_call_state(True)
-                            return
-                        except dbus.exceptions.DBusException as e:
-                            if e.get_dbus_name() != 'org.ofono.Error.InvalidFormat':
-                                raise
+                # Built per attempt: a rebind may select another modem.
+                for transform, candidate, hide_id_option in self._dial_forms(normalized_number, number_class, hide_id):
+                    if generation != self._hangup_generation:
+                        print("[DIAL] Hangup requested, giving up dialing %s" % normalized_number)
+                        return False
+                    try:
+                        print("Dialing via oFono modem=%s: %s (hide_id=%r)" % (
+                            self.modem_path,
+                            candidate,
+                            hide_id_option,
+                        ))
+                        attempts += 1
+                        self.voice_call_manager.Dial(
+                            candidate,
+                            hide_id_option,
+                            timeout=self.DBUS_TIMEOUT_SECONDS,
+                        )
+                    except dbus.exceptions.DBusException as e:
+                        if e.get_dbus_name() != 'org.ofono.Error.InvalidFormat':
+                            raise
+                        continue
+                    elapsed = time.monotonic() - started
+                    self.dial_latencies.append(elapsed)
+                    print("[DIAL] Dial accepted after %d attempt%s in %.0f ms (%s)" % (
+                        attempts,
+                        '' if attempts == 1 else 's',
+                        elapsed * 1000,
+                        transform,
+                    ))
+                    self._dial_formats.learn(self.modem_path, number_class, hide_id, transform, hide_id_option)
+                    return True
                 print("Invalid dialed number format!")
                 self.audio_player.play(self._announcement_path('format_incorrect', 'format_incorrect.wav'))
-                return
+                return False
             except dbus.exceptions.DBusException as e:
                 last_error = e
                 if e.get_dbus_name() == 'org.freedesktop.DBus.Error.UnknownMethod' and attempt == 0:
@@ -1017,30 +4523,47 @@ class PhoneManager(object):
                 break
 
         if last_error is None:
-            return
+            return False
         name = last_error.get_dbus_name()
         if name == 'org.freedesktop.DBus.Error.UnknownMethod':
             print("Ofono not running")
             self.audio_player.play(self._announcement_path('not_connected', 'not_connected.wav'))
         else:
             print(name)
+        return False
 
     def close(self):
+        for match in self._signal_matches:
+            match.remove()
+        self._signal_matches = []
+        # Let a queued hangup reach oFono before the process exits.
+        self._operations.put(None)
+        self._operations_thread.join(timeout=self.DBUS_TIMEOUT_SECONDS)
+        self._callbacks.put(None)
+        self._callbacks_thread.join(timeout=1)
         if not self.available:
             return
         self._stop_event.set()
+        with self._calls_cond:
+            self._calls_cond.notify_all()
         if self._monitor_thread.is_alive():
             self._monitor_thread.join(timeout=1)
 
+    @property
+    def connected_device_present(self):
+        """Last known device availability; answers without asking BlueZ."""
+        return self._connected_device_present
+
     def has_paired_device(self, require_connected=True):
         """Return True when at least one usable BlueZ device is present."""
+        if self._device_cache is not None:
+            return self._device_cache.has_usable(require_connected)
         try:
             object_manager = dbus.Interface(
                 self.bus.get_object('org.bluez', '/'),
                 'org.freedesktop.DBus.ObjectManager',
             )
             managed_objects = object_manager.GetManagedObjects()
-            found = False
             for path, ifaces in managed_objects.items():
                 device = ifaces.get('org.bluez.Device1')
                 if not device:
@@ -1049,42 +4572,76 @@ class PhoneManager(object):
                 paired = bool(device.get('Paired', False))
                 connected = bool(device.get('Connected', False))
                 blocked = bool(device.get('Blocked', False))
-                alias = str(device.get('Alias', 'unknown'))
-                address = str(device.get('Address', path))
-                print("[BT] Device %s (%s): paired=%s connected=%s blocked=%s" % (
-                    alias,
-                    address,
-                    paired,
-                    connected,
-                    blocked,
-                ))
-
                 if not paired or blocked:
                     continue
                 if require_connected and not connected:
                     continue
-
-                found = True
-                break
-
-            print("[BT] Usable device present=%s (require_connected=%s, modem_path=%s)" % (
-                found,
-                require_connected,
-                self.modem_path,
-            ))
-            return found
+                return True
+            return False
         except dbus.exceptions.DBusException as exc:
             print("Cannot query BlueZ paired devices: %s" % exc)
             return False
 
 
+class CallPrewarm(object):
+    """Speculative call setup started while the user is still dialing.
+
+    Runs the named setup steps in a background thread. The results are picked
+    up when the call starts; the time between the first digit and the call
+    start is setup work that no longer delays Dial and the SCO bridges.
+    """
+
+    def __init__(self, steps):
+        self._steps = list(steps)
+        self.results = {}
+        self.durations = {}
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_event = Event()
+        self._done_event = Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        return self._done_event.wait(timeout)
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def saved_seconds(self, consumed_at):
+        """Setup time taken off the call path if the call started at ``consumed_at``."""
+        if self.started_at is None:
+            return 0.0
+        finished_at = self.finished_at if self.finished_at is not None else consumed_at
+        return max(0.0, min(finished_at, consumed_at) - self.started_at)
+
+    def _run(self):
+        for name, step in self._steps:
+            if self._cancel_event.is_set():
+                break
+            step_started = time.monotonic()
+            try:
+                self.results[name] = step()
+            except Exception as exc:
+                print("[PREWARM] Step %s failed: %s" % (name, exc))
+                self.results[name] = None
+            self.durations[name] = time.monotonic() - step_started
+        self.finished_at = time.monotonic()
+        self._done_event.set()
+
+
 class Telephone(object):
     """
     Main Telephone class containing everything required for the Bluetooth telephone to work.
     """
     def __init__(self, num_pin, receiver_pin, config=None, phonebook=None):
-        GPIO.setmode(GPIO.BCM)
         config = config or {}
+        self.gpio = create_gpio_backend(config.get('gpio'))
+        print("[GPIO] Using %s backend" % self.gpio.name)
         self.asset_dir = Path(__file__).resolve().parent
         self.receiver_pin = receiver_pin
         configured_pins = config.get('pins', {}) if isinstance(config.get('pins', {}), dict) else {}
@@ -1092,29 +4649,80 @@ class Telephone(object):
         call_config = config.get('call', {}) if isinstance(config.get('call', {}), dict) else {}
         actions_config = config.get('actions', {}) if isinstance(config.get('actions', {}), dict) else {}
         configured_announcements = config.get('announcements', {}) if isinstance(config.get('announcements', {}), dict) else {}
+        audio_config = config.get('audio', {}) if isinstance(config.get('audio', {}), dict) else {}
+        self.tones = config.get('tones', {}) if isinstance(config.get('tones', {}), dict) else {}
 
         self.ringer_pin = int(configured_pins.get('ringer', DEFAULT_CONFIG['pins']['ringer']))
-        GPIO.setup(self.receiver_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.setup(self.ringer_pin, GPIO.OUT, initial=GPIO.HIGH)
+        self.gpio.setup_input(self.receiver_pin)
+        self.gpio.setup_output(self.ringer_pin, initial=self.gpio.HIGH)
         self.number_q = queue.Queue()
         self.announcements = dict(DEFAULT_CONFIG['announcements'])
         self.announcements.update(configured_announcements)
         self._wifi_disable_during_call = bool(call_config.get('disable_wifi_during_call', True))
         self._ringer_test_number = int(actions_config.get('ringer_test_number', DEFAULT_CONFIG['actions']['ringer_test_number']))
         self._shutdown_number = int(actions_config.get('shutdown_number', DEFAULT_CONFIG['actions']['shutdown_number']))
-        self.audio_player = AudioPlayer()
-        self.phone_manager = PhoneManager(self.audio_player, self.asset_dir, announcements=self.announcements)
+        self.prompt_cache = PromptCache(int(audio_config.get('prompt_cache_bytes', DEFAULT_CONFIG['audio']['prompt_cache_bytes'])))
+        self.prompt_cache.preload(self.asset_dir / str(filename) for filename in self.announcements.values())
+        self.audio_player = AudioPlayer(
+            period_ms=int(audio_config.get('period_ms', DEFAULT_CONFIG['audio']['period_ms'])),
+            periods=int(audio_config.get('periods', DEFAULT_CONFIG['audio']['periods'])),
+            prompt_cache=self.prompt_cache,
+            device_rate=int(audio_config.get('device_rate', DEFAULT_CONFIG['audio']['device_rate'])),
+        )
+        self.phone_manager = PhoneManager(
+            self.audio_player,
+            self.asset_dir,
+            announcements=self.announcements,
+            dial_format_path=self.asset_dir / str(call_config.get('dial_format_file', DEFAULT_CONFIG['call']['dial_format_file'])),
+        )
         modem_bt_device = self.phone_manager.get_bt_device_address()
         if modem_bt_device:
             print("[BT] Using Bluetooth device %s" % modem_bt_device)
         else:
             print("[BT] No connected paired Bluetooth device found yet")
-        self.uplink_bridge = UplinkBridge(bt_device=modem_bt_device, capture_device='plughw:Device,0')
-        self.downlink_bridge = DownlinkBridge(
-            bt_device=modem_bt_device,
-            playback_device='plughw:Device,0',
-            on_sco_ready=self._on_sco_ready,
-        )
+        self.uplink_bridge = None
+        self.downlink_bridge = None
+        self.audio_process = None
+        self._dsp_config = config.get('dsp')
+        audio_device = str(audio_config.get('device', DEFAULT_CONFIG['audio']['device']))
+        device_rate = int(audio_config.get('device_rate', DEFAULT_CONFIG['audio']['device_rate']))
+        wideband = bool(call_config.get('wideband', DEFAULT_CONFIG['call']['wideband']))
+        warm_standby = bool(audio_config.get('uplink_warm_standby', DEFAULT_CONFIG['audio']['uplink_warm_standby']))
+        latency_budget_ms = float(call_config.get('latency_budget_ms', DEFAULT_CONFIG['call']['latency_budget_ms']))
+        if audio_config.get('process', DEFAULT_CONFIG['audio']['process']):
+            self.audio_process = AudioProcess(
+                bt_device=modem_bt_device,
+                device=audio_device,
+                device_rate=device_rate,
+                on_sco_ready=self._on_sco_ready,
+                dsp_config=self._dsp_config,
+                wideband=wideband,
+                warm_standby=warm_standby,
+                latency_budget_ms=latency_budget_ms,
+            )
+        else:
+            budget = latency_budget_options(latency_budget_ms)
+            sco_tracker = ScoReadiness.create()
+            sco_format_probe = None
+            if wideband:
+                sco_format_probe = sco_tracker.sco_format if sco_tracker is not None else query_bluealsa_sco_format
+            self.uplink_bridge = UplinkBridge(
+                bt_device=modem_bt_device,
+                capture_device=audio_device,
+                device_rate=device_rate,
+                sco_tracker=sco_tracker,
+                warm_standby=warm_standby,
+                **budget
+            )
+            self.downlink_bridge = DownlinkBridge(
+                bt_device=modem_bt_device,
+                playback_device=audio_device,
+                on_sco_ready=self._on_sco_ready,
+                device_rate=device_rate,
+                sco_format_probe=sco_format_probe,
+                sco_tracker=sco_tracker,
+                **budget
+            )
         self._ring_stop_event = Event()
         self._ring_lock = Lock()
         self._ringer_io_lock = Lock()
@@ -1123,24 +4731,40 @@ class Telephone(object):
         self.phone_manager.on_incoming_call_changed = self._on_incoming_call_changed
         self.phone_manager.on_call_started = self._on_call_started
         self.phone_manager.on_call_ended = self._on_call_ended
+        self.phone_manager.on_dial_failed = self._on_dial_failed
         self.phone_manager.on_device_availability_changed = self._on_device_availability_changed
         self.rotary_dial = RotaryDial(
             num_pin,
             self.number_q,
             pulse_threshold=float(rotary_config.get('pulse_threshold_seconds', DEFAULT_CONFIG['rotary']['pulse_threshold_seconds'])),
             debounce_seconds=float(rotary_config.get('debounce_seconds', DEFAULT_CONFIG['rotary']['debounce_seconds'])),
+            adaptive=bool(rotary_config.get('adaptive', DEFAULT_CONFIG['rotary']['adaptive'])),
+            calibration_path=self.asset_dir / str(rotary_config.get('calibration_file', DEFAULT_CONFIG['rotary']['calibration_file'])),
+            gpio=self.gpio,
         )
         self.finish = False
         self._last_receiver_raw_state = None
         self.receiver_down = self._is_receiver_down()
         self._manual_number = ''
         self._last_digit_at = None
+        # Numbers matching the dial plan are placed immediately; the pause is
+        # only used when the dialed digits are still ambiguous.
+        self.dial_plan = DialPlan(call_config.get('dial_plan') or [])
+        self._dial_plan_state = DialPlan.START
         self._dial_complete_pause = 5.0
+        self._shortcut_confirm_default = float(actions_config.get(
+            'shortcut_confirm_seconds',
+            DEFAULT_CONFIG['actions']['shortcut_confirm_seconds'],
+        ))
+        self._pending_shortcut = None
+        self._pending_shortcut_lock = Lock()
         self._min_lifted_digits_to_call = 3
         self._lifted_queue_timeout = 0.2
         self._wifi_iface = 'wlan0'
         self._wifi_restore_needed = False
         self._wifi_lock = Lock()
+        self._prewarm = None
+        self._prewarm_lock = Lock()
 
         # Fast dial entries are loaded externally from the merged config file.
         self.phonebook = phonebook if isinstance(phonebook, list) else []
@@ -1151,12 +4775,9 @@ class Telephone(object):
         self._apply_receiver_state()
         self._receiver_event_detect = False
         self._queue_timeout = 5
+        self.gpio.remove_edge_callback(self.receiver_pin)
         try:
-            GPIO.remove_event_detect(self.receiver_pin)
-        except RuntimeError:
-            pass
-        try:
-            GPIO.add_event_detect(self.receiver_pin, GPIO.BOTH, callback=self.receiver_changed, bouncetime=10)
+            self.gpio.add_edge_callback(self.receiver_pin, 'both', self.receiver_changed, 10)
             self._receiver_event_detect = True
         except RuntimeError as exc:
             print("Receiver GPIO event detect unavailable on pin %d, using polling (%s)" % (self.receiver_pin, exc))
@@ -1169,8 +4790,8 @@ class Telephone(object):
         self.start_file(self.asset_dir / str(self.announcements.get('ready', 'ready.wav')))
 
     def _is_receiver_down(self):
-        raw_state = GPIO.input(self.receiver_pin)
-        is_down = raw_state == GPIO.HIGH
+        raw_state = self.gpio.input(self.receiver_pin)
+        is_down = raw_state == self.gpio.HIGH
         if raw_state != self._last_receiver_raw_state:
             print("[HOOK] Read pin %d: raw=%d -> receiver_%s" % (
                 self.receiver_pin,
@@ -1183,12 +4804,51 @@ class Telephone(object):
     def _clear_manual_dial_state(self):
         self._manual_number = ''
         self._last_digit_at = None
+        self._dial_plan_state = DialPlan.START
 
-    def _on_sco_ready(self):
+    def _on_sco_ready(self, sample_rate=8000):
         """Called by the downlink bridge once the SCO link is confirmed active."""
-        self.audio_player.stop()
+        self.audio_player.stop(release=True)
+        if self.audio_process is not None:
+            # The audio process starts the uplink itself; our sounds go to the call.
+            self.audio_player.set_sink(self.audio_process)
+            return
+        prepare_call_chain(self.uplink_bridge, self.downlink_bridge, self._dsp_config, sample_rate)
         self.uplink_bridge.start()
 
+    def _set_bridge_bt_device(self, bt_device):
+        if self.audio_process is not None:
+            self.audio_process.set_bt_device(bt_device)
+            return
+        self.uplink_bridge.set_bt_device(bt_device)
+        self.downlink_bridge.set_bt_device(bt_device)
+
+    def _start_call_audio(self):
+        if self.audio_process is not None:
+            self.audio_process.start()
+        else:
+            self.downlink_bridge.start()
+
+    def _park_uplink(self):
+        if self.audio_process is not None:
+            self.audio_process.park()
+        else:
+            self.uplink_bridge.park()
+
+    def _unpark_uplink(self):
+        if self.audio_process is not None:
+            self.audio_process.unpark()
+        else:
+            self.uplink_bridge.unpark()
+
+    def _stop_call_audio(self):
+        self.audio_player.set_sink(None)
+        if self.audio_process is not None:
+            self.audio_process.stop()
+            return
+        self.uplink_bridge.stop()
+        self.downlink_bridge.stop()
+
     def _refresh_bridge_bt_device(self):
         """Refresh bridge device before starting a call.
         
@@ -1200,11 +4860,64 @@ class Telephone(object):
         if not modem_bt_device:
             print("[BT] Cannot refresh bridge device: no connected paired device available")
             return False
-        self.uplink_bridge.set_bt_device(modem_bt_device)
-        self.downlink_bridge.set_bt_device(modem_bt_device)
+        self._set_bridge_bt_device(modem_bt_device)
         print("[BT] Bridge device refreshed to %s" % modem_bt_device)
         return True
 
+    def _start_prewarm(self):
+        """Start resolving the call path in the background on the first dialed digit."""
+        with self._prewarm_lock:
+            if self._prewarm is not None:
+                return
+            # Wi-Fi stays up until a call really starts (_on_call_started).
+            self._prewarm = CallPrewarm([('bt_device', self._prewarm_bt_device)])
+            prewarm = self._prewarm
+        print("[PREWARM] Preparing call path while dialing")
+        prewarm.start()
+        # Queued ahead of the Dial, on the thread that owns the modem binding.
+        self.phone_manager.prepare_call()
+        # Parks again after a failed dial released the capture.
+        self._park_uplink()
+
+    def _take_prewarm(self):
+        with self._prewarm_lock:
+            prewarm = self._prewarm
+            self._prewarm = None
+        return prewarm
+
+    def _cancel_prewarm(self):
+        prewarm = self._take_prewarm()
+        if prewarm is not None:
+            print("[PREWARM] Cancelled")
+            prewarm.cancel()
+
+    def _prewarm_bt_device(self):
+        modem_bt_device = self.phone_manager.get_bt_device_address()
+        if modem_bt_device:
+            self._set_bridge_bt_device(modem_bt_device)
+        return modem_bt_device
+
+    def _on_dial_failed(self):
+        """A dial ended without a call: the next one starts from scratch."""
+        self._cancel_prewarm()
+        self._unpark_uplink()
+
+    def _use_prewarm(self):
+        """Adopt the pre-warmed call path. Returns True if the bridge device is set."""
+        prewarm = self._take_prewarm()
+        if prewarm is None:
+            return False
+        consumed_at = time.monotonic()
+        # Call audio must not wait on a slow lookup; the caller refreshes instead.
+        if not prewarm.wait(timeout=0):
+            print("[PREWARM] Call path still being prepared, refreshing it directly")
+            return False
+        print("[PREWARM] Call path ready, saved %.0f ms of call setup (%s)" % (
+            prewarm.saved_seconds(consumed_at) * 1000,
+            ', '.join('%s=%.0fms' % (name, seconds * 1000) for name, seconds in prewarm.durations.items()),
+        ))
+        return bool(prewarm.results.get('bt_device'))
+
     def _on_call_started(self):
         """Called when a call becomes active. Start only the downlink bridge.
 
@@ -1213,15 +4926,15 @@ class Telephone(object):
         point causes arecord to buffer audio data against a not-yet-active SCO
         channel, resulting in several seconds of delay at call start.
         """
-        self._refresh_bridge_bt_device()
+        if not self._use_prewarm():
+            self._refresh_bridge_bt_device()
         if self._wifi_disable_during_call:
             self._disable_wifi_for_call()
-        self.downlink_bridge.start()
+        self._start_call_audio()
 
     def _on_call_ended(self):
         """Called when an active call ends. Stop the SCO audio bridges."""
-        self.uplink_bridge.stop()
-        self.downlink_bridge.stop()
+        self._stop_call_audio()
         if self._wifi_disable_during_call:
             self._restore_wifi_after_call()
         if not self.receiver_down:
@@ -1285,12 +4998,18 @@ class Telephone(object):
         if is_available:
             print("[BT] Device connected while receiver up, switching to dial tone")
             self.start_dial_tone()
+            self._park_uplink()
         else:
             print("[BT] Device disconnected while receiver up, switching to busy tone")
+            self._unpark_uplink()
             self.start_busy_tone()
+            # Say why over the busy tone.
+            self.audio_player.play(self.asset_dir / str(self.announcements.get('not_connected', 'not_connected.wav')), mix=True)
 
     def _on_incoming_call_changed(self, is_incoming):
         """Called from the PhoneManager monitor thread when incoming call state changes."""
+        if is_incoming:
+            self._cancel_pending_shortcut("incoming call")
         if self._ringer_test_active.is_set():
             return
         if is_incoming and self.receiver_down:
@@ -1329,8 +5048,8 @@ class Telephone(object):
     def _apply_receiver_state(self):
         print("[HOOK] Applying state: receiver_%s" % ('down' if self.receiver_down else 'up'))
         if self.receiver_down:
-            self.uplink_bridge.stop()
-            self.downlink_bridge.stop()
+            self._cancel_prewarm()
+            self._stop_call_audio()
             self._clear_manual_dial_state()
             self._stop_ringing()
             # Always attempt hangup when placing the handset down. Relying on
@@ -1338,15 +5057,19 @@ class Telephone(object):
             self.phone_manager.end_call()
             self.stop_file()
             return
+        self._cancel_pending_shortcut("receiver lifted")
         self._stop_ringing()
         if self.phone_manager.incoming_call:
+            # SCO follows the answer right away; have the microphone ready.
+            self._park_uplink()
             self.phone_manager.answer_call()
             return
         if self.phone_manager.call_in_progress:
             # A call was placed while the receiver was down (shortcut dial).
             # Bridges are already running via on_call_started; nothing more to do.
             return
-        has_paired_device = self.phone_manager.has_paired_device(require_connected=True)
+        # Kept by the monitor thread; asking BlueZ here would block the GPIO callback.
+        has_paired_device = self.phone_manager.connected_device_present
         if not self.phone_manager.available or not has_paired_device:
             print("System not available for dialing (ofono_available=%s, paired_and_connected_device=%s)" % (
                 self.phone_manager.available,
@@ -1355,13 +5078,16 @@ class Telephone(object):
             self.start_busy_tone()
             return
         self.start_dial_tone()
+        self._park_uplink()
 
-    def receiver_changed(self, pin_num):
+    def receiver_changed(self, pin_num, timestamp=None):
         """
         Event triggered when the receiver is hung of lifted.
         :param pin_num: GPIO pin triggering the event (Can only be self.receiver_pin here)
+        :param timestamp: CLOCK_MONOTONIC time of the edge (unused, state is re-read)
         :return:
         """
+        del timestamp
         print("[HOOK] GPIO callback on pin %d" % pin_num)
         new_state = self._is_receiver_down()
         if new_state == self.receiver_down:
@@ -1384,13 +5110,19 @@ class Telephone(object):
         """
         self.audio_player.play(filename, loop=loop)
 
+    def _play_configured_tone(self, name):
+        tone = self.tones.get(name, DEFAULT_CONFIG['tones'][name])
+        if not isinstance(tone, dict):
+            tone = DEFAULT_CONFIG['tones'][name]
+        self.audio_player.play_tone(tone.get('frequencies') or [450], tone.get('cadence') or ())
+
     def start_busy_tone(self):
-        # Besetztton cadence: 450 Hz, 125 ms ON / 375 ms OFF.
-        self.audio_player.play_tone_pattern(frequency_hz=450.0, on_ms=125, off_ms=375)
+        # Besetztton cadence by default: 450 Hz, 125 ms ON / 375 ms OFF.
+        self._play_configured_tone('busy')
 
     def start_dial_tone(self):
-        # Dial tone: continuous 450 Hz.
-        self.audio_player.play_tone_pattern(frequency_hz=450.0, on_ms=100, off_ms=0)
+        # Dial tone: continuous 450 Hz by default.
+        self._play_configured_tone('dial')
 
     def stop_file(self):
         self.audio_player.stop()
@@ -1398,7 +5130,7 @@ class Telephone(object):
     def _set_ringer(self, enabled):
         # This relay/generator is active-low: LOW rings, HIGH is silent.
         with self._ringer_io_lock:
-            GPIO.output(self.ringer_pin, GPIO.LOW if enabled else GPIO.HIGH)
+            self.gpio.output(self.ringer_pin, self.gpio.LOW if enabled else self.gpio.HIGH)
 
     def ringer_test(self):
         print("Ringer test: start")
@@ -1416,6 +5148,50 @@ class Telephone(object):
             self._set_ringer(False)
         print("Ringer test: done")
 
+    def _shortcut_confirm_seconds(self, entry):
+        try:
+            return max(0.0, float(entry.get('confirm_seconds', self._shortcut_confirm_default)))
+        except (TypeError, ValueError):
+            return self._shortcut_confirm_default
+
+    def _schedule_shortcut(self, number, delay):
+        """Dial ``number`` after ``delay`` seconds unless cancelled or replaced first."""
+        with self._pending_shortcut_lock:
+            self._pending_shortcut = (number, time.monotonic() + delay)
+        print("Shortcut dial of %s in %.1f s" % (number, delay))
+
+    def _cancel_pending_shortcut(self, reason):
+        with self._pending_shortcut_lock:
+            pending = self._pending_shortcut
+            self._pending_shortcut = None
+        if pending is not None:
+            print("Shortcut dial of %s cancelled (%s)" % (pending[0], reason))
+
+    def _hooked_queue_timeout(self):
+        """Wait for digits no longer than the pending shortcut's confirm window."""
+        with self._pending_shortcut_lock:
+            pending = self._pending_shortcut
+        if pending is None:
+            return self._queue_timeout
+        return min(self._queue_timeout, max(0.0, pending[1] - time.monotonic()))
+
+    def _dial_due_shortcut(self):
+        with self._pending_shortcut_lock:
+            pending = self._pending_shortcut
+            if pending is None or time.monotonic() < pending[1]:
+                return
+            self._pending_shortcut = None
+        if self.phone_manager.call_in_progress or self.phone_manager.incoming_call:
+            print("Call already active/incoming, dropping shortcut dial of %s" % pending[0])
+            return
+        self.phone_manager.call(pending[0])
+
+    def _place_manual_call(self):
+        print("Dialing: %s" % self._manual_number)
+        self.stop_file()
+        self.phone_manager.call(self._manual_number)
+        self._clear_manual_dial_state()
+
     def dialing_handler(self):
         """
         Main function of the telephone that handles the dialing if the receiver is lifted or hooked.
@@ -1435,8 +5211,15 @@ class Telephone(object):
             if not self.receiver_down:  # Handling of the dialing when the receiver is lifted
                 try:
                     c = self.number_q.get(timeout=self._lifted_queue_timeout)
+                    if not self._manual_number:
+                        self._start_prewarm()
                     self._manual_number += str(c)
                     self._last_digit_at = time.monotonic()
+                    self._dial_plan_state = self.dial_plan.advance(self._dial_plan_state, c)
+                    if self.dial_plan.is_complete(self._dial_plan_state):
+                        print("Dial plan match: %s" % self._manual_number)
+                        self._place_manual_call()
+                        continue
                 except queue.Empty:
                     pass
 
@@ -1445,18 +5228,17 @@ class Telephone(object):
                     if len(self._manual_number) < self._min_lifted_digits_to_call:
                         continue
                     if time.monotonic() - self._last_digit_at >= self._dial_complete_pause:
-                        print("Dialing: %s" % self._manual_number)
-                        self.stop_file()
-                        self.phone_manager.call(self._manual_number)
-                        self._clear_manual_dial_state()
+                        self._place_manual_call()
 
             else:  # Handling of the dialing when the receiver is down
                 self._clear_manual_dial_state()
                 if self.audio_player.is_playing:
                     self.stop_file()
+                self._dial_due_shortcut()
                 try:
-                    c = self.number_q.get(timeout=self._queue_timeout)
+                    c = self.number_q.get(timeout=self._hooked_queue_timeout())
                     print("Selected %d" % c)
+                    self._cancel_pending_shortcut("digit %d dialed" % c)
                     if c == self._shutdown_number:
                         print("Turning system off")
                         self.start_file(self.asset_dir / str(self.announcements.get('turnoff', 'turnoff.wav')))
@@ -1476,15 +5258,16 @@ class Telephone(object):
                             self.start_file(self.asset_dir / str(self.announcements.get('format_incorrect', 'format_incorrect.wav')))
                             continue
                         print(shortcut_number)
-                        time.sleep(4)
-                        self.phone_manager.call(shortcut_number)
+                        self._schedule_shortcut(shortcut_number, self._shortcut_confirm_seconds(self.phonebook[c - 1]))
                 except queue.Empty:
                     pass
 
     def close(self):
         self.finish = True
-        self.uplink_bridge.stop()
-        self.downlink_bridge.stop()
+        self._cancel_prewarm()
+        self._stop_call_audio()
+        if self.audio_process is not None:
+            self.audio_process.close()
         if self._wifi_disable_during_call:
             self._restore_wifi_after_call()
         self._stop_ringing()
@@ -1495,7 +5278,7 @@ class Telephone(object):
         self.phone_manager.close()
         self.audio_player.close()
         # Do not cleanup ringer_pin so it stays HIGH (silent) after process exit.
-        GPIO.cleanup((self.receiver_pin, self.rotary_dial.pin))
+        self.gpio.cleanup((self.receiver_pin, self.rotary_dial.pin))
 
 
 if __name__ == '__main__':